@@ -0,0 +1,14 @@
+"""Standalone performance benchmarks for the Django analytics backend.
+
+Run from ``apps/django-backend`` as ``python -m benchmarks.<name>``.
+"""
+
+import os
+
+
+def setup_django(settings_module="django_overthinglytics.settings"):
+    """Configure Django so benchmarks can use models, serializers and views."""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", settings_module)
+    import django
+
+    django.setup()
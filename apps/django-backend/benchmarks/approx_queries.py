@@ -0,0 +1,133 @@
+"""Exact vs accuracy=approx answers on a large synthetic TrafficDaily.
+
+Creates a temporary SQLite database from the Prisma migration and fills
+TrafficDaily with ``--rows`` synthetic rows, one every 30 seconds (10M rows
+is about 9.5 years). It builds the reservoir sample once, then runs the same
+specs both exactly and approximately. Reported per spec:
+
+* the time for each path
+* the worst relative error
+* coverage: the share of buckets whose exact value falls inside the
+  reported 95% interval
+
+    python -m benchmarks.approx_queries [--rows 10000000] [--sample 10000]
+"""
+
+import argparse
+import math
+import random
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from . import setup_django
+
+START_MS = 1_420_070_400_000  # 2015-01-01
+STEP_MS = 30_000
+
+SPECS = (
+    {"metrics": ["visits"], "granularity": "quarter", "aggregate": "sum"},
+    {"metrics": ["visits"], "granularity": "month", "aggregate": "avg"},
+    {"metrics": ["visits"], "granularity": "quarter", "aggregate": "p95"},
+    {
+        "metrics": ["sessions"],
+        "granularity": "week",
+        "aggregate": "sum",
+        "start": "2020-01-01",
+        "end": "2020-12-31",
+    },
+)
+
+
+def build_database(path, rows):
+    from django_backend.testing import apply_migrations
+
+    connection = sqlite3.connect(path)
+    apply_migrations(connection)
+    rng = random.Random(0)
+
+    def generate():
+        for i in range(rows):
+            seasonal = 1 + 0.3 * math.sin(i / 20_000)
+            visits = int(rng.lognormvariate(5, 0.6) * seasonal)
+            yield START_MS + i * STEP_MS, visits, int(visits * 0.8)
+
+    connection.execute("PRAGMA journal_mode=OFF")
+    connection.execute("PRAGMA synchronous=OFF")
+    connection.executemany(
+        'INSERT INTO "TrafficDaily" (date, visits, sessions) VALUES (?, ?, ?)',
+        generate(),
+    )
+    connection.commit()
+    connection.close()
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--sample", type=int, default=10_000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connections
+    from django.test import override_settings
+
+    from django_backend.dates import get_calendar
+    from django_backend.query import parse_spec, run_query
+    from django_backend.sampling import samples
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "analytics.db"
+        seconds, _ = timed(lambda: build_database(db_path, args.rows))
+        print(f"built {args.rows:,} rows in {seconds:.1f}s")
+        connections["analytics"].settings_dict["NAME"] = db_path
+
+        with override_settings(
+            ANALYTICS_STATE_DIR=tmp,
+            ANALYTICS_SAMPLE_SIZE=args.sample,
+            ANALYTICS_QUERY_ROW_BUDGET=args.rows,
+        ):
+            seconds, reservoir = timed(lambda: samples.get("traffic"))
+            print(
+                f"sampled {len(reservoir.rows):,} of {reservoir.seen:,} rows "
+                f"in {seconds:.1f}s (one-off; incremental afterwards)"
+            )
+            calendar = get_calendar("UTC")
+            print(
+                f"{'spec':<34} {'exact s':>8} {'approx s':>9} "
+                f"{'speedup':>8} {'max rel err':>12} {'coverage':>9}"
+            )
+            for raw in SPECS:
+                exact_spec = parse_spec(raw)
+                approx_spec = parse_spec({**raw, "accuracy": "approx"})
+                exact_s, exact = timed(lambda s=exact_spec: run_query(s, calendar))
+                approx_s, approx = timed(lambda s=approx_spec: run_query(s, calendar))
+                metric = raw["metrics"][0]
+                truth = {point["period"]: point[metric] for point in exact}
+                errors, covered = [], 0
+                for point in approx:
+                    actual = truth.get(point["period"])
+                    if not actual:
+                        continue
+                    miss = abs(point[metric] - actual)
+                    errors.append(miss / abs(actual))
+                    covered += miss <= point[f"{metric}_error"]
+                label = f"{raw['aggregate']}({metric}) by {raw['granularity']}"
+                if "start" in raw:
+                    label += " (1y)"
+                print(
+                    f"{label:<34} {exact_s:>8.2f} {approx_s:>9.3f} "
+                    f"{exact_s / approx_s:>7.0f}x {max(errors, default=0):>11.2%} "
+                    f"{covered / max(len(approx), 1):>9.0%}"
+                )
+
+
+if __name__ == "__main__":
+    main()
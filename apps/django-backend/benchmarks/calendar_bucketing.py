@@ -0,0 +1,68 @@
+"""Day labels and buckets: per-row strftime vs the cached calendar.
+
+Generates timestamps spread over ~10 years and times three ways of turning
+each into a day label or bucket key:
+
+* ``strftime``: ``datetime.fromtimestamp(ts / 1000, tz).strftime(...)`` per row
+* ``label``: ``Calendar.label`` (integer day math plus a per-day cache)
+* ``bucket``: ``Calendar.bucket`` for each granularity
+
+    python -m benchmarks.calendar_bucketing [--rows 1000000] [--tz Europe/Berlin]
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime
+from functools import partial
+
+from . import setup_django
+
+START_MS = 1_420_070_400_000  # 2015-01-01
+SPAN_MS = 10 * 365 * 86_400_000
+
+
+def bucket_key(calendar, ts, granularity):
+    return calendar.bucket(ts, granularity)
+
+
+def timed(func, timestamps):
+    """Return (seconds, number of distinct results)."""
+    start = time.perf_counter()
+    results = [func(ts) for ts in timestamps]
+    return time.perf_counter() - start, len(set(results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--tz", action="append", dest="zones")
+    args = parser.parse_args()
+
+    setup_django()
+    from django_backend.dates import GRANULARITIES, Calendar
+
+    rng = random.Random(0)
+    timestamps = [START_MS + rng.randrange(SPAN_MS) for _ in range(args.rows)]
+    print(f"{args.rows:,} timestamps over 10 years")
+    print(f"{'timezone':<20} {'method':<16} {'seconds':>8} {'ns/row':>8} {'keys':>7}")
+    for tz_name in args.zones or ["UTC", "Europe/Berlin"]:
+        calendar = Calendar(tz_name)
+        tz = calendar.tz
+
+        def strftime(ts, tz=tz):
+            local = datetime.fromtimestamp(ts / 1000, tz)
+            return f"{local:%b} {local.day}"
+
+        cases = [("strftime", strftime), ("label", calendar.label)]
+        for granularity in GRANULARITIES:
+            bucket = partial(bucket_key, calendar, granularity=granularity)
+            cases.append((f"bucket:{granularity}", bucket))
+        for name, func in cases:
+            seconds, keys = timed(func, timestamps)
+            ns = seconds / args.rows * 1e9
+            print(f"{tz_name:<20} {name:<16} {seconds:>8.3f} {ns:>8.0f} {keys:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""ORM compile overhead vs the managers' compiled statements.
+
+Builds a synthetic analytics database of ``--days`` daily rows and calls the
+hot manager reads ``--calls`` times each, cycling the limit through 1-60 as
+the dashboard does. Each query is timed four ways:
+
+* orm: the method's ORM queryset, built, compiled and executed per call
+  (the read path before compiled statements)
+* compile: building and compiling that queryset only, without executing it
+* compiled: the manager method, executing its cached statement
+* cursor: the cached SQL on a bare cursor with ``fetchall()``, as a floor
+
+    python -m benchmarks.compiled_sql [--calls 5000] [--days 365]
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from . import setup_django
+
+
+def per_call(call, limits):
+    start = time.perf_counter()
+    for limit in limits:
+        call(limit)
+    return (time.perf_counter() - start) / len(limits)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=5_000)
+    parser.add_argument("--days", type=int, default=365)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connections
+
+    from django_backend.models import (
+        DeviceShare,
+        KpiSnapshot,
+        RevenueDaily,
+        SignupByChannel,
+        TrafficDaily,
+    )
+    from django_backend.testing import Dataset, build_template
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "analytics.db"
+        build_template(db_path, Dataset(days=args.days, snapshots=60))
+        connections["analytics"].settings_dict["NAME"] = db_path
+        connection = connections["analytics"]
+
+        queries = {
+            "TrafficDaily.newest": (TrafficDaily.objects.newest, True),
+            "RevenueDaily.newest_columns": (
+                RevenueDaily.objects.newest_columns,
+                True,
+            ),
+            "DeviceShare.trend": (DeviceShare.objects.trend, True),
+            "KpiSnapshot.latest": (KpiSnapshot.objects.latest, False),
+            "SignupByChannel.latest_month": (
+                SignupByChannel.objects.latest_month,
+                False,
+            ),
+        }
+        limits = [i % 60 + 1 for i in range(args.calls)]
+        print(
+            f"{'query':<30} {'orm us':>8} {'compile us':>11} "
+            f"{'compiled us':>12} {'cursor us':>10} {'speedup':>8}"
+        )
+        for name, (query, limited) in queries.items():
+
+            def args_of(limit, limited=limited):
+                return (limit,) if limited else ()
+
+            statement = query.statement(1 if limited else 0)
+
+            def cursor_call(limit, statement=statement, args_of=args_of):
+                params = list(statement.params)
+                for position, value in zip(
+                    statement.limits, args_of(limit), strict=True
+                ):
+                    params[position] = value
+                with connection.cursor() as cursor:
+                    cursor.execute(statement.sql, params)
+                    return cursor.fetchall()
+
+            modes = {
+                "orm": lambda n, q=query, a=args_of: list(q.queryset(*a(n))),
+                "compile": lambda n, q=query, a=args_of: (
+                    q.queryset(*a(n)).query.get_compiler("analytics").as_sql()
+                ),
+                "compiled": lambda n, q=query, a=args_of: q(*a(n)),
+                "cursor": cursor_call,
+            }
+            for call in modes.values():
+                call(1)  # warm up the connection and statement cache
+            us = {mode: per_call(call, limits) * 1e6 for mode, call in modes.items()}
+            print(
+                f"{name:<30} {us['orm']:>8.1f} {us['compile']:>11.1f} "
+                f"{us['compiled']:>12.1f} {us['cursor']:>10.1f} "
+                f"{us['orm'] / us['compiled']:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""CPU per request: GZipMiddleware on every response vs precompressed cache.
+
+Runs each endpoint through the full view stack with a RequestFactory against
+the configured analytics database and reports process CPU time per request
+and bytes on the wire for three modes:
+
+* ``gzip-mw``: render and gzip on every request (GZipMiddleware, no cache)
+* ``miss``: cache miss, render once and precompress every variant
+* ``hit``: served from the precompressed cache
+
+    python -m benchmarks.compression [--requests 500] [--encoding br]
+"""
+
+import argparse
+import sys
+import time
+from functools import partial
+
+from . import setup_django
+
+ENDPOINTS = (
+    "/analytics/kpis/",
+    "/analytics/traffic/?limit=60",
+    "/analytics/revenue/?limit=60",
+    "/analytics/signups/trend/?months=60",
+    "/analytics/device-share/trend/?snapshots=60",
+)
+
+
+def cpu_per_request(handler, requests, prepare=None):
+    """Return (CPU microseconds per request, bytes of the last response)."""
+    size = 0
+    start = time.process_time()
+    for _ in range(requests):
+        if prepare:
+            prepare()
+        response = handler()
+        size = len(response.content)
+    return (time.process_time() - start) / requests * 1e6, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--encoding", default="gzip")
+    args = parser.parse_args()
+
+    setup_django()
+    from django.middleware.gzip import GZipMiddleware
+    from django.test import RequestFactory, override_settings
+    from django.urls import resolve
+
+    from django_backend.caching import COMPRESSORS, response_cache
+
+    factory = RequestFactory()
+    accept = {"HTTP_ACCEPT_ENCODING": args.encoding}
+    print(f"compressors available: {', '.join(COMPRESSORS)}")
+    print(f"{'endpoint':<45} {'mode':>8} {'us/req':>10} {'bytes':>8}")
+    for path in ENDPOINTS:
+        view = resolve(path.split("?")[0]).func
+
+        def handle(request, view=view):
+            return view(request).render()
+
+        def call(handler=handle, path=path):
+            return handler(factory.get(path, **accept))
+
+        gzip_mw = GZipMiddleware(handle)
+        with override_settings(ANALYTICS_COMPRESSION_MIN_BYTES=sys.maxsize):
+            rows = [
+                (
+                    "gzip-mw",
+                    cpu_per_request(
+                        partial(call, gzip_mw), args.requests, response_cache.clear
+                    ),
+                )
+            ]
+        rows.append(
+            ("miss", cpu_per_request(call, args.requests, response_cache.clear))
+        )
+        rows.append(("hit", cpu_per_request(call, args.requests)))
+        for mode, (micros, size) in rows:
+            print(f"{path:<45} {mode:>8} {micros:>10.1f} {size:>8,}")
+
+
+if __name__ == "__main__":
+    main()
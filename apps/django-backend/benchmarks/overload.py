@@ -0,0 +1,170 @@
+"""Latency under overload, with and without admission control.
+
+Builds a synthetic analytics database of ``--days`` daily rows, then runs
+``--clients`` threads for ``--seconds`` each, every thread a separate client
+address issuing /analytics/query requests back to back. The specs are
+drawn from ``--distinct`` daily roll-ups over 3-10 year ranges, so most
+requests miss the response cache and query the database. The same load runs
+twice: with every limit disabled, then with the limits from the command
+line. Reported per run:
+
+* throughput and how requests were answered (fresh, stale, 429, 503)
+* p50/p99/max latency of all requests, and of those answered fresh
+
+Without admission every request is queued on the GIL and the database, so
+p99 grows with the number of clients. With it, excess requests are shed at
+once and queued misses give up after the queue timeout, so p99 stays near
+the queue timeout plus one query.
+
+    python -m benchmarks.overload [--clients 32] [--seconds 10]
+"""
+
+import argparse
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+from pathlib import Path
+
+from . import setup_django
+
+FIRST_DAY = date(2024, 1, 5)  # testing.START_MS
+
+
+def percentile(latencies, q):
+    if not latencies:
+        return float("nan")
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def make_urls(count, days, seed=0):
+    rng = random.Random(seed)
+    urls = []
+    for _ in range(count):
+        span = rng.randint(3 * 365, 10 * 365)
+        start = FIRST_DAY + timedelta(days=rng.randint(0, max(0, days - span)))
+        end = start + timedelta(days=span - 1)
+        urls.append(
+            "/analytics/query/?metrics=visits,sessions&granularity=day"
+            f"&start={start}&end={end}"
+        )
+    return urls
+
+
+def run_load(urls, clients, seconds):
+    from django.db import connections
+    from django.test import Client
+
+    outcomes = Counter()
+    latencies, fresh = [], []
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def client_loop(n):
+        client = Client(REMOTE_ADDR=f"10.0.{n // 250}.{n % 250 + 1}")
+        rng = random.Random(n)
+        local, local_fresh, local_outcomes = [], [], Counter()
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            response = client.get(rng.choice(urls))
+            elapsed = time.perf_counter() - start
+            local.append(elapsed)
+            if response.status_code != 200:
+                local_outcomes[str(response.status_code)] += 1
+            elif response.has_header("X-Analytics-Stale"):
+                local_outcomes["stale"] += 1
+            else:
+                local_outcomes["fresh"] += 1
+                local_fresh.append(elapsed)
+        connections.close_all()
+        with lock:
+            latencies.extend(local)
+            fresh.extend(local_fresh)
+            outcomes.update(local_outcomes)
+
+    threads = [threading.Thread(target=client_loop, args=(n,)) for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes, latencies, fresh
+
+
+def report(label, seconds, outcomes, latencies, fresh):
+    total = sum(outcomes.values())
+    answers = ", ".join(
+        f"{name} {outcomes[name]}" for name in ("fresh", "stale", "429", "503")
+    )
+    print(f"{label}: {total / seconds:.0f} req/s ({answers})")
+    for name, values in (("all", latencies), ("fresh", fresh)):
+        print(
+            f"  {name:<6} p50 {percentile(values, 0.5) * 1000:7.1f} ms"
+            f"  p99 {percentile(values, 0.99) * 1000:7.1f} ms"
+            f"  max {max(values, default=float('nan')) * 1000:7.1f} ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=20 * 365)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--distinct", type=int, default=2_000)
+    parser.add_argument("--client-rate", type=float, nargs=2, default=(5, 10))
+    parser.add_argument("--global-rate", type=float, nargs=2, default=(50, 100))
+    parser.add_argument("--max-queries", type=int, default=4)
+    parser.add_argument("--queue-timeout", type=float, default=0.25)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connections
+    from django.test import override_settings
+
+    from django_backend.admission import admission
+    from django_backend.caching import response_cache
+    from django_backend.testing import Dataset, build_template
+
+    urls = make_urls(args.distinct, args.days)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "analytics.db"
+        build_template(db_path, Dataset(days=args.days))
+        connections["analytics"].settings_dict["NAME"] = db_path
+        runs = (
+            (
+                "admission off",
+                {
+                    "ANALYTICS_RATE_LIMIT_PER_CLIENT": None,
+                    "ANALYTICS_RATE_LIMIT_GLOBAL": None,
+                    "ANALYTICS_MAX_CONCURRENT_QUERIES": None,
+                },
+            ),
+            (
+                "admission on",
+                {
+                    "ANALYTICS_RATE_LIMIT_PER_CLIENT": tuple(args.client_rate),
+                    "ANALYTICS_RATE_LIMIT_GLOBAL": tuple(args.global_rate),
+                    "ANALYTICS_MAX_CONCURRENT_QUERIES": args.max_queries,
+                    "ANALYTICS_QUERY_QUEUE_TIMEOUT": args.queue_timeout,
+                },
+            ),
+        )
+        print(
+            f"{args.clients} clients x {args.seconds:g}s, {args.days:,} days, "
+            f"{args.distinct:,} distinct queries"
+        )
+        for label, limits in runs:
+            with override_settings(
+                DEBUG=False, ALLOWED_HOSTS=["*"], ANALYTICS_STATE_DIR=tmp, **limits
+            ):
+                admission.reset()
+                response_cache.clear()
+                result = run_load(urls, args.clients, args.seconds)
+                report(label, args.seconds, *result)
+                print(f"  {admission.stats()['shed']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""Contract parity and load across the Django, Kotlin and Next.js backends.
+
+The dashboard can read ``/analytics/*`` from any of three backends (see
+``BackendSwitcher``). This harness starts the Django backend on a free local
+port against a seeded Prisma database (``--db``, default ``prisma/dev.db``;
+``--seed-days N`` builds a synthetic one instead), with admission limits off.
+It then checks whichever other backends answer at their configured base
+URLs. Backends that are not running are skipped.
+
+1. Parity: every distinct path of the request mix is fetched once from each
+   backend, and each JSON body is diffed against the first backend's
+   (Django). Differing values, missing keys and length mismatches are listed
+   by JSON path.
+2. Load: the mix is replayed ``--requests`` times by ``--concurrency``
+   threads against each backend in turn. Throughput, p50/p90/p99/max latency
+   and errors are reported side by side.
+
+The mix defaults to a dashboard load (the five widget requests) plus other
+``limit`` values of the contract. ``--mix FILE`` replays a recording
+instead: one request per line, either a bare path or an access-log line such
+as runserver's ``"GET /analytics/kpis/ HTTP/1.1" 200``. Paths are written
+in contract form (``/analytics/kpis``); Django gets them with the trailing
+slash its URLconf uses.
+
+The other backends must read the same database for their bodies to match.
+
+    python -m benchmarks.parity [--backend kotlin=http://localhost:8080]
+        [--requests 2000] [--concurrency 8] [--mix requests.log]
+"""
+
+import argparse
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from pathlib import Path
+from typing import NamedTuple
+
+from .overload import percentile
+
+APP_DIR = Path(__file__).resolve().parent.parent
+PRISMA_DB = APP_DIR.parent.parent / "prisma" / "dev.db"
+
+DASHBOARD = (
+    "/analytics/kpis",
+    "/analytics/traffic?limit=10",
+    "/analytics/signups",
+    "/analytics/revenue?limit=10",
+    "/analytics/device-share",
+)
+DEFAULT_MIX = DASHBOARD * 4 + tuple(
+    f"/analytics/{name}?limit={limit}"
+    for name in ("traffic", "revenue")
+    for limit in (1, 7, 30, 60)
+)
+# Base URLs from the frontend's lib/config.ts fallbacks.
+DEFAULT_BACKENDS = {
+    "kotlin": "http://localhost:8080",
+    "next": "http://localhost:3000/api",
+}
+MAX_DIFFS = 10  # differences listed per path
+
+# Runs the Django backend with the harness's database and no rate limits.
+SERVER = """
+import sys
+from django_overthinglytics.wsgi import application
+from django.conf import settings
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.db import connections
+from django_backend.admission import admission
+
+port, db, state_dir = int(sys.argv[1]), sys.argv[2], sys.argv[3]
+settings.DEBUG = False
+settings.ALLOWED_HOSTS = ["127.0.0.1"]
+settings.ANALYTICS_STATE_DIR = state_dir
+settings.ANALYTICS_RATE_LIMIT_PER_CLIENT = None
+settings.ANALYTICS_RATE_LIMIT_GLOBAL = None
+settings.ANALYTICS_MAX_CONCURRENT_QUERIES = None
+connections["analytics"].settings_dict["NAME"] = db
+admission.reset()
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+server = ThreadedWSGIServer(("127.0.0.1", port), QuietHandler)
+server.daemon_threads = True
+server.set_app(application)
+server.serve_forever()
+"""
+
+
+class Backend(NamedTuple):
+    name: str
+    base_url: str
+    trailing_slash: bool = False  # Django's URLconf ends paths with "/"
+
+    def url(self, path):
+        if self.trailing_slash:
+            route, sep, query = path.partition("?")
+            path = f"{route.rstrip('/')}/{sep}{query}"
+        return f"{self.base_url.rstrip('/')}{path}"
+
+
+class Result(NamedTuple):
+    status: int  # 0 if the request failed
+    body: bytes
+    seconds: float
+
+
+def fetch(url, timeout=10.0):
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            status, body = response.status, response.read()
+    except urllib.error.HTTPError as error:
+        status, body = error.code, error.read()
+    except (OSError, urllib.error.URLError):
+        status, body = 0, b""
+    return Result(status, body, time.perf_counter() - start)
+
+
+def read_mix(path):
+    """Contract paths from a recording, one request per line."""
+    paths = []
+    for line in Path(path).read_text().splitlines():
+        match = re.search(r"(/analytics/[^\s\"]*)", line)
+        if match and not line.lstrip().startswith("#"):
+            route, sep, query = match.group(1).partition("?")
+            paths.append(f"{route.rstrip('/')}{sep}{query}")
+    return paths
+
+
+def diff_json(expected, actual, path="$"):
+    """Yield ``"path: difference"`` for each mismatch between two bodies."""
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        for key in expected.keys() | actual.keys():
+            child = f"{path}.{key}"
+            if key not in actual:
+                yield f"{child}: missing"
+            elif key not in expected:
+                yield f"{child}: unexpected"
+            else:
+                yield from diff_json(expected[key], actual[key], child)
+    elif isinstance(expected, list) and isinstance(actual, list):
+        if len(expected) != len(actual):
+            yield f"{path}: {len(expected)} items != {len(actual)}"
+        for i, (left, right) in enumerate(zip(expected, actual, strict=False)):
+            yield from diff_json(left, right, f"{path}[{i}]")
+    elif expected != actual or type(expected) is not type(actual):
+        # 1 and 1.0 differ on the wire, and clients may care.
+        yield f"{path}: {expected!r} != {actual!r}"
+
+
+def parity(reference, backend, paths):
+    """``{path: [differences]}`` for paths whose bodies differ."""
+    report = {}
+    for path in paths:
+        want, got = fetch(reference.url(path)), fetch(backend.url(path))
+        if want.status != got.status:
+            report[path] = [f"status {want.status} != {got.status}"]
+            continue
+        try:
+            diffs = list(diff_json(json.loads(want.body), json.loads(got.body)))
+        except ValueError:
+            diffs = [] if want.body == got.body else ["body is not JSON"]
+        if diffs:
+            report[path] = sorted(diffs)
+    return report
+
+
+def replay(backend, mix, requests, concurrency):
+    """``(seconds, latencies, Counter of statuses)`` for one backend."""
+    latencies, statuses = [], Counter()
+    lock = threading.Lock()
+    # Every thread takes the next request of the mix, in order.
+    counter = iter(range(requests))
+
+    def worker():
+        local, local_statuses = [], Counter()
+        for i in counter:
+            result = fetch(backend.url(mix[i % len(mix)]))
+            local.append(result.seconds)
+            local_statuses[result.status] += 1
+        with lock:
+            latencies.extend(local)
+            statuses.update(local_statuses)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, latencies, statuses
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_django(db, state_dir, settings_module, log):
+    """Start the Django backend; return ``(process, Backend)`` once it serves."""
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-c", SERVER, str(port), str(db), str(state_dir)],
+        cwd=APP_DIR,
+        env={**os.environ, "DJANGO_SETTINGS_MODULE": settings_module},
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    backend = Backend("django", f"http://127.0.0.1:{port}", trailing_slash=True)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline and process.poll() is None:
+        if fetch(backend.url(DASHBOARD[0]), timeout=1).status:
+            return process, backend
+        time.sleep(0.2)
+    process.kill()
+    log.seek(0)
+    raise SystemExit(f"Django did not start:\n{log.read().decode()[-2000:]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--backend",
+        action="append",
+        default=[],
+        metavar="NAME=URL",
+        help="Base URL of another backend (default: kotlin and next on "
+        "their local ports). Repeatable.",
+    )
+    parser.add_argument("--db", type=Path, default=PRISMA_DB)
+    parser.add_argument("--seed-days", type=int)
+    parser.add_argument("--settings", default="django_overthinglytics.settings_api")
+    parser.add_argument("--mix", type=Path)
+    parser.add_argument("--requests", type=int, default=2_000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    mix = read_mix(args.mix) if args.mix else list(DEFAULT_MIX)
+    if not mix:
+        raise SystemExit(f"no /analytics/ requests in {args.mix}")
+    urls = dict(DEFAULT_BACKENDS)
+    for spec in args.backend:
+        name, _, url = spec.partition("=")
+        urls[name] = url
+
+    with (
+        tempfile.TemporaryDirectory() as tmp,
+        tempfile.TemporaryFile() as log,
+    ):
+        db = args.db
+        if args.seed_days:
+            from . import setup_django
+
+            setup_django()
+            from django_backend.testing import Dataset, build_template
+
+            db = Path(tmp) / "analytics.db"
+            build_template(db, Dataset(days=args.seed_days))
+        process, django = start_django(db, tmp, args.settings, log)
+        try:
+            backends = [django]
+            for name, url in urls.items():
+                backend = Backend(name, url)
+                if fetch(backend.url(DASHBOARD[0]), timeout=2).status:
+                    backends.append(backend)
+                else:
+                    print(f"{name}: not running at {url}, skipped")
+
+            paths = sorted(set(mix))
+            print(f"\nParity against django, {len(paths)} distinct requests")
+            for backend in backends[1:]:
+                report = parity(django, backend, paths)
+                print(f"{backend.name}: {len(paths) - len(report)} identical")
+                for path, diffs in report.items():
+                    print(f"  {path}")
+                    for diff in diffs[:MAX_DIFFS]:
+                        print(f"    {diff}")
+                    if len(diffs) > MAX_DIFFS:
+                        print(f"    ... {len(diffs) - MAX_DIFFS} more")
+
+            print(
+                f"\nLoad: {args.requests:,} requests, {args.concurrency} threads, "
+                f"mix of {len(mix)}"
+            )
+            print(
+                f"{'backend':<8} {'req/s':>8} {'p50 ms':>8} {'p90 ms':>8} "
+                f"{'p99 ms':>8} {'max ms':>8} {'errors':>7}"
+            )
+            for backend in backends:
+                fetch(backend.url(mix[0]))  # warm up
+                seconds, latencies, statuses = replay(
+                    backend, mix, args.requests, args.concurrency
+                )
+                errors = sum(n for status, n in statuses.items() if status != 200)
+                print(
+                    f"{backend.name:<8} {len(latencies) / seconds:>8.0f} "
+                    f"{percentile(latencies, 0.5) * 1000:>8.1f} "
+                    f"{percentile(latencies, 0.9) * 1000:>8.1f} "
+                    f"{percentile(latencies, 0.99) * 1000:>8.1f} "
+                    f"{max(latencies) * 1000:>8.1f} {errors:>7}"
+                )
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Model instances vs read-only rows for the managers' read paths.
+
+Builds a synthetic analytics database and reads the newest ``N`` TrafficDaily
+rows, for N in ``--rows`` (default 60, the dashboard's largest limit, and
+100,000), three ways:
+
+* model: ``TrafficDaily.objects.order_by("-date")[:N]``, the old read path
+* rows: the same queryset through ``.rows()``, as ``get_recent`` now does
+* tuples: ``values_list`` of the same columns, as a floor
+
+Reported per mode: time per row (best of ``--repeat``), and from
+``tracemalloc`` the number of allocations still alive in the result, their
+size, and the peak traced memory while reading.
+
+    python -m benchmarks.row_objects [--rows 60 100000] [--repeat 5]
+"""
+
+import argparse
+import gc
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from . import setup_django
+
+
+def allocations(read):
+    """``(blocks, bytes, peak bytes)`` retained by ``read()``'s result."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    result = read()
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    blocks = sum(stat.count_diff for stat in stats)
+    size = sum(stat.size_diff for stat in stats)
+    del result
+    return blocks, size, peak
+
+
+def best_time(read, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        read()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[60, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connections
+
+    from django_backend.models import TrafficDaily
+    from django_backend.testing import Dataset, build_template
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "analytics.db"
+        build_template(db_path, Dataset(days=max(args.rows)))
+        connections["analytics"].settings_dict["NAME"] = db_path
+
+        newest = TrafficDaily.objects.order_by("-date")
+        modes = {
+            "model": lambda n: list(newest[:n]),
+            "rows": lambda n: list(newest.rows()[:n]),
+            "tuples": lambda n: list(
+                newest.values_list("id", "date_int", "visits", "sessions")[:n]
+            ),
+        }
+        print(
+            f"{'rows':>8} {'mode':<7} {'us/row':>8} {'blocks/row':>11} "
+            f"{'bytes/row':>10} {'peak KiB':>9}"
+        )
+        for n in args.rows:
+            for name, read in modes.items():
+                read(n)  # warm up the connection and statement cache
+                seconds = best_time(lambda r=read, n=n: r(n), args.repeat)
+                blocks, size, peak = allocations(lambda r=read, n=n: r(n))
+                print(
+                    f"{n:>8,} {name:<7} {seconds / n * 1e6:>8.2f} "
+                    f"{blocks / n:>11.1f} {size / n:>10.0f} {peak / 1024:>9.0f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Load test for /analytics/stream with many concurrent SSE subscribers.
+
+Drives the project's ASGI application in-process with N simulated clients.
+No server is needed. A fraction of the clients are slow: their ``send``
+stalls as a full socket buffer would. Meanwhile a separate sqlite3
+connection, standing in for the Prisma writer, updates the latest
+TrafficDaily row on a temporary copy of the database. Reports:
+
+* how many times the shared watcher polled
+* the events delivered and conflated per client class
+* the delay from each write to delivery
+
+    python -m benchmarks.sse_load [--clients 1000] [--slow 0.1] [--writes 5]
+"""
+
+import argparse
+import asyncio
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from . import setup_django
+
+
+class Client:
+    """One simulated SSE connection."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.events = []  # (arrival time, chunk)
+        self.disconnected = asyncio.Event()
+        self._sent_request = False
+
+    async def receive(self):
+        if not self._sent_request:
+            self._sent_request = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await self.disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(self, message):
+        if message["type"] != "http.response.body":
+            return
+        body = message.get("body", b"")
+        if b"event: traffic" in body:
+            self.events.append((time.perf_counter(), body))
+        if self.delay:
+            await asyncio.sleep(self.delay)
+
+
+def scope(query):
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/analytics/stream/",
+        "raw_path": b"/analytics/stream/",
+        "query_string": query,
+        "root_path": "",
+        "headers": [(b"host", b"localhost")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("localhost", 80),
+    }
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+async def run(application, watcher, db_path, args):
+    clients = [
+        Client(args.slow_delay if i < args.clients * args.slow else 0.0)
+        for i in range(args.clients)
+    ]
+    start = time.perf_counter()
+    tasks = [
+        asyncio.create_task(
+            application(scope(b"widgets=traffic"), client.receive, client.send)
+        )
+        for client in clients
+    ]
+    while sum(bool(client.events) for client in clients) < len(clients):
+        await asyncio.sleep(0.01)
+    connected = time.perf_counter() - start
+    polls_before = watcher.polls
+
+    writer = sqlite3.connect(db_path)
+    writes = []
+    for _ in range(args.writes):
+        await asyncio.sleep(args.write_interval)
+        writer.execute(
+            'UPDATE "TrafficDaily" SET visits = visits + 1 '
+            'WHERE date = (SELECT MAX(date) FROM "TrafficDaily")'
+        )
+        writer.commit()
+        writes.append(time.perf_counter())
+    await asyncio.sleep(args.write_interval + 2 * watcher.interval)
+    writer.close()
+    polls = watcher.polls - polls_before
+
+    for client in clients:
+        client.disconnected.set()
+    await asyncio.wait(tasks, timeout=5)
+
+    print(f"clients connected: {len(clients)} in {connected:.2f}s")
+    print(f"writes: {len(writes)}, watcher polls during writes: {polls}")
+    print(f"{'clients':<8} {'n':>6} {'events/client':>14} {'p50 ms':>8} {'p99 ms':>8}")
+    for label, group in (
+        ("fast", [c for c in clients if not c.delay]),
+        ("slow", [c for c in clients if c.delay]),
+    ):
+        if not group:
+            continue
+        delays = []
+        for client in group:
+            for arrival, _ in client.events[1:]:
+                previous = [w for w in writes if w <= arrival]
+                if previous:
+                    delays.append((arrival - previous[-1]) * 1000)
+        updates = statistics.mean(len(c.events) - 1 for c in group)
+        print(
+            f"{label:<8} {len(group):>6} {updates:>14.2f} "
+            f"{percentile(delays, 0.5):>8.0f} {percentile(delays, 0.99):>8.0f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--slow", type=float, default=0.1, help="fraction")
+    parser.add_argument("--slow-delay", type=float, default=2.0, help="seconds")
+    parser.add_argument("--writes", type=int, default=5)
+    parser.add_argument("--write-interval", type=float, default=1.5)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.core.asgi import get_asgi_application
+    from django.db import connections
+
+    source = Path(settings.DATABASES["analytics"]["NAME"])
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / source.name
+        shutil.copyfile(source, db_path)
+        connections["analytics"].settings_dict["NAME"] = db_path
+
+        from django_backend.views import stream_watcher
+
+        application = get_asgi_application()
+        asyncio.run(run(application, stream_watcher, db_path, args))
+
+
+if __name__ == "__main__":
+    main()
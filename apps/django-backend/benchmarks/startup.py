@@ -0,0 +1,113 @@
+"""Worker cold start: import time and module count per settings profile.
+
+Each run boots Django in a fresh interpreter (settings, app registry, WSGI
+handler, URLconf) and records wall time and ``len(sys.modules)``. With
+``--importtime`` the probe also runs under ``python -X importtime`` and the
+heaviest imports are listed. ``--max-seconds`` exits non-zero when a
+profile's median boot time exceeds it; wall time depends on the machine, so
+the time budget is checked here rather than in the test suite (which only
+checks module counts and apps).
+
+    python -m benchmarks.startup [--runs 5] [--importtime] [--top 15]
+                                 [--max-seconds 2.0]
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent
+
+PROFILES = (
+    "django_overthinglytics.settings",
+    "django_overthinglytics.settings_api",
+)
+
+PROBE = """
+import json, os, sys, time
+start = time.perf_counter()
+os.environ["DJANGO_SETTINGS_MODULE"] = sys.argv[1]
+from django.core.wsgi import get_wsgi_application
+get_wsgi_application()
+from django.urls import get_resolver
+get_resolver().url_patterns
+seconds = time.perf_counter() - start
+from django.apps import apps
+print(json.dumps({
+    "seconds": seconds,
+    "modules": len(sys.modules),
+    "apps": [config.label for config in apps.get_app_configs()],
+}))
+"""
+
+
+def parse_importtime(stderr):
+    """Return ``[(self_us, cumulative_us, module)]`` from -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:") :].split("|")
+        rows.append((int(self_us), int(cumulative_us), module.strip()))
+    return rows
+
+
+def probe(settings_module, importtime=False):
+    """Boot Django in a fresh interpreter and report startup cost.
+
+    Returns seconds to a loaded URLconf, the number of imported modules, the
+    installed app labels and, with ``importtime``, per-module import timings.
+    """
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-c", PROBE, settings_module]
+    result = subprocess.run(
+        command, capture_output=True, text=True, check=True, cwd=APP_DIR
+    )
+    report = json.loads(result.stdout)
+    report["imports"] = parse_importtime(result.stderr) if importtime else []
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--importtime", action="store_true")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-seconds", type=float, default=None)
+    args = parser.parse_args()
+
+    print(f"{'profile':<40} {'median s':>9} {'min s':>8} {'modules':>8}")
+    over_budget = []
+    for profile in PROFILES:
+        runs = [probe(profile) for _ in range(args.runs)]
+        seconds = [run["seconds"] for run in runs]
+        median = statistics.median(seconds)
+        print(
+            f"{profile:<40} {median:>9.3f} "
+            f"{min(seconds):>8.3f} {runs[0]['modules']:>8}"
+        )
+        if args.max_seconds is not None and median > args.max_seconds:
+            over_budget.append(profile)
+
+    if args.importtime:
+        for profile in PROFILES:
+            imports = probe(profile, importtime=True)["imports"]
+            total_ms = sum(self_us for self_us, _, _ in imports) / 1000
+            print(f"\n{profile}: {len(imports)} imports, {total_ms:.1f} ms self")
+            print(f"{'self ms':>9} {'cum ms':>9}  module")
+            for self_us, cumulative_us, module in sorted(imports, reverse=True)[
+                : args.top
+            ]:
+                print(f"{self_us / 1000:>9.2f} {cumulative_us / 1000:>9.2f}  {module}")
+
+    if over_budget:
+        sys.exit(f"over the {args.max_seconds}s budget: {', '.join(over_budget)}")
+
+
+if __name__ == "__main__":
+    main()
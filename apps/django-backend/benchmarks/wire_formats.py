@@ -0,0 +1,78 @@
+"""Payload size and encode time: JSON rows vs columnar MessagePack/Arrow.
+
+Builds synthetic traffic rows shaped like cursor tuples and times building
+and encoding the response payload in each wire format.
+
+    python -m benchmarks.wire_formats [--rows 60 10000 100000]
+"""
+
+import argparse
+import timeit
+from functools import partial
+
+from . import setup_django
+
+
+def synthetic_columns(rows):
+    start = 1704441600000
+    return {
+        "date_int": [start + i * 86_400_000 for i in range(rows)],
+        "visits": [1000 + i % 500 for i in range(rows)],
+        "sessions": [800 + i % 400 for i in range(rows)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[60, 10_000, 100_000]
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from rest_framework.renderers import JSONRenderer
+
+    from django_backend.renderers import COLUMNAR_RENDERERS
+    from django_backend.serializers import TrafficColumnsSerializer, format_day
+
+    def encode_json(columns):
+        rows = [
+            {"day": format_day(ts), "visits": v, "sessions": s}
+            for ts, v, s in zip(
+                columns["date_int"],
+                columns["visits"],
+                columns["sessions"],
+                strict=True,
+            )
+        ]
+        return JSONRenderer().render({"data": rows})
+
+    def encode_columnar(renderer, columns):
+        return renderer.render(TrafficColumnsSerializer(columns).data)
+
+    encoders = [("json", encode_json)]
+    for renderer_class in COLUMNAR_RENDERERS:
+        encoders.append(
+            (renderer_class.format, partial(encode_columnar, renderer_class()))
+        )
+
+    print(f"{'rows':>8} {'format':>8} {'bytes':>12} {'ms':>10} {'vs json':>8}")
+    for rows in args.rows:
+        columns = synthetic_columns(rows)
+        json_size = None
+        for name, encode in encoders:
+            size = len(encode(columns))
+            json_size = json_size or size
+            timings = timeit.repeat(
+                partial(encode, columns), number=1, repeat=args.repeat
+            )
+            seconds = min(timings)
+            print(
+                f"{rows:>8} {name:>8} {size:>12,} {seconds * 1000:>10.2f} "
+                f"{size / json_size:>7.0%}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,11 @@
 """Django admin configuration for Overthinklytics analytics models."""
 
-from datetime import datetime
-
+from django.conf import settings
 from django.contrib import admin
+from django.http import FileResponse, Http404
+from django.template.response import TemplateResponse
 
+from .dates import get_calendar
 from .models import (
     DeviceShare,
     KpiSnapshot,
@@ -11,6 +13,7 @@ from .models import (
     SignupByChannel,
     TrafficDaily,
 )
+from .profiling import FILE_TYPES, list_profiles, profile_dir, profile_file
 
 
 class ReadOnlyAdminMixin:
@@ -23,11 +26,17 @@ class ReadOnlyAdminMixin:
         return False
 
 
-def format_timestamp_ms(timestamp_ms, fmt="%Y-%m-%d"):
-    """Convert Unix timestamp in milliseconds to formatted string."""
-    if timestamp_ms:
-        return datetime.fromtimestamp(timestamp_ms / 1000).strftime(fmt)
-    return None
+def format_timestamp_ms(timestamp_ms, fmt=None):
+    """Convert Unix timestamp in milliseconds to a string in TIME_ZONE.
+
+    Without ``fmt`` the cached ISO date of the calendar day is returned.
+    """
+    if not timestamp_ms:
+        return None
+    calendar = get_calendar()
+    if fmt is None:
+        return calendar.day(timestamp_ms).iso_date
+    return calendar.to_datetime(timestamp_ms).strftime(fmt)
 
 
 def format_percentage(value):
@@ -127,3 +136,30 @@ class DeviceShareAdmin(ReadOnlyAdminMixin, admin.ModelAdmin):
     @admin.display(description="Share %", ordering="sharepct")
     def sharepct_display(self, obj):
         return format_percentage(obj.sharepct)
+
+
+def profile_list(request):
+    """Admin page listing the stored request profiles, newest first."""
+    context = {
+        **admin.site.each_context(request),
+        "title": "Request profiles",
+        "profiles": list_profiles(),
+        "directory": profile_dir(),
+        "header_enabled": bool(getattr(settings, "ANALYTICS_PROFILE_TOKEN", None)),
+        "sample_rate": getattr(settings, "ANALYTICS_PROFILE_SAMPLE_RATE", 0),
+        "profiler": getattr(settings, "ANALYTICS_PROFILER", "sampler"),
+    }
+    return TemplateResponse(request, "admin/django_backend/profiles.html", context)
+
+
+def profile_download(request, name):
+    """Download one file of a stored profile."""
+    path = profile_file(name)
+    if path is None:
+        raise Http404("No such profile file")
+    return FileResponse(
+        path.open("rb"),
+        as_attachment=True,
+        filename=name,
+        content_type=FILE_TYPES[path.suffix] or "application/octet-stream",
+    )
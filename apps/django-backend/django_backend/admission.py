@@ -0,0 +1,222 @@
+"""Admission control for the analytics endpoints.
+
+Bursty dashboard traffic used to queue synchronous views on the SQLite file
+until every request timed out. Requests are now admitted in two stages, all
+in process:
+
+* Rate: one token bucket per client (``ANALYTICS_RATE_LIMIT_PER_CLIENT``)
+  and one for the whole process (``ANALYTICS_RATE_LIMIT_GLOBAL``), checked
+  before the view runs. Exceeding the client's bucket is a 429, exceeding
+  the global one a 503.
+* Concurrency: at most ``ANALYTICS_MAX_CONCURRENT_QUERIES`` cache misses
+  query the database at once. Cache hits never wait for a slot. A miss that
+  cannot get a slot within ``ANALYTICS_QUERY_QUEUE_TIMEOUT`` seconds is
+  shed with a 503.
+
+A shed request is answered with the last response rendered for the same
+URL and format, if there is one, marked ``X-Analytics-Stale``. Otherwise it
+gets the error status with ``Retry-After``. Counters of shed and stale
+responses are served at ``/analytics/admission``.
+
+Each bucket has its own lock held for a few float operations, so checks
+stay cheap under contention. A limit set to None is disabled.
+"""
+
+import math
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+
+
+class Overloaded(Exception):
+    """A request was shed; rendered as 429/503 or a stale response."""
+
+    def __init__(self, reason, status, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.status = status
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """``rate`` tokens per second, holding at most ``capacity``."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated", "_lock")
+
+    def __init__(self, rate, capacity, now=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic() if now is None else now
+        self._lock = threading.Lock()
+
+    def take(self, now=None):
+        """Take one token; return 0 if taken, else seconds until one is due."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if tokens >= 1:
+                self.tokens = tokens - 1
+                return 0.0
+            self.tokens = tokens
+            return (1 - tokens) / self.rate
+
+    def full(self, now):
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class ClientBuckets:
+    """Token buckets per client, bounded to ``max_clients``.
+
+    When full, clients whose buckets have refilled are forgotten (they would
+    get a full bucket again anyway); failing that, the least recently seen.
+    """
+
+    def __init__(self, rate, capacity, max_clients=10_000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def take(self, client, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                if len(self._buckets) >= self.max_clients:
+                    self._prune(now)
+                bucket = self._buckets[client] = TokenBucket(
+                    self.rate, self.capacity, now
+                )
+            else:
+                self._buckets.move_to_end(client)
+        return bucket.take(now)
+
+    def _prune(self, now):
+        idle = [client for client, b in self._buckets.items() if b.full(now)]
+        for client in idle:
+            del self._buckets[client]
+        while len(self._buckets) >= self.max_clients:
+            self._buckets.popitem(last=False)
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class Admission:
+    """Rate buckets, the query concurrency limit and their counters."""
+
+    def __init__(
+        self,
+        per_client=None,
+        global_rate=None,
+        max_queries=None,
+        queue_timeout=0.5,
+        stale_entries=512,
+    ):
+        self.clients = ClientBuckets(*per_client) if per_client else None
+        self.global_bucket = TokenBucket(*global_rate) if global_rate else None
+        self.max_queries = max_queries
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_queries) if max_queries else None
+        self._stale = OrderedDict()
+        self._stale_entries = stale_entries
+        self._lock = threading.Lock()
+        self.shed = Counter()
+        self.served_stale = 0
+        self.querying = 0
+
+    @classmethod
+    def from_settings(cls):
+        return cls(**cls._settings())
+
+    @staticmethod
+    def _settings():
+        return {
+            "per_client": getattr(settings, "ANALYTICS_RATE_LIMIT_PER_CLIENT", None),
+            "global_rate": getattr(settings, "ANALYTICS_RATE_LIMIT_GLOBAL", None),
+            "max_queries": getattr(settings, "ANALYTICS_MAX_CONCURRENT_QUERIES", None),
+            "queue_timeout": getattr(settings, "ANALYTICS_QUERY_QUEUE_TIMEOUT", 0.5),
+            "stale_entries": getattr(settings, "ANALYTICS_CACHE_MAX_ENTRIES", 512),
+        }
+
+    def admit(self, client):
+        """Raise :class:`Overloaded` if ``client`` is over a rate limit."""
+        if self.clients is not None:
+            wait = self.clients.take(client)
+            if wait:
+                raise Overloaded("client_rate", 429, wait)
+        if self.global_bucket is not None:
+            wait = self.global_bucket.take()
+            if wait:
+                raise Overloaded("global_rate", 503, wait)
+
+    def run_query(self, compute):
+        """Run ``compute()`` in a query slot, or raise :class:`Overloaded`."""
+        if self._slots is None:
+            return compute()
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise Overloaded("concurrency", 503, max(self.queue_timeout, 1.0))
+        with self._lock:
+            self.querying += 1
+        try:
+            return compute()
+        finally:
+            with self._lock:
+                self.querying -= 1
+            self._slots.release()
+
+    def remember(self, key, entry):
+        """Keep ``entry`` as the last response for ``key``."""
+        with self._lock:
+            self._stale[key] = entry
+            self._stale.move_to_end(key)
+            if len(self._stale) > self._stale_entries:
+                self._stale.popitem(last=False)
+
+    def shed_response(self, key, reason):
+        """Count a shed request; return the last entry for ``key``, if any."""
+        with self._lock:
+            self.shed[reason] += 1
+            entry = self._stale.get(key)
+            if entry is not None:
+                self.served_stale += 1
+            return entry
+
+    def stats(self):
+        return {
+            "shed": {
+                reason: self.shed[reason]
+                for reason in ("client_rate", "global_rate", "concurrency")
+            },
+            "served_stale": self.served_stale,
+            "querying": self.querying,
+            "clients": len(self.clients) if self.clients is not None else 0,
+            "limits": {
+                "per_client": self._limit(self.clients),
+                "global": self._limit(self.global_bucket),
+                "max_concurrent_queries": self.max_queries,
+            },
+        }
+
+    @staticmethod
+    def _limit(bucket):
+        if bucket is None:
+            return None
+        return {"rate": bucket.rate, "burst": bucket.capacity}
+
+    def reset(self):
+        """Re-read the limits from settings; forget buckets and counters."""
+        self.__init__(**self._settings())
+
+
+def retry_after(seconds):
+    """``Retry-After`` value: whole seconds, at least 1."""
+    return str(max(1, math.ceil(seconds)))
+
+
+admission = Admission.from_settings()
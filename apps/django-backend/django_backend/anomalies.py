@@ -0,0 +1,239 @@
+"""Incremental anomaly flags for daily traffic and revenue.
+
+Each series (visits, sessions, revenue cents) keeps an exponentially
+weighted mean and variance per weekday, so a Monday is compared with recent
+Mondays. A new day is scored against its weekday baseline and then folded
+into it. That costs O(1) time per day and constant state per series, however
+long the history. Once a weekday has ``WARMUP`` observations, days whose
+\\|z\\| exceeds ``ANALYTICS_ANOMALY_THRESHOLD`` are flagged. A flagged value is
+clamped to the threshold before it updates the baseline, so one spike does
+not widen the baseline for weeks.
+
+Like the KPI engine, the detector reads rows above each table's id
+watermark, in date order. ``manage.py detect_anomalies`` persists its state
+to ``ANALYTICS_STATE_DIR``. Rows dated at or before a series' last scored
+day are skipped (late inserts, in-place upserts). ``--rebuild`` rescores the
+full history.
+"""
+
+import json
+import math
+import threading
+from pathlib import Path
+
+from django.conf import settings
+
+from .dates import DAY_MS, get_calendar
+from .models import RevenueDaily, TrafficDaily
+from .versioning import data_version
+
+STATE_VERSION = 1
+WARMUP = 4  # observations per weekday before flagging
+# Floor on the baseline deviation, relative to the mean, so perfectly flat
+# history does not turn every small change into an infinite z-score.
+MIN_RELATIVE_STD = 0.01
+
+# table model -> ((series name, field), ...)
+SERIES = (
+    (TrafficDaily, (("visits", "visits"), ("sessions", "sessions"))),
+    (RevenueDaily, (("revenue_cents", "valuecents"),)),
+)
+SERIES_NAMES = tuple(name for _, series in SERIES for name, _ in series)
+
+
+class WeekdayBaseline:
+    """EWMA mean and variance of one series, per weekday."""
+
+    __slots__ = ("count", "mean", "var", "last_day")
+
+    def __init__(self):
+        self.count = [0] * 7
+        self.mean = [0.0] * 7
+        self.var = [0.0] * 7
+        self.last_day = None
+
+    def observe(self, day, weekday, value, alpha, threshold):
+        """Score ``value`` for ``day`` and update the baseline.
+
+        Returns ``(expected, score)`` when the day is anomalous, else None.
+        Days not after the last observed day are ignored.
+        """
+        if self.last_day is not None and day <= self.last_day:
+            return None
+        self.last_day = day
+        count, mean = self.count[weekday], self.mean[weekday]
+        self.count[weekday] = count + 1
+        if count == 0:
+            self.mean[weekday] = float(value)
+            return None
+        std = max(math.sqrt(self.var[weekday]), abs(mean) * MIN_RELATIVE_STD)
+        score = (value - mean) / std if std else 0.0
+        flagged = count >= WARMUP and abs(score) > threshold
+        if flagged:
+            value = mean + math.copysign(threshold * std, score)
+        diff = value - mean
+        increment = alpha * diff
+        self.mean[weekday] = mean + increment
+        self.var[weekday] = (1 - alpha) * (self.var[weekday] + diff * increment)
+        return (mean, score) if flagged else None
+
+    def to_list(self):
+        return [self.count, self.mean, self.var, self.last_day]
+
+    @classmethod
+    def from_list(cls, state):
+        baseline = cls()
+        baseline.count, baseline.mean, baseline.var, baseline.last_day = state
+        return baseline
+
+
+class AnomalyDetector:
+    """Per-series weekday baselines plus the days they flagged."""
+
+    def __init__(self, alpha=None, threshold=None):
+        self.alpha = alpha or getattr(settings, "ANALYTICS_ANOMALY_ALPHA", 0.2)
+        self.threshold = threshold or getattr(
+            settings, "ANALYTICS_ANOMALY_THRESHOLD", 3.0
+        )
+        self.baselines = {name: WeekdayBaseline() for name in SERIES_NAMES}
+        # day (ms) -> {series: (value, expected, score)}
+        self.flags = {}
+        self.watermarks = {model._meta.db_table: 0 for model, _ in SERIES}
+        self.version = None  # data version last synced to (not persisted)
+
+    def ingest(self, series, day, weekday, value):
+        """Score one day of ``series``."""
+        flag = self.baselines[series].observe(
+            day, weekday, value, self.alpha, self.threshold
+        )
+        if flag is not None:
+            expected, score = flag
+            self.flags.setdefault(day, {})[series] = (
+                value,
+                round(expected, 2),
+                round(score, 2),
+            )
+
+    def scores(self, series):
+        """``{day: {series: score}}`` for flagged days of ``series``."""
+        scores = {}
+        for day, flagged in self.flags.items():
+            picked = {name: flag[2] for name, flag in flagged.items() if name in series}
+            if picked:
+                scores[day] = picked
+        return scores
+
+    def recent(self, days):
+        """Flags from the last ``days`` scored days, oldest first.
+
+        Returns ``(day, series, value, expected, score)`` tuples.
+        """
+        latest = max(
+            (b.last_day for b in self.baselines.values() if b.last_day is not None),
+            default=None,
+        )
+        if latest is None:
+            return []
+        cutoff = latest - (days - 1) * DAY_MS
+        order = {name: i for i, name in enumerate(SERIES_NAMES)}
+        return [
+            (day, name, *flag)
+            for day, flagged in sorted(self.flags.items())
+            if day >= cutoff
+            for name, flag in sorted(flagged.items(), key=lambda f: order[f[0]])
+        ]
+
+    def to_dict(self):
+        return {
+            "version": STATE_VERSION,
+            "alpha": self.alpha,
+            "threshold": self.threshold,
+            "baselines": {
+                name: baseline.to_list() for name, baseline in self.baselines.items()
+            },
+            "flags": [[day, flagged] for day, flagged in self.flags.items()],
+            "watermarks": self.watermarks,
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        detector = cls(state["alpha"], state["threshold"])
+        for name, baseline in state["baselines"].items():
+            detector.baselines[name] = WeekdayBaseline.from_list(baseline)
+        detector.flags = {
+            day: {name: tuple(flag) for name, flag in flagged.items()}
+            for day, flagged in state["flags"]
+        }
+        detector.watermarks.update(state["watermarks"])
+        return detector
+
+
+def sync_detector(detector, calendar=None):
+    """Score rows written since the last sync, in date order per table."""
+    calendar = calendar or get_calendar()
+    marks = detector.watermarks
+    for model, series in SERIES:
+        table = model._meta.db_table
+        fields = [field for _, field in series]
+        rows = (
+            model.objects.filter(id__gt=marks[table])
+            .order_by("date")
+            .values_list("id", "date_int", *fields)
+        )
+        for row_id, day, *values in rows.iterator(chunk_size=10_000):
+            weekday = calendar.day(day).date.weekday()
+            for (name, _), value in zip(series, values, strict=True):
+                detector.ingest(name, day, weekday, value)
+            marks[table] = max(marks[table], row_id)
+    return detector
+
+
+def state_path():
+    return Path(settings.ANALYTICS_STATE_DIR) / "anomalies.json"
+
+
+def load_detector():
+    """Load the persisted detector, or a fresh one if none is usable."""
+    try:
+        state = json.loads(state_path().read_text())
+    except (FileNotFoundError, ValueError):
+        return AnomalyDetector()
+    if state.get("version") != STATE_VERSION:
+        return AnomalyDetector()
+    return AnomalyDetector.from_dict(state)
+
+
+def save_detector(detector):
+    """Persist detector state atomically."""
+    path = state_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(detector.to_dict()))
+    tmp.replace(path)
+
+
+class DetectorStore:
+    """Per-process detector, synced when the fact tables' version moves."""
+
+    tables = tuple(model._meta.db_table for model, _ in SERIES)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._detector = None
+
+    def get(self):
+        version = data_version.get(self.tables)
+        with self._lock:
+            if self._detector is None:
+                self._detector = load_detector()
+            if self._detector.version != version:
+                sync_detector(self._detector)
+                self._detector.version = version
+            return self._detector
+
+    def clear(self):
+        with self._lock:
+            self._detector = None
+
+
+detectors = DetectorStore()
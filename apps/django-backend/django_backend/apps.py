@@ -0,0 +1,24 @@
+"""Application configuration for the analytics app."""
+
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+
+
+class AnalyticsConfig(AppConfig):
+    """Wire up signal handlers for the Prisma-backed analytics models."""
+
+    name = "django_backend"
+    default_auto_field = "django.db.models.BigAutoField"
+
+    def ready(self):
+        from .routers import AnalyticsRouter
+        from .slow_queries import install
+        from .versioning import invalidate_on_write
+
+        connection_created.connect(install)
+
+        for model in self.get_models():
+            if model._meta.model_name in AnalyticsRouter.analytics_models:
+                post_save.connect(invalidate_on_write, sender=model)
+                post_delete.connect(invalidate_on_write, sender=model)
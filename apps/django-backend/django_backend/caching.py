@@ -0,0 +1,190 @@
+"""Rendered-response cache with precompressed variants.
+
+Dashboards poll the same endpoints with the same parameters, so a payload is
+rendered and compressed once per data version and then served from memory.
+Each entry keeps the identity body plus one variant per available encoding
+(gzip always; brotli and zstd when their packages are installed). Bodies
+smaller than ``ANALYTICS_COMPRESSION_MIN_BYTES`` are never compressed.
+
+Compression happens on the request path of whichever request misses, so it
+uses moderate levels (``ANALYTICS_COMPRESSION_LEVELS``, default brotli 5,
+zstd 3, gzip 6). Only offline snapshot publishing uses :data:`MAX_LEVELS`.
+"""
+
+import gzip
+import threading
+import time
+from collections import OrderedDict
+from importlib.util import find_spec
+
+from django.conf import settings
+from rest_framework.response import Response
+
+LIVE_LEVELS = {"br": 5, "zstd": 3, "gzip": 6}
+MAX_LEVELS = {"br": 11, "zstd": 19, "gzip": 9}
+
+
+def _gzip(body, level):
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+def _brotli(body, level):
+    import brotli
+
+    return brotli.compress(body, quality=level)
+
+
+def _zstd(body, level):
+    try:
+        from compression import zstd
+    except ImportError:
+        import zstandard
+
+        return zstandard.ZstdCompressor(level=level).compress(body)
+    return zstd.compress(body, level=level)
+
+
+def _installed(name):
+    try:
+        return find_spec(name) is not None
+    except ModuleNotFoundError:
+        return False
+
+
+def _available_compressors():
+    """Return ``{coding: compress}`` in server preference order."""
+    compressors = {}
+    if _installed("brotli"):
+        compressors["br"] = _brotli
+    if _installed("compression.zstd") or _installed("zstandard"):
+        compressors["zstd"] = _zstd
+    compressors["gzip"] = _gzip
+    return compressors
+
+
+COMPRESSORS = _available_compressors()
+
+
+def compress_variants(body, levels=None):
+    """Return ``{coding: compressed body}`` for every available coding.
+
+    ``levels`` defaults to :data:`LIVE_LEVELS` updated with
+    ``ANALYTICS_COMPRESSION_LEVELS``.
+    """
+    if levels is None:
+        configured = getattr(settings, "ANALYTICS_COMPRESSION_LEVELS", {})
+        levels = {**LIVE_LEVELS, **configured}
+    return {
+        coding: compress(body, levels[coding])
+        for coding, compress in COMPRESSORS.items()
+    }
+
+
+def negotiate_encoding(accept_encoding, available):
+    """Pick the best coding in ``available`` allowed by ``accept_encoding``.
+
+    ``available`` is in server preference order, which breaks ties between
+    equal q-values. Returns None when identity should be served.
+    """
+    if not accept_encoding:
+        return None
+    qualities = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    wildcard = qualities.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for coding in available:
+        quality = qualities.get(coding, wildcard)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+class CachedPayload:
+    """A rendered body, its compressed variants and the source data."""
+
+    __slots__ = ("data", "body", "content_type", "variants", "expires")
+
+    def __init__(self, data, body, content_type, ttl):
+        self.data = data
+        self.body = body
+        self.content_type = content_type
+        self.expires = time.monotonic() + ttl
+        min_bytes = getattr(settings, "ANALYTICS_COMPRESSION_MIN_BYTES", 512)
+        if len(body) < min_bytes:
+            self.variants = {}
+        else:
+            self.variants = compress_variants(body)
+
+    def select(self, accept_encoding):
+        """Return ``(coding, body)`` for the client's Accept-Encoding."""
+        coding = negotiate_encoding(accept_encoding, self.variants)
+        if coding is None:
+            return None, self.body
+        return coding, self.variants[coding]
+
+
+class ResponseCache:
+    """Thread-safe LRU of :class:`CachedPayload` with per-entry expiry."""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+response_cache = ResponseCache(
+    max_entries=getattr(settings, "ANALYTICS_CACHE_MAX_ENTRIES", 512)
+)
+
+
+class PrecompressedResponse(Response):
+    """DRF response whose bytes come from a cache entry, not a renderer.
+
+    ``data`` is still populated so callers and tests can inspect it.
+    """
+
+    def __init__(self, entry, accept_encoding=None):
+        super().__init__(entry.data)
+        self.entry = entry
+        self.coding, self.encoded_body = entry.select(accept_encoding)
+
+    @property
+    def rendered_content(self):
+        self["Content-Type"] = self.entry.content_type
+        if self.coding:
+            self["Content-Encoding"] = self.coding
+        return self.encoded_body
@@ -0,0 +1,183 @@
+"""Change log of the analytics tables.
+
+The Prisma migration ``analytics_change_log`` adds triggers to the five
+analytics tables. Each insert, update and delete of a row appends a row to
+``AnalyticsChange``: a sequence number, the table, the operation (``I``,
+``U`` or ``D``; ``A`` for rows ``apply_retention`` moved to the archive
+rather than deleted), the row id and the time of the change in Unix ms. Sequence
+numbers only grow. The column is AUTOINCREMENT, so numbers are never reused,
+even after entries are deleted. They follow commit order, because SQLite
+has one writer at a time.
+
+A consumer keeps the last sequence number it processed. It reads what
+changed since then with :func:`changes_since`, so its refresh work follows
+the number of changes rather than the size of the tables. It records
+progress with :func:`acknowledge`. ``manage.py compact_changes`` trims
+entries every registered consumer has acknowledged. It always keeps the
+newest entry of each table: :func:`change_heads`, the per-table
+position of the log, is what :mod:`.versioning` uses as the tables' data
+version.
+
+The triggers exist on SQLite only. Without them (PostgreSQL, or a database
+the migration was not applied to), :func:`log_installed` is False and
+:func:`change_heads` returns None.
+"""
+
+import time
+from typing import NamedTuple
+
+from django.db import connections, transaction
+
+from .versioning import ANALYTICS_TABLES
+
+CHANGE_TABLE = "AnalyticsChange"
+CONSUMER_TABLE = "AnalyticsChangeConsumer"
+
+_installed = {}  # (alias, database name) -> bool
+
+
+class Change(NamedTuple):
+    seq: int
+    table: str
+    op: str  # "I", "U", "D" or "A" (archived)
+    row_id: int
+    changed_at: int  # Unix ms
+
+
+def log_installed(using="analytics"):
+    """Whether ``using`` has the change log table and triggers."""
+    connection = connections[using]
+    if connection.vendor != "sqlite":
+        return False
+    key = (using, str(connection.settings_dict["NAME"]))
+    installed = _installed.get(key)
+    if installed is None:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' "
+                "AND sql LIKE %s",
+                [f'%INSERT INTO "{CHANGE_TABLE}"%'],
+            )
+            triggers = cursor.fetchone()[0]
+        installed = _installed[key] = triggers == 3 * len(ANALYTICS_TABLES)
+    return installed
+
+
+def change_heads(using="analytics"):
+    """``{table: seq of its newest change}``, or None without a change log.
+
+    Tables without logged changes map to None.
+    """
+    if not log_installed(using):
+        return None
+    columns = ", ".join(
+        f'(SELECT MAX("seq") FROM "{CHANGE_TABLE}" WHERE "tableName" = %s)'
+        for _ in ANALYTICS_TABLES
+    )
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"SELECT {columns}", list(ANALYTICS_TABLES))
+        return dict(zip(ANALYTICS_TABLES, cursor.fetchone(), strict=True))
+
+
+def last_seq(using="analytics"):
+    """The highest sequence number ever assigned (0 for an empty log)."""
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = %s", [CHANGE_TABLE]
+        )
+        row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def changes_since(seq, tables=None, limit=10_000, using="analytics"):
+    """Changes after sequence number ``seq``, oldest first.
+
+    ``tables`` restricts them to some tables. At most ``limit`` changes are
+    returned; a consumer continues from the last one's ``seq``.
+    """
+    sql = (
+        f'SELECT "seq", "tableName", "op", "rowId", CAST("changedAt" AS BIGINT) '
+        f'FROM "{CHANGE_TABLE}" WHERE "seq" > %s'
+    )
+    params = [seq]
+    if tables:
+        sql += f' AND "tableName" IN ({", ".join(["%s"] * len(tables))})'
+        params += list(tables)
+    sql += ' ORDER BY "seq" LIMIT %s'
+    params.append(limit)
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+        return [Change(*row) for row in cursor.fetchall()]
+
+
+def mark_archived(table, after, using="analytics"):
+    """Relabel ``table``'s deletes logged after ``after`` as archive moves.
+
+    Called in the transaction that moved the rows (see :mod:`.retention`),
+    so no other deletes fall in the range. Returns the entries relabelled.
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'UPDATE "{CHANGE_TABLE}" SET "op" = %s '
+            f'WHERE "seq" > %s AND "tableName" = %s AND "op" = %s',
+            ["A", after, table, "D"],
+        )
+        return cursor.rowcount
+
+
+def changed_rows(changes):
+    """``{table: {row id: last op}}`` of ``changes``, for batch refreshes."""
+    rows = {}
+    for change in changes:
+        rows.setdefault(change.table, {})[change.row_id] = change.op
+    return rows
+
+
+def position(consumer, using="analytics"):
+    """The last sequence number ``consumer`` acknowledged, or None."""
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'SELECT "seq" FROM "{CONSUMER_TABLE}" WHERE "name" = %s', [consumer]
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def acknowledge(consumer, seq, using="analytics"):
+    """Record that ``consumer`` has processed every change up to ``seq``.
+
+    Registers the consumer on first use. Positions never move back.
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO "{CONSUMER_TABLE}" ("name", "seq", "updatedAt") '
+            f'VALUES (%s, %s, %s) ON CONFLICT ("name") DO UPDATE SET '
+            f'"seq" = MAX("seq", excluded."seq"), "updatedAt" = excluded."updatedAt"',
+            [consumer, seq, int(time.time() * 1000)],
+        )
+
+
+def forget(consumer, using="analytics"):
+    """Unregister ``consumer``, so it no longer holds back compaction."""
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM "{CONSUMER_TABLE}" WHERE "name" = %s', [consumer])
+
+
+def compact_changes(upto=None, using="analytics"):
+    """Delete changes up to ``upto`` that every consumer has acknowledged.
+
+    ``upto`` defaults to the lowest consumer position (everything without
+    consumers). The newest change of each table is kept. Returns the number
+    of entries deleted.
+    """
+    with transaction.atomic(using), connections[using].cursor() as cursor:
+        cursor.execute(f'SELECT MIN("seq") FROM "{CONSUMER_TABLE}"')
+        (lowest,) = cursor.fetchone()
+        bounds = [seq for seq in (upto, lowest) if seq is not None]
+        limit = min(bounds) if bounds else last_seq(using)
+        cursor.execute(
+            f'DELETE FROM "{CHANGE_TABLE}" WHERE "seq" <= %s AND "seq" NOT IN '
+            f'(SELECT MAX("seq") FROM "{CHANGE_TABLE}" GROUP BY "tableName")',
+            [limit],
+        )
+        return cursor.rowcount
@@ -0,0 +1,64 @@
+"""Single-flight coalescing of identical concurrent computations.
+
+When many dashboards load at once they issue the same request at the same
+moment. Rather than running the same query and serialization for each of
+them, the first caller for a key becomes the leader and every concurrent
+caller with the same key waits for the leader's result.
+
+Results are only shared while a computation is in flight; nothing is cached
+once it completes. Callers that want consistency across writes include a
+data version in the key (see :mod:`django_backend.versioning`).
+"""
+
+import threading
+from concurrent.futures import Future
+
+
+def request_key(endpoint, params, version=None):
+    """Build a hashable key from an endpoint name and its normalized params."""
+    return (endpoint, tuple(sorted(params.items())), version)
+
+
+class SingleFlight:
+    """Deduplicate concurrent calls that share a key."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Return ``fn()``, sharing the result with concurrent callers."""
+        future, leader = self._claim(key)
+        if not leader:
+            return future.result()
+        return self._run(key, future, fn)
+
+    def in_flight(self):
+        """Return the number of computations currently running."""
+        with self._lock:
+            return len(self._calls)
+
+    def _claim(self, key):
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            return future, True
+
+    def _run(self, key, future, fn):
+        try:
+            result = fn()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+
+inflight = SingleFlight()
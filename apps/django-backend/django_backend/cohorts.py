@@ -0,0 +1,242 @@
+"""Month x channel signup analytics over ``SignupByChannel``.
+
+The table is loaded into a dense matrix with one row per calendar month
+(gaps filled with zeros) and one column per channel. Running column sums
+are kept next to it, so every metric is a few list operations per requested
+month, whatever the length of the history:
+
+* growth: month-over-month change per channel and in total, in percent
+* mix: each channel's share of the month's signups, in percent
+* rolling: trailing 3/6/12-month sums per channel and in total
+
+The matrix is per process and follows the table's data version. When the
+version moves, only rows from the newest loaded month onward are read. They
+replace that month (in-place upserts of the open month) and append any new
+months. It is rebuilt from scratch when rows elsewhere changed: the table's
+row count moved, a new channel appeared, or a checksum of the older months
+(see :func:`older_checksum`) no longer matches the matrix.
+"""
+
+import threading
+
+from django.db import connections
+from django.db.models import Q
+
+from .models import SignupByChannel
+from .versioning import data_version
+
+ROLLING_WINDOWS = (3, 6, 12)
+
+
+def month_index(year, month):
+    return year * 12 + month - 1
+
+
+def month_label(index):
+    return f"{index // 12}-{index % 12 + 1:02d}"
+
+
+def percent(part, whole):
+    return round(part * 100 / whole, 1) if whole else None
+
+
+class SignupMatrix:
+    """Dense month x channel signup counts with running column sums."""
+
+    def __init__(self, channels):
+        self.channels = list(channels)
+        self.start = None  # month index of the first row
+        self.rows = []
+        # prefix[i][j]: signups of channel j in months before row i
+        self.prefix = [[0] * len(self.channels)]
+        self.loaded = 0  # table rows read into the matrix
+        self.newest_rows = 0  # of which in the newest month
+
+    def checksum(self):
+        """What :func:`older_checksum` returns while the matrix is current."""
+        weight = len(self.channels) + 1
+        total = weighted = 0
+        for i, row in enumerate(self.rows[:-1]):
+            for j, signups in enumerate(row):
+                total += signups
+                weighted += signups * ((self.start + i) * weight + j + 1)
+        return self.loaded - self.newest_rows, total, weighted
+
+    @property
+    def last(self):
+        """Month index of the newest row, or None if empty."""
+        return None if self.start is None else self.start + len(self.rows) - 1
+
+    def set_month(self, index, counts):
+        """Store ``{channel: signups}`` for month ``index``.
+
+        ``index`` must not precede the newest month; the newest month is
+        replaced and later ones appended, zero-filling any gap.
+        """
+        row = [counts.get(channel, 0) for channel in self.channels]
+        if self.start is None:
+            self.start = index
+        elif index == self.last:
+            self.rows.pop()
+            self.prefix.pop()
+        while self.last is not None and self.last < index - 1:
+            self._append([0] * len(self.channels))
+        self._append(row)
+
+    def _append(self, row):
+        self.rows.append(row)
+        self.prefix.append([p + v for p, v in zip(self.prefix[-1], row, strict=True)])
+
+    def periods(self, months):
+        """Row indexes of the last ``months`` months."""
+        return range(max(0, len(self.rows) - months), len(self.rows))
+
+    def labels(self, months):
+        """``YYYY-MM`` labels of the last ``months`` months."""
+        return [month_label(self.start + i) for i in self.periods(months)]
+
+    def growth(self, months):
+        """Month-over-month change in percent (None without a base)."""
+        values, totals = [], []
+        for i in self.periods(months):
+            if i == 0:
+                values.append([None] * len(self.channels))
+                totals.append(None)
+                continue
+            previous, current = self.rows[i - 1], self.rows[i]
+            values.append(
+                [percent(c - p, p) for p, c in zip(previous, current, strict=True)]
+            )
+            totals.append(percent(sum(current) - sum(previous), sum(previous)))
+        return values, totals
+
+    def mix(self, months):
+        """Each channel's share of the month's signups, in percent."""
+        values, totals = [], []
+        for i in self.periods(months):
+            total = sum(self.rows[i])
+            values.append([percent(v, total) for v in self.rows[i]])
+            totals.append(total)
+        return values, totals
+
+    def rolling(self, window, months):
+        """Sums over the trailing ``window`` months (None until complete)."""
+        values, totals = [], []
+        for i in self.periods(months):
+            if i + 1 < window:
+                values.append([None] * len(self.channels))
+                totals.append(None)
+                continue
+            row = [
+                end - begin
+                for begin, end in zip(
+                    self.prefix[i + 1 - window], self.prefix[i + 1], strict=True
+                )
+            ]
+            values.append(row)
+            totals.append(sum(row))
+        return values, totals
+
+
+def read_months(since=None):
+    """``{month index: {channel: signups}}`` for months from ``since`` on."""
+    rows = SignupByChannel.objects.all()
+    if since is not None:
+        year, month = divmod(since, 12)
+        rows = rows.filter(Q(year__gt=year) | Q(year=year, month__gte=month + 1))
+    months = {}
+    for year, month, channel, signups in rows.values_list(
+        "year", "month", "channel", "signups"
+    ):
+        months.setdefault(month_index(year, month), {})[channel] = signups
+    return months
+
+
+def older_checksum(matrix, using="analytics"):
+    """``(rows, signups, weighted signups)`` of the months before the newest.
+
+    Signups are weighted by month and channel, so an in-place upsert of an
+    older month changes the checksum even when the month's total does not.
+    """
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    year, month = divmod(matrix.last, 12)
+    cases = " ".join(f"WHEN %s THEN {j + 1}" for j in range(len(matrix.channels)))
+    weight = len(matrix.channels) + 1
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT COUNT(*), SUM({qn('signups')}), SUM({qn('signups')} * "
+            f"(({qn('year')} * 12 + {qn('month')} - 1) * {weight} + "
+            f"CASE {qn('channel')} {cases} ELSE 0 END)) "
+            f"FROM {qn(SignupByChannel._meta.db_table)} "
+            f"WHERE ({qn('year')}, {qn('month')}) < (%s, %s)",
+            [*matrix.channels, year, month + 1],
+        )
+        rows, total, weighted = cursor.fetchone()
+    return rows, total or 0, weighted or 0
+
+
+def build_matrix():
+    months = read_months()
+    channels = sorted({channel for counts in months.values() for channel in counts})
+    matrix = SignupMatrix(channels)
+    for index, counts in sorted(months.items()):
+        matrix.set_month(index, counts)
+    matrix.loaded = sum(len(counts) for counts in months.values())
+    matrix.newest_rows = len(months[matrix.last]) if months else 0
+    return matrix
+
+
+def refresh_matrix(matrix, row_count):
+    """Apply rows from the newest loaded month on, or rebuild if needed.
+
+    Returns the refreshed matrix (a new one after a rebuild).
+    """
+    if matrix.last is None:
+        return build_matrix()
+    months = read_months(since=matrix.last)
+    loaded = matrix.loaded - matrix.newest_rows
+    loaded += sum(len(counts) for counts in months.values())
+    channels = {channel for counts in months.values() for channel in counts}
+    if (
+        not months
+        or loaded != row_count
+        or not channels <= set(matrix.channels)
+        or older_checksum(matrix) != matrix.checksum()
+    ):
+        return build_matrix()
+    for index, counts in sorted(months.items()):
+        matrix.set_month(index, counts)
+    matrix.loaded = loaded
+    matrix.newest_rows = len(months[matrix.last])
+    return matrix
+
+
+class MatrixStore:
+    """Per-process signup matrix, refreshed when the table's version moves."""
+
+    table = SignupByChannel._meta.db_table
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._version = None
+
+    def get(self):
+        version = data_version.get((self.table,))
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = build_matrix()
+            elif version != self._version:
+                row_count = version[1][0]
+                self._matrix = refresh_matrix(self._matrix, row_count)
+            self._version = version
+            return self._matrix
+
+    def clear(self):
+        with self._lock:
+            self._matrix = None
+            self._version = None
+
+
+matrices = MatrixStore()
@@ -0,0 +1,172 @@
+"""Period-over-period comparison of a daily metric.
+
+``/analytics/compare`` answers "this week vs last week" and "this month vs
+the same month last year" in one statement. The current window runs from
+the start of the period containing the anchor date up to that date. The
+comparison window covers the same number of days, either at the start of
+the previous period (``against=previous``) or one year earlier
+(``against=yoy``). Days and weeks go back 364 days so weekdays line up;
+months, quarters and years keep their calendar dates.
+
+Both windows are summed by one range scan over the indexed date column,
+from the earlier window's start to the later one's end. ``CASE`` sends each
+row to the window it falls in, if any.
+"""
+
+from datetime import date, timedelta
+from typing import NamedTuple
+
+from django.db import connections
+
+from .cohorts import percent
+from .query import METRICS, SOURCES, ms_placeholder
+
+PERIODS = ("day", "week", "month", "quarter", "year")
+AGAINST = ("previous", "yoy")
+# Compare metric -> /analytics/query metric.
+COMPARE_METRICS = {
+    "visits": "visits",
+    "sessions": "sessions",
+    "revenue": "revenue_cents",
+}
+
+
+class Window(NamedTuple):
+    """Local dates from ``start`` to ``end``, inclusive."""
+
+    start: date
+    end: date
+
+    def shift(self, days):
+        return Window(
+            self.start - timedelta(days=days), self.end - timedelta(days=days)
+        )
+
+
+class WindowTotal(NamedTuple):
+    """A window's total, as stored (revenue in cents)."""
+
+    window: Window
+    value: int  # sum over the window (0 without data)
+    days: int  # stored days with data in the window
+
+
+class Comparison(NamedTuple):
+    """Both windows' totals for one metric."""
+
+    metric: str
+    period: str
+    against: str
+    current: WindowTotal
+    comparison: WindowTotal
+
+    @property
+    def change(self):
+        return self.current.value - self.comparison.value
+
+    @property
+    def change_pct(self):
+        """Change relative to the comparison window (None if it is 0)."""
+        return percent(self.change, self.comparison.value)
+
+
+def period_start(day, period):
+    """First date of the ``period`` containing ``day``."""
+    if period == "day":
+        return day
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    if period == "quarter":
+        return day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+    return day.replace(month=1, day=1)
+
+
+def year_earlier(day):
+    """The same date a year earlier (Feb 29 becomes Feb 28)."""
+    try:
+        return day.replace(year=day.year - 1)
+    except ValueError:
+        return day.replace(year=day.year - 1, day=28)
+
+
+def windows(anchor, period, against):
+    """``(current, comparison)`` windows for ``anchor``."""
+    current = Window(period_start(anchor, period), anchor)
+    if period in ("day", "week"):
+        days = 364 if against == "yoy" else (1 if period == "day" else 7)
+        return current, current.shift(days)
+    if against == "yoy":
+        return current, Window(year_earlier(current.start), year_earlier(anchor))
+    previous_end = current.start - timedelta(days=1)
+    start = period_start(previous_end, period)
+    end = min(start + (anchor - current.start), previous_end)
+    return current, Window(start, end)
+
+
+def compile_comparison(metric, current, comparison, calendar, connection, table=None):
+    """``(sql, params)`` summing ``metric`` over both windows in one scan.
+
+    ``table`` replaces the source's quoted table name.
+    """
+    source_metric = METRICS[COMPARE_METRICS[metric]]
+    source = SOURCES[source_metric.source]
+    qn = connection.ops.quote_name
+    table = table or qn(source.table)
+    date_column = qn(source.column(source.time_field))
+    value = qn(source.column(source_metric.field))
+    placeholder = ms_placeholder(connection)
+
+    def bounds(window):
+        return [
+            calendar.day_of(window.start).start_ms,
+            calendar.day_of(window.end + timedelta(days=1)).start_ms,
+        ]
+
+    inside = f"{date_column} >= {placeholder} AND {date_column} < {placeholder}"
+    selects, params = [], []
+    for window in (current, comparison):
+        selects += [
+            f"SUM(CASE WHEN {inside} THEN {value} END)",
+            f"COUNT(CASE WHEN {inside} THEN 1 END)",
+        ]
+        params += bounds(window) * 2
+    low = min(bounds(current)[0], bounds(comparison)[0])
+    high = max(bounds(current)[1], bounds(comparison)[1])
+    sql = f"SELECT {', '.join(selects)} FROM {table} WHERE {inside}"
+    return sql, params + [low, high]
+
+
+def compare(metric, period, against, anchor, calendar, using="analytics"):
+    """Totals of ``metric`` for the current and comparison windows."""
+    current, comparison = windows(anchor, period, against)
+    connection = connections[using]
+    tables = [None]
+    if connection.vendor == "sqlite":
+        from .retention import archived_source_table
+
+        source = SOURCES[METRICS[COMPARE_METRICS[metric]].source]
+        start = calendar.day_of(min(current.start, comparison.start)).start_ms
+        archived = archived_source_table(connection, source, start)
+        if archived:
+            tables.append(archived)
+    totals = [0, 0, 0, 0]
+    for table in tables:
+        sql, params = compile_comparison(
+            metric, current, comparison, calendar, connection, table
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            totals = [
+                total + (value or 0)
+                for total, value in zip(totals, cursor.fetchone(), strict=True)
+            ]
+    current_sum, current_days, previous_sum, previous_days = totals
+    return Comparison(
+        metric,
+        period,
+        against,
+        WindowTotal(current, current_sum, current_days),
+        WindowTotal(comparison, previous_sum, previous_days),
+    )
@@ -0,0 +1,138 @@
+"""Calendar (date dimension) for bucketing Unix-millisecond timestamps.
+
+All analytics dates are stored as Unix timestamps in milliseconds. Turning
+one into a label used to mean a ``datetime.fromtimestamp`` call in the
+server's local timezone plus ``strftime`` per row. A :class:`Calendar` maps
+timestamps to local day numbers with integer arithmetic and caches one
+:class:`Day` record (labels, ISO week, month, quarter) per local day, so
+repeated days cost a dict lookup.
+
+Calendars are per timezone; ``get_calendar()`` returns the one for
+``settings.TIME_ZONE`` and views pass a per-request ``tz`` through.
+"""
+
+from datetime import date, datetime
+from functools import lru_cache
+from typing import NamedTuple
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+
+DAY_MS = 86_400_000
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+MONTH_ABBR = (
+    "Jan", "Feb", "Mar", "Apr", "May", "Jun",
+    "Jul", "Aug", "Sep", "Oct", "Nov", "Dec",
+)  # fmt: skip
+GRANULARITIES = ("day", "week", "month", "quarter")
+
+_MISSING = object()
+
+
+class Day(NamedTuple):
+    """One local calendar day."""
+
+    index: int  # local days since 1970-01-01
+    start_ms: int  # local midnight as a Unix timestamp (ms)
+    date: date
+    iso_date: str  # "2024-01-05"
+    label: str  # "Jan 5"
+    week: str  # ISO week, "2024-W01"
+    month: str  # "2024-01"
+    quarter: str  # "2024-Q1"
+
+
+class Calendar:
+    """Timezone-aware day bucketing with cached day records."""
+
+    def __init__(self, tz_name):
+        self.tz_name = tz_name
+        self.tz = ZoneInfo(tz_name)
+        self._days = {}
+        # UTC day index -> offset (ms) valid for the whole UTC day, or None
+        # when a DST transition falls inside that day.
+        self._offsets = {}
+
+    def __repr__(self):
+        return f"Calendar({self.tz_name!r})"
+
+    def offset_ms(self, timestamp_ms):
+        """UTC offset (ms) of ``self.tz`` at ``timestamp_ms``."""
+        utc_day = timestamp_ms // DAY_MS
+        offset = self._offsets.get(utc_day, _MISSING)
+        if offset is _MISSING:
+            first = self._utcoffset_ms(utc_day * DAY_MS)
+            last = self._utcoffset_ms(utc_day * DAY_MS + DAY_MS - 1)
+            offset = first if first == last else None
+            self._offsets[utc_day] = offset
+        if offset is None:
+            return self._utcoffset_ms(timestamp_ms)
+        return offset
+
+    def day_index(self, timestamp_ms):
+        """Local days since 1970-01-01 for ``timestamp_ms``."""
+        return (timestamp_ms + self.offset_ms(timestamp_ms)) // DAY_MS
+
+    def day(self, timestamp_ms):
+        """The :class:`Day` containing ``timestamp_ms``."""
+        index = self.day_index(timestamp_ms)
+        day = self._days.get(index)
+        if day is None:
+            day = self._days[index] = self._build_day(index)
+        return day
+
+    def day_of(self, value):
+        """The :class:`Day` for a ``datetime.date`` in this timezone."""
+        index = value.toordinal() - EPOCH_ORDINAL
+        day = self._days.get(index)
+        if day is None:
+            day = self._days[index] = self._build_day(index)
+        return day
+
+    def label(self, timestamp_ms):
+        """Short label such as 'Jan 5', or None for a missing timestamp."""
+        if timestamp_ms is None:
+            return None
+        return self.day(timestamp_ms).label
+
+    def bucket(self, timestamp_ms, granularity):
+        """Bucket key for ``granularity`` (day, week, month or quarter)."""
+        day = self.day(timestamp_ms)
+        return day.iso_date if granularity == "day" else getattr(day, granularity)
+
+    def to_datetime(self, timestamp_ms):
+        """Aware datetime in this calendar's timezone."""
+        return datetime.fromtimestamp(timestamp_ms / 1000, tz=self.tz)
+
+    def _utcoffset_ms(self, timestamp_ms):
+        offset = self.to_datetime(timestamp_ms).utcoffset()
+        return offset.days * DAY_MS + offset.seconds * 1000
+
+    def _build_day(self, index):
+        day = date.fromordinal(EPOCH_ORDINAL + index)
+        midnight = datetime(day.year, day.month, day.day, tzinfo=self.tz)
+        iso_year, iso_week, _ = day.isocalendar()
+        return Day(
+            index=index,
+            start_ms=int(midnight.timestamp() * 1000),
+            date=day,
+            iso_date=day.isoformat(),
+            label=f"{MONTH_ABBR[day.month - 1]} {day.day}",
+            week=f"{iso_year}-W{iso_week:02d}",
+            month=f"{day.year}-{day.month:02d}",
+            quarter=f"{day.year}-Q{(day.month - 1) // 3 + 1}",
+        )
+
+
+@lru_cache(maxsize=64)
+def _calendar(tz_name):
+    return Calendar(tz_name)
+
+
+def get_calendar(tz_name=None):
+    """Return the shared calendar for ``tz_name`` (default TIME_ZONE).
+
+    Raises ``zoneinfo.ZoneInfoNotFoundError`` or ``ValueError`` for an
+    unknown or malformed timezone name.
+    """
+    return _calendar(tz_name or settings.TIME_ZONE)
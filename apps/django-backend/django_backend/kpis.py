@@ -0,0 +1,248 @@
+"""Incremental KPI computation from the fact tables.
+
+``KpiSnapshot`` used to be seeded separately and could drift from
+``TrafficDaily``/``RevenueDaily``. The engine here derives the same four
+values from the fact tables instead:
+
+* Total Users: cumulative signups across all months and channels
+* Sessions: trailing 30-day sum of ``TrafficDaily.sessions``
+* Conversion: latest month's signups as a percentage of trailing visits
+* Revenue: trailing 30-day sum of ``RevenueDaily.valueCents``
+
+Running totals are updated per ingested row in O(1) (amortized) rather than
+by rescanning history. The engine state is persisted to
+``ANALYTICS_STATE_DIR`` so each scheduled ``snapshot_kpis`` run only reads
+rows added since the previous run, plus the rows of the current window and
+month to pick up upserts. Running totals cannot subtract a row that is gone,
+so when fewer rows at or below a table's watermark remain than were ingested
+(rows were deleted, or archived by ``apply_retention``), the engine is
+rebuilt from all fact rows.
+"""
+
+import json
+import time
+from bisect import insort
+from pathlib import Path
+
+from django.conf import settings
+
+from .models import KpiSnapshot, RevenueDaily, SignupByChannel, TrafficDaily
+
+DAY_MS = 86_400_000
+STATE_VERSION = 2
+
+
+class RollingWindow:
+    """Per-day values and their sums over the trailing ``size`` days.
+
+    The window ends at the newest day seen. Re-adding a day replaces its
+    values (upsert semantics); days falling out of the window are evicted.
+    """
+
+    def __init__(self, width, size=30):
+        self.width = width
+        self.size = size
+        self.days = {}
+        self.totals = [0] * width
+        self.latest = None
+        self._order = []
+
+    def add(self, day, *values):
+        """Record ``values`` for ``day`` and update the running totals."""
+        if self.latest is not None and day <= self.latest - self.size * DAY_MS:
+            return
+        previous = self.days.get(day)
+        if previous is None:
+            insort(self._order, day)
+            previous = (0,) * self.width
+        self.days[day] = values
+        for i in range(self.width):
+            self.totals[i] += values[i] - previous[i]
+        if self.latest is None or day > self.latest:
+            self.latest = day
+            self._evict()
+
+    @property
+    def start(self):
+        """First day (ms) still inside the window, or None if empty."""
+        return self._order[0] if self._order else None
+
+    def _evict(self):
+        cutoff = self.latest - self.size * DAY_MS
+        while self._order and self._order[0] <= cutoff:
+            values = self.days.pop(self._order.pop(0))
+            for i in range(self.width):
+                self.totals[i] -= values[i]
+
+    def to_dict(self):
+        return {"size": self.size, "days": [[d, *v] for d, v in self.days.items()]}
+
+    @classmethod
+    def from_dict(cls, width, state):
+        window = cls(width, state["size"])
+        for day, *values in sorted(state["days"]):
+            window.add(day, *values)
+        return window
+
+
+class KpiEngine:
+    """Running KPI totals fed one fact row at a time."""
+
+    def __init__(self, window_days=30):
+        self.traffic = RollingWindow(2, window_days)
+        self.revenue = RollingWindow(1, window_days)
+        self.signups = {}
+        self.month_totals = {}
+        self.total_signups = 0
+        # Highest row id already ingested per fact table.
+        self.watermarks = {
+            "TrafficDaily": 0,
+            "RevenueDaily": 0,
+            "SignupByChannel": 0,
+        }
+        # Rows ingested per fact table, all at or below its watermark.
+        self.row_counts = dict.fromkeys(self.watermarks, 0)
+
+    def reset(self):
+        """Drop all state so the next sync reads every fact row."""
+        self.__init__(self.traffic.size)
+
+    def ingest_traffic(self, day, visits, sessions):
+        self.traffic.add(day, visits, sessions)
+
+    def ingest_revenue(self, day, valuecents):
+        self.revenue.add(day, valuecents)
+
+    def ingest_signups(self, year, month, channel, signups):
+        key = (year, month, channel)
+        delta = signups - self.signups.get(key, 0)
+        self.signups[key] = signups
+        self.month_totals[year, month] = (
+            self.month_totals.get((year, month), 0) + delta
+        )
+        self.total_signups += delta
+
+    def values(self):
+        """Return KpiSnapshot field values for the current totals."""
+        visits, sessions = self.traffic.totals
+        latest_month = max(self.month_totals, default=None)
+        month_signups = self.month_totals.get(latest_month, 0)
+        conversion = round(month_signups / visits * 100, 1) if visits else 0.0
+        return {
+            "totalusers": self.total_signups,
+            "sessions": sessions,
+            "conversionpct": conversion,
+            "revenuecents": self.revenue.totals[0],
+        }
+
+    def to_dict(self):
+        return {
+            "version": STATE_VERSION,
+            "traffic": self.traffic.to_dict(),
+            "revenue": self.revenue.to_dict(),
+            "signups": [[*key, value] for key, value in self.signups.items()],
+            "watermarks": self.watermarks,
+            "row_counts": self.row_counts,
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        engine = cls(state["traffic"]["size"])
+        engine.traffic = RollingWindow.from_dict(2, state["traffic"])
+        engine.revenue = RollingWindow.from_dict(1, state["revenue"])
+        for year, month, channel, signups in state["signups"]:
+            engine.ingest_signups(year, month, channel, signups)
+        engine.watermarks.update(state["watermarks"])
+        engine.row_counts.update(state["row_counts"])
+        return engine
+
+
+def state_path():
+    return Path(settings.ANALYTICS_STATE_DIR) / "kpi_engine.json"
+
+
+def load_engine():
+    """Load the persisted engine, or a fresh one if none is usable."""
+    try:
+        state = json.loads(state_path().read_text())
+    except (FileNotFoundError, ValueError):
+        return KpiEngine()
+    if state.get("version") != STATE_VERSION:
+        return KpiEngine()
+    return KpiEngine.from_dict(state)
+
+
+def save_engine(engine):
+    """Persist engine state atomically."""
+    path = state_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(engine.to_dict()))
+    tmp.replace(path)
+
+
+def rows_removed(engine):
+    """Whether rows ``engine`` already ingested were deleted since."""
+    for model in (TrafficDaily, RevenueDaily, SignupByChannel):
+        table = model._meta.db_table
+        remaining = model.objects.filter(id__lte=engine.watermarks[table]).count()
+        if remaining < engine.row_counts[table]:
+            return True
+    return False
+
+
+def sync_engine(engine):
+    """Feed rows written since the last sync into ``engine``.
+
+    Reads rows above each table's id watermark, plus rows inside the current
+    rolling window and latest month so in-place upserts are applied. Every
+    read is a range over the primary key or a date/(year, month) index. If
+    ingested rows were deleted, the engine is reset and reads everything.
+    """
+    if rows_removed(engine):
+        engine.reset()
+    marks, counts = engine.watermarks, engine.row_counts
+
+    def ingest(rows, table, apply, new=False):
+        for row_id, *values in rows:
+            apply(*values)
+            marks[table] = max(marks[table], row_id)
+            counts[table] += new
+
+    for model, window, apply, fields in (
+        (TrafficDaily, engine.traffic, engine.ingest_traffic, ("visits", "sessions")),
+        (RevenueDaily, engine.revenue, engine.ingest_revenue, ("valuecents",)),
+    ):
+        table = model._meta.db_table
+        fields = ("id", "date_int", *fields)
+        new_rows = model.objects.filter(id__gt=marks[table]).values_list(*fields)
+        ingest(new_rows.iterator(chunk_size=10_000), table, apply, new=True)
+        if window.start is not None:
+            recent = model.objects.filter(date__gte=window.start)
+            ingest(recent.values_list(*fields), table, apply)
+
+    fields = ("id", "year", "month", "channel", "signups")
+    new_rows = SignupByChannel.objects.filter(id__gt=marks["SignupByChannel"])
+    ingest(
+        new_rows.values_list(*fields),
+        "SignupByChannel",
+        engine.ingest_signups,
+        new=True,
+    )
+    if engine.month_totals:
+        year, month = max(engine.month_totals)
+        current = SignupByChannel.objects.filter(year=year, month=month)
+        ingest(
+            current.values_list(*fields), "SignupByChannel", engine.ingest_signups
+        )
+    return engine
+
+
+def write_snapshot(engine, captured_at=None):
+    """Write the engine's current values as a KpiSnapshot row."""
+    if captured_at is None:
+        captured_at = int(time.time() * 1000)
+    snapshot, _ = KpiSnapshot.objects.update_or_create(
+        capturedat=captured_at, defaults=engine.values()
+    )
+    return snapshot
@@ -0,0 +1,60 @@
+"""Archive old daily facts and compact the analytics database."""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from django_backend.dates import get_calendar
+from django_backend.retention import apply_retention
+
+
+class Command(BaseCommand):
+    help = (
+        "Move TrafficDaily, RevenueDaily and DeviceShare rows older than the "
+        "start of the month --keep-days ago into the archive SQLite file, "
+        "with monthly aggregates of them, then vacuum the database. Queries "
+        "reaching back past the cutoff read the archive too."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--keep-days",
+            type=int,
+            default=None,
+            help="Days to keep live (default ANALYTICS_RETENTION_DAYS).",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report how many rows would move.",
+        )
+        parser.add_argument(
+            "--no-vacuum",
+            action="store_true",
+            help="Leave the freed pages in the database file.",
+        )
+
+    def handle(self, *args, keep_days=None, dry_run=False, no_vacuum=False, **options):
+        if keep_days is None:
+            keep_days = getattr(settings, "ANALYTICS_RETENTION_DAYS", 400)
+        try:
+            report = apply_retention(keep_days, dry_run=dry_run, vacuum=not no_vacuum)
+        except ValueError as error:
+            raise CommandError(str(error)) from None
+        verb = "would move" if dry_run else "moved"
+        calendar = get_calendar()
+        for table, item in report["tables"].items():
+            cutoff = calendar.day(item["cutoff"]).iso_date
+            self.stdout.write(
+                f"{table}: {verb} {item['moved']} rows before {cutoff} "
+                f"to {report['archive']}"
+                + ("" if dry_run else f" ({item['months']} monthly rows)")
+            )
+        if not report["tables"]:
+            self.stdout.write("Nothing old enough to archive")
+        vacuum = report["vacuum"]
+        if vacuum:
+            self.stdout.write(
+                f"Vacuum ({vacuum['mode']}): {vacuum['bytes_before']:,} -> "
+                f"{vacuum['bytes_after']:,} bytes, {vacuum['reclaimed']:,} "
+                f"reclaimed; archive {report['archive_bytes']:,} bytes"
+            )
@@ -0,0 +1,32 @@
+"""Trim acknowledged entries from the analytics change log."""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django_backend.changes import compact_changes, last_seq, log_installed
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete AnalyticsChange entries that every registered consumer has "
+        "acknowledged, keeping the newest entry of each table. Schedule it "
+        "after the consumers' runs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--upto",
+            type=int,
+            default=None,
+            help="Delete no entries after this sequence number.",
+        )
+
+    def handle(self, *args, upto=None, **options):
+        if not log_installed():
+            raise CommandError(
+                "no change log on the analytics database; apply the Prisma "
+                "migrations (prisma/migrations)"
+            )
+        deleted = compact_changes(upto)
+        self.stdout.write(
+            f"Deleted {deleted} change log entries (last seq {last_seq()})"
+        )
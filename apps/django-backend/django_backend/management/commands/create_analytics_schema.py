@@ -0,0 +1,26 @@
+"""Create the analytics tables on a PostgreSQL analytics database."""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from django_backend.schema import create_postgres_schema
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the analytics tables (timestamptz dates, B-tree and BRIN "
+        "indexes) on the PostgreSQL analytics database. Idempotent."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default="analytics")
+
+    def handle(self, *args, database="analytics", **options):
+        connection = connections[database]
+        if connection.vendor != "postgresql":
+            raise CommandError(
+                f"{database} is {connection.vendor}; Prisma manages the SQLite "
+                f"schema (prisma/migrations)"
+            )
+        create_postgres_schema(connection)
+        self.stdout.write(f"analytics schema ready on {database}")
@@ -0,0 +1,33 @@
+"""Bring the persisted anomaly detector up to date."""
+
+from django.core.management.base import BaseCommand
+
+from django_backend.anomalies import (
+    AnomalyDetector,
+    load_detector,
+    save_detector,
+    sync_detector,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Score traffic and revenue days added since the last run against "
+        "their weekday baselines and save the detector to ANALYTICS_STATE_DIR."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Discard persisted state and rescore the full history.",
+        )
+
+    def handle(self, *args, rebuild=False, **options):
+        detector = AnomalyDetector() if rebuild else load_detector()
+        sync_detector(detector)
+        save_detector(detector)
+        marks = ", ".join(
+            f"{table} id {mark}" for table, mark in detector.watermarks.items()
+        )
+        self.stdout.write(f"{len(detector.flags)} flagged days (watermarks: {marks})")
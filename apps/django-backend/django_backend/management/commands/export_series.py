@@ -0,0 +1,45 @@
+"""Write the daily time series to memory-mapped columnar files."""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django_backend.series import SERIES, export, series_path
+
+
+class Command(BaseCommand):
+    help = (
+        "Export TrafficDaily and RevenueDaily to the columnar files workers "
+        "map when ANALYTICS_SERVE_SERIES is on. Tables unchanged since their "
+        "last export are skipped. Schedule it after ingest, or pass --interval "
+        "to keep it running."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Rewrite the files even if their data version is current.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=None,
+            help="Seconds between exports; run once if omitted.",
+        )
+
+    def handle(self, *args, force=False, interval=None, **options):
+        while True:
+            for table in SERIES:
+                try:
+                    rows = export(table, force=force)
+                except ValueError as exc:
+                    raise CommandError(str(exc)) from None
+                if rows is None:
+                    self.stdout.write(f"{table}: unchanged")
+                else:
+                    self.stdout.write(f"{table}: {rows} rows to {series_path(table)}")
+            if interval is None:
+                return
+            force = False
+            time.sleep(interval)
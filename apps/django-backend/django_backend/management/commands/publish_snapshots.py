@@ -0,0 +1,45 @@
+"""Pre-render the analytics endpoints into static snapshot files."""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django_backend.snapshots import publish, snapshot_dir
+from django_backend.views import SNAPSHOT_VIEWS
+
+
+class Command(BaseCommand):
+    help = (
+        "Render every published endpoint for all supported parameter values "
+        "into content-addressed files with precompressed variants. Only "
+        "endpoints whose source tables changed since the last run are "
+        "re-rendered; run after each ingest."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Re-render every endpoint, changed or not.",
+        )
+        parser.add_argument(
+            "--endpoint",
+            action="append",
+            choices=sorted(SNAPSHOT_VIEWS),
+            help="Only publish this endpoint (repeatable); others are dropped "
+            "from the manifest.",
+        )
+
+    def handle(self, *args, force=False, endpoint=None, **options):
+        views = {
+            name: view
+            for name, view in SNAPSHOT_VIEWS.items()
+            if not endpoint or name in endpoint
+        }
+        if not views:
+            raise CommandError("no endpoints to publish")
+        stats = publish(views, force=force)
+        self.stdout.write(
+            f"Published {len(views)} endpoints to {snapshot_dir()}: "
+            f"{stats['rendered']} variants rendered, {stats['kept']} unchanged, "
+            f"{stats['objects']} distinct bodies, {stats['removed']} stale "
+            f"files removed"
+        )
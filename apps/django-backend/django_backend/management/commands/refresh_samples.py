@@ -0,0 +1,35 @@
+"""Bring the persisted reservoir samples up to date."""
+
+from django.core.management.base import BaseCommand
+
+from django_backend.query import SAMPLED_SOURCES
+from django_backend.sampling import (
+    load_sample,
+    new_sample,
+    save_sample,
+    sync_sample,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Offer rows added since the last run to the reservoir samples behind "
+        "accuracy=approx queries and save them to ANALYTICS_STATE_DIR."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Discard persisted samples and resample all rows.",
+        )
+
+    def handle(self, *args, rebuild=False, **options):
+        for source_name in SAMPLED_SOURCES:
+            reservoir = new_sample(source_name) if rebuild else load_sample(source_name)
+            sync_sample(reservoir, source_name)
+            save_sample(reservoir, source_name)
+            self.stdout.write(
+                f"{source_name}: {len(reservoir.rows)} of {reservoir.seen} rows "
+                f"sampled (watermark id {reservoir.watermark})"
+            )
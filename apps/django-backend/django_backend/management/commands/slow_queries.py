@@ -0,0 +1,48 @@
+"""Summarize the analytics slow-query log."""
+
+from django.core.management.base import BaseCommand
+
+from django_backend.slow_queries import log_path, read_log, summarize
+
+
+class Command(BaseCommand):
+    help = (
+        "List the statements in the analytics slow-query log with the most "
+        "total time, with their callers and query plans."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=10,
+            help="Number of statements to show (default 10).",
+        )
+        parser.add_argument(
+            "--no-plans",
+            action="store_true",
+            help="Leave out the query plans.",
+        )
+
+    def handle(self, *args, top=10, no_plans=False, **options):
+        records = read_log()
+        if not records:
+            self.stdout.write(f"No slow queries logged in {log_path()}")
+            return
+        stats = summarize(records)
+        self.stdout.write(
+            f"{len(records)} slow statements, {len(stats)} distinct "
+            f"(showing {min(top, len(stats))})"
+        )
+        for rank, item in enumerate(stats[:top], 1):
+            self.stdout.write(
+                f"\n#{rank} total {item['total_ms']:.1f} ms, {item['count']} "
+                f"calls, avg {item['total_ms'] / item['count']:.1f} ms, "
+                f"max {item['max_ms']:.1f} ms"
+            )
+            for where in item["callers"]:
+                self.stdout.write(f"  from {where}")
+            self.stdout.write(f"  {item['sql']}")
+            if item["plan"] and not no_plans:
+                for line in item["plan"]:
+                    self.stdout.write(f"    {line}")
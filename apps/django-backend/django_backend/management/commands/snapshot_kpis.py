@@ -0,0 +1,50 @@
+"""Write a KpiSnapshot derived from the fact tables."""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from django_backend.kpis import (
+    KpiEngine,
+    load_engine,
+    save_engine,
+    sync_engine,
+    write_snapshot,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Update the running KPI totals from rows ingested since the last run "
+        "and write a KpiSnapshot. Schedule it after ingest or via cron, or "
+        "pass --interval to keep it running."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Discard persisted state and recompute from all fact rows.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=None,
+            help="Seconds between snapshots; run once if omitted.",
+        )
+
+    def handle(self, *args, rebuild=False, interval=None, **options):
+        engine = KpiEngine() if rebuild else load_engine()
+        while True:
+            sync_engine(engine)
+            save_engine(engine)
+            snapshot = write_snapshot(engine)
+            self.stdout.write(
+                f"KpiSnapshot {snapshot.capturedat}: "
+                f"users={snapshot.totalusers} sessions={snapshot.sessions} "
+                f"conversion={snapshot.conversionpct}% "
+                f"revenue={snapshot.revenuecents}c"
+            )
+            if interval is None:
+                return
+            time.sleep(interval)
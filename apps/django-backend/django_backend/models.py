@@ -2,93 +2,447 @@
 
 These models map to the Prisma database tables in prisma/dev.db.
 They are read-only (managed=False) since Prisma manages the schema.
+
+The same models also run against a PostgreSQL ``analytics`` alias, whose
+tables store dates as ``timestamptz`` (see sql/postgresql.sql). Either way
+Python sees dates as Unix milliseconds: :class:`EpochMillisField` converts
+values on the way in and out, and :class:`EpochMillis` selects a date
+column as milliseconds in SQL.
+
+The managers' read paths return read-only rows (see
+:meth:`AnalyticsQuerySet.rows`) rather than model instances, from SQL
+compiled once per query shape (see :class:`compiled_query`).
 """
 
-from datetime import datetime
+from collections import namedtuple
+from datetime import UTC, datetime
+from typing import NamedTuple
+
+from django.db import connections, models
+from django.db.models import Subquery
+from django.db.models.query import ValuesListIterable
+
+from .dates import get_calendar
+
+
+def timestamp_to_datetime(timestamp_ms):
+    """Convert a Unix timestamp (ms) to an aware datetime in TIME_ZONE."""
+    if timestamp_ms:
+        return get_calendar().to_datetime(timestamp_ms)
+    return None
+
+
+class EpochMillisField(models.BigIntegerField):
+    """A date stored by the backend, exposed as Unix milliseconds.
+
+    SQLite (Prisma) keeps the milliseconds themselves; PostgreSQL keeps a
+    ``timestamptz``. On SQLite the column is declared DATETIME, whose driver
+    converter mangles integers, so read it through :class:`EpochMillis`.
+    """
+
+    def db_type(self, connection):
+        if connection.vendor == "postgresql":
+            return "timestamptz"
+        return super().db_type(connection)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if connection.vendor == "postgresql" and isinstance(value, int):
+            return datetime.fromtimestamp(value / 1000, tz=UTC)
+        return super().get_db_prep_value(value, connection, prepared)
+
+    def from_db_value(self, value, expression, connection):
+        if isinstance(value, datetime):
+            return round(value.timestamp() * 1000)
+        return value
+
+
+class EpochMillis(models.Func):
+    """Select a date column as Unix milliseconds on any backend.
+
+    Filter and order on the raw column so its index is used; only wrap the
+    selected value.
+    """
+
+    template = "CAST(%(expressions)s AS BIGINT)"
+    output_field = models.BigIntegerField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler,
+            connection,
+            template="(EXTRACT(EPOCH FROM %(expressions)s) * 1000)::bigint",
+            **extra_context,
+        )
+
+
+class RowIterable(ValuesListIterable):
+    """Yield the model's ``Row`` for each cursor tuple."""
+
+    def __iter__(self):
+        return map(self.queryset.model.Row._make, super().__iter__())
+
+
+class AnalyticsQuerySet(models.QuerySet):
+    def rows(self):
+        """Read-only rows instead of model instances.
+
+        Each row is a namedtuple of the model's ``Row`` class, built straight
+        from the cursor tuple: no ``__init__``, signals or ``_state``. Rows
+        have the model's field names (dates as Unix milliseconds) and the
+        model's read-only properties such as ``date_datetime``.
+        """
+        clone = self.values_list(*self.model.Row.columns)
+        clone._iterable_class = RowIterable
+        return clone
+
+
+AnalyticsManager = models.Manager.from_queryset(AnalyticsQuerySet)
+
+# Compiled in place of LIMIT arguments, then replaced by placeholders.
+LIMIT_MARKER = 987_654_300
+
+
+class Statement(NamedTuple):
+    """A compiled manager query, ready to execute with new limits."""
+
+    sql: str
+    params: tuple
+    limits: tuple  # params index of each LIMIT argument
+    width: int | None  # selected columns, when the SQL selects extra ones
+    converters: list  # [(position, (functions, expression))] as in Django
+    make: type  # the model's Row._make, or tuple
+
+
+def parameterize_limits(sql, params, count):
+    """Replace the marker LIMITs of ``count`` arguments by placeholders.
+
+    Returns ``(sql, params, positions)``, ``positions`` holding each
+    argument's index in ``params``.
+    """
+    params = list(params)
+    markers = []
+    for arg in range(count):
+        text = f"LIMIT {LIMIT_MARKER + arg}"
+        if sql.count(text) != 1:
+            raise ValueError(f"limit argument {arg} is not a single LIMIT: {sql}")
+        markers.append((sql.index(text), arg, text))
+    positions = [None] * count
+    # Left to right: a placeholder's index counts those inserted before it.
+    for _, arg, text in sorted(markers):
+        start = sql.index(text)
+        sql = f"{sql[:start]}LIMIT %s{sql[start + len(text) :]}"
+        positions[arg] = sql[:start].count("%s")
+        params.insert(positions[arg], None)
+    return sql, tuple(params), tuple(positions)
+
+
+class compiled_query:
+    """Manager method whose queryset is compiled to SQL once.
+
+    The decorated method builds a ``values_list`` or :meth:`rows` queryset
+    from integer LIMIT arguments (``[:limit]`` slices, also in subqueries).
+    It is built and compiled once per model and database alias, with marker
+    values that become placeholders. Calls then run that statement with
+    their limits on the alias's cursor: no QuerySet clone, no compiler, no
+    expression resolving. Rows come back as the ORM would return them, after
+    the same converters, as a list. ``method.queryset(*limits)`` is the
+    equivalent ORM queryset.
+    """
+
+    def __init__(self, build):
+        self.build = build
+        self.statements = {}
+        self.__doc__ = build.__doc__
+
+    def __get__(self, manager, owner=None):
+        if manager is None:
+            return self
+        return BoundCompiledQuery(self, manager)
+
+    def compile(self, manager, count):
+        queryset = self.build(manager, *range(LIMIT_MARKER, LIMIT_MARKER + count))
+        compiler = queryset.query.get_compiler(manager.db)
+        sql, params = compiler.as_sql()
+        sql, params, limits = parameterize_limits(sql, params, count)
+        fields = [column for column, _, _ in compiler.select[: compiler.col_count]]
+        row = queryset.model.Row if queryset._iterable_class is RowIterable else None
+        return Statement(
+            sql,
+            params,
+            limits,
+            compiler.col_count if compiler.has_extra_select else None,
+            list(compiler.get_converters(fields).items()),
+            row._make if row else tuple,
+        )
+
+
+class BoundCompiledQuery:
+    """A :class:`compiled_query` accessed on a manager."""
+
+    __slots__ = ("query", "manager")
+
+    def __init__(self, query, manager):
+        self.query = query
+        self.manager = manager
+
+    def queryset(self, *limits):
+        return self.query.build(self.manager, *limits)
+
+    def statement(self, count=0):
+        key = (self.manager.model, self.manager.db)
+        statement = self.query.statements.get(key)
+        if statement is None:
+            # Compiling twice in a race is harmless; both are identical.
+            statement = self.query.compile(self.manager, count)
+            self.query.statements[key] = statement
+        return statement
+
+    def __call__(self, *limits):
+        statement = self.statement(len(limits))
+        params = list(statement.params)
+        for position, limit in zip(statement.limits, limits, strict=True):
+            params[position] = limit
+        connection = connections[self.manager.db]
+        with connection.cursor() as cursor:
+            cursor.execute(statement.sql, params)
+            rows = cursor.fetchall()
+        if statement.width is not None:
+            rows = [row[: statement.width] for row in rows]
+        if statement.converters:
+            rows = convert_rows(rows, statement.converters, connection)
+        if statement.make is tuple and not statement.converters:
+            return rows
+        return list(map(statement.make, rows))
+
+
+def convert_rows(rows, converters, connection):
+    """Apply Django's field and backend converters, as the compiler does."""
+    for row in map(list, rows):
+        for position, (functions, expression) in converters:
+            value = row[position]
+            for function in functions:
+                value = function(value, expression, connection)
+            row[position] = value
+        yield row
+
+
+class DailyRow:
+    """Date properties of daily rows, as on the daily models."""
+
+    __slots__ = ()
+
+    @property
+    def date_int(self):
+        return self.date
+
+    @property
+    def date_ms(self):
+        """Unix timestamp (ms) of the row's day."""
+        return self.date
+
+    @property
+    def date_datetime(self):
+        """Convert Unix timestamp (ms) to an aware datetime in TIME_ZONE."""
+        return timestamp_to_datetime(self.date)
+
+
+class KpiSnapshotRow(
+    namedtuple(
+        "KpiSnapshotRow",
+        "id capturedat totalusers sessions conversionpct revenuecents",
+    )
+):
+    """Read-only :class:`KpiSnapshot` row."""
+
+    __slots__ = ()
+    columns = (
+        "id", "capturedat_int", "totalusers", "sessions", "conversionpct",
+        "revenuecents",
+    )  # fmt: skip
+
+    @property
+    def capturedat_int(self):
+        return self.capturedat
+
+
+class TrafficDailyRow(
+    DailyRow, namedtuple("TrafficDailyRow", "id date visits sessions")
+):
+    """Read-only :class:`TrafficDaily` row."""
+
+    __slots__ = ()
+    columns = ("id", "date_int", "visits", "sessions")
+
 
-from django.db import models
-from django.db.models.functions import Cast
+class RevenueDailyRow(DailyRow, namedtuple("RevenueDailyRow", "id date valuecents")):
+    """Read-only :class:`RevenueDaily` row."""
 
+    __slots__ = ()
+    columns = ("id", "date_int", "valuecents")
 
-class KpiSnapshotManager(models.Manager):
+
+class SignupByChannelRow(
+    namedtuple("SignupByChannelRow", "id year month channel signups")
+):
+    """Read-only :class:`SignupByChannel` row."""
+
+    __slots__ = ()
+    columns = ("id", "year", "month", "channel", "signups")
+
+
+class DeviceShareRow(
+    namedtuple("DeviceShareRow", "id snapshotdate device sharepct")
+):
+    """Read-only :class:`DeviceShare` row."""
+
+    __slots__ = ()
+    columns = ("id", "snapshotdate_int", "device", "sharepct")
+
+    @property
+    def snapshotdate_int(self):
+        return self.snapshotdate
+
+
+def recent_columns(rows, fields):
+    """Return newest-first ``rows`` as ascending columns keyed by field."""
+    rows = rows[::-1]
+    return {field: [row[i] for row in rows] for i, field in enumerate(fields)}
+
+
+class KpiSnapshotManager(AnalyticsManager):
     """Custom manager for KPI snapshots."""
 
     def get_queryset(self):
-        """Override to cast capturedat field to BigInteger."""
+        """Annotate capturedat as Unix milliseconds (capturedat_int)."""
         return super().get_queryset().annotate(
-            capturedat_int=Cast("capturedat", models.BigIntegerField())
+            capturedat_int=EpochMillis("capturedat")
         )
 
+    @compiled_query
+    def latest(self):
+        """The most recent snapshot, as a one-row list."""
+        return self.order_by("-capturedat").rows()[:1]
+
     def get_latest(self):
         """Get the most recent KPI snapshot."""
-        return self.order_by("-capturedat_int").first()
+        rows = self.latest()
+        return rows[0] if rows else None
 
 
 class KpiSnapshot(models.Model):
     """Key performance indicator snapshot."""
 
-    capturedat = models.BigIntegerField(db_column="capturedAt", unique=True)
+    capturedat = EpochMillisField(db_column="capturedAt", unique=True)
     totalusers = models.IntegerField(db_column="totalUsers")
     sessions = models.IntegerField()
     conversionpct = models.FloatField(db_column="conversionPct")
     revenuecents = models.IntegerField(db_column="revenueCents")
 
     objects = KpiSnapshotManager()
+    Row = KpiSnapshotRow
 
     class Meta:
         managed = False
         db_table = "KpiSnapshot"
 
 
-class TrafficDailyManager(models.Manager):
+class TrafficDailyManager(AnalyticsManager):
     """Custom manager for traffic data."""
 
     def get_queryset(self):
-        """Override to cast date field to BigInteger (Django SQLite datetime issue)."""
+        """Annotate date as Unix milliseconds (date_int)."""
         return super().get_queryset().annotate(
-            date_int=Cast("date", models.BigIntegerField())
+            date_int=EpochMillis("date")
         )
 
+    columns = ("date_int", "visits", "sessions")
+
+    @compiled_query
+    def newest(self, limit):
+        """The newest ``limit`` rows, newest first."""
+        return self.order_by("-date").rows()[:limit]
+
+    @compiled_query
+    def newest_columns(self, limit):
+        """The newest ``limit`` rows of :attr:`columns`, newest first."""
+        return self.order_by("-date").values_list(*self.columns)[:limit]
+
     def get_recent(self, limit=10):
         """Get recent traffic data, ordered by date ascending."""
-        results = list(self.order_by("-date_int")[:limit])
+        results = self.newest(limit)
         return reversed(results)  # Return in ascending order
 
+    def get_recent_columns(self, limit=10):
+        """Get recent traffic data as date/visits/sessions columns."""
+        return recent_columns(self.newest_columns(limit), self.columns)
+
 
 class TrafficDaily(models.Model):
     """Daily traffic data."""
 
-    date = models.BigIntegerField(unique=True, db_column="date")
+    date = EpochMillisField(unique=True, db_column="date")
     visits = models.IntegerField()
     sessions = models.IntegerField()
 
     objects = TrafficDailyManager()
+    Row = TrafficDailyRow
 
     @property
-    def date_datetime(self):
-        """Convert Unix timestamp (ms) to datetime."""
+    def date_ms(self):
+        """Unix timestamp (ms) of the row's day."""
         # Use annotated date_int if available, otherwise fall back to date
-        timestamp = getattr(self, 'date_int', self.date)
-        if timestamp:
-            return datetime.fromtimestamp(timestamp / 1000)
-        return None
+        return getattr(self, 'date_int', self.date)
+
+    @property
+    def date_datetime(self):
+        """Convert Unix timestamp (ms) to an aware datetime in TIME_ZONE."""
+        return timestamp_to_datetime(self.date_ms)
 
     class Meta:
         managed = False
         db_table = "TrafficDaily"
 
 
-class SignupByChannelManager(models.Manager):
+class SignupByChannelManager(AnalyticsManager):
     """Custom manager for signup data."""
 
+    @compiled_query
+    def latest_month(self):
+        """Rows of the most recent month, ordered by channel.
+
+        The latest (year, month) is resolved by subqueries inside the same
+        statement, both served by the (year, month) index.
+        """
+        latest = self.order_by("-year", "-month")
+        return self.filter(
+            year=Subquery(latest.values("year")[:1]),
+            month=Subquery(latest.values("month")[:1]),
+        ).order_by("channel").rows()
+
     def get_latest_month(self):
         """Get signups for the most recent month, ordered by channel."""
-        latest = self.order_by("-year", "-month").values("year", "month").first()
-        if not latest:
-            return self.none()
-        return self.filter(
-            year=latest["year"], month=latest["month"]
-        ).order_by("channel")
+        return self.latest_month()
+
+    def get_trend(self, months=12):
+        """Get (year, month, channel, signups) rows for the last N months.
+
+        Rows are ordered by period then channel. A single statement picks
+        the N most recent distinct months from the (year, month) index and
+        looks their rows up through the same index.
+        """
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        table = qn(self.model._meta.db_table)
+        sql = (
+            f"SELECT year, month, channel, signups FROM {table} "
+            f"WHERE (year, month) IN ("
+            f"SELECT DISTINCT year, month FROM {table} "
+            f"ORDER BY year DESC, month DESC LIMIT %s"
+            f") ORDER BY year, month, channel"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [months])
+            return cursor.fetchall()
 
 
 class SignupByChannel(models.Model):
@@ -100,6 +454,7 @@ class SignupByChannel(models.Model):
     signups = models.IntegerField()
 
     objects = SignupByChannelManager()
+    Row = SignupByChannelRow
 
     class Meta:
         managed = False
@@ -107,70 +462,116 @@ class SignupByChannel(models.Model):
         unique_together = (("year", "month", "channel"),)
 
 
-class RevenueDailyManager(models.Manager):
+class RevenueDailyManager(AnalyticsManager):
     """Custom manager for revenue data."""
 
     def get_queryset(self):
-        """Override to cast date field to BigInteger (Django SQLite datetime issue)."""
+        """Annotate date as Unix milliseconds (date_int)."""
         return super().get_queryset().annotate(
-            date_int=Cast("date", models.BigIntegerField())
+            date_int=EpochMillis("date")
         )
 
+    columns = ("date_int", "valuecents")
+
+    @compiled_query
+    def newest(self, limit):
+        """The newest ``limit`` rows, newest first."""
+        return self.order_by("-date").rows()[:limit]
+
+    @compiled_query
+    def newest_columns(self, limit):
+        """The newest ``limit`` rows of :attr:`columns`, newest first."""
+        return self.order_by("-date").values_list(*self.columns)[:limit]
+
     def get_recent(self, limit=10):
         """Get recent revenue data, ordered by date ascending."""
-        results = list(self.order_by("-date_int")[:limit])
+        results = self.newest(limit)
         return reversed(results)  # Return in ascending order
 
+    def get_recent_columns(self, limit=10):
+        """Get recent revenue data as date/valuecents columns."""
+        return recent_columns(self.newest_columns(limit), self.columns)
+
 
 class RevenueDaily(models.Model):
     """Daily revenue data."""
 
-    date = models.BigIntegerField(unique=True, db_column="date")
+    date = EpochMillisField(unique=True, db_column="date")
     valuecents = models.IntegerField(db_column="valueCents")
 
     objects = RevenueDailyManager()
+    Row = RevenueDailyRow
 
     @property
-    def date_datetime(self):
-        """Convert Unix timestamp (ms) to datetime."""
+    def date_ms(self):
+        """Unix timestamp (ms) of the row's day."""
         # Use annotated date_int if available, otherwise fall back to date
-        timestamp = getattr(self, 'date_int', self.date)
-        if timestamp:
-            return datetime.fromtimestamp(timestamp / 1000)
-        return None
+        return getattr(self, 'date_int', self.date)
+
+    @property
+    def date_datetime(self):
+        """Convert Unix timestamp (ms) to an aware datetime in TIME_ZONE."""
+        return timestamp_to_datetime(self.date_ms)
 
     class Meta:
         managed = False
         db_table = "RevenueDaily"
 
 
-class DeviceShareManager(models.Manager):
+class DeviceShareManager(AnalyticsManager):
     """Custom manager for device share data."""
 
     def get_queryset(self):
-        """Override to cast snapshotdate field to BigInteger."""
+        """Annotate snapshotdate as Unix milliseconds (snapshotdate_int)."""
         return super().get_queryset().annotate(
-            snapshotdate_int=Cast("snapshotdate", models.BigIntegerField())
+            snapshotdate_int=EpochMillis("snapshotdate")
         )
 
+    @compiled_query
+    def latest_snapshot(self):
+        """Rows of the most recent snapshot, ordered by device.
+
+        Filters on the raw column with a subquery so the lookup runs as one
+        statement over the snapshotDate index.
+        """
+        latest = self.order_by("-snapshotdate").values("snapshotdate")[:1]
+        return self.filter(snapshotdate=Subquery(latest)).order_by("device").rows()
+
     def get_latest_snapshot(self):
         """Get device shares for the most recent snapshot, ordered by device."""
-        latest = self.order_by("-snapshotdate_int").values("snapshotdate_int").first()
-        if not latest:
-            return self.none()
-        return self.filter(
-            snapshotdate_int=latest["snapshotdate_int"]
-        ).order_by("device")
+        return self.latest_snapshot()
+
+    @compiled_query
+    def trend(self, snapshots):
+        """(snapshotdate, device, sharepct) rows of the last N snapshots.
+
+        Rows are ordered by snapshot then device, in a single statement.
+        Filtering and ordering use the raw indexed column; only the selected
+        value is converted to milliseconds.
+        """
+        recent = (
+            self.order_by("-snapshotdate").values("snapshotdate").distinct()
+        )[:snapshots]
+        return (
+            self.filter(snapshotdate__in=recent)
+            .order_by("snapshotdate", "device")
+            .values_list("snapshotdate_int", "device", "sharepct")
+        )
+
+    def get_trend(self, snapshots=10):
+        """Get (snapshotdate, device, sharepct) rows for the last N snapshots."""
+        return self.trend(snapshots)
 
 
 class DeviceShare(models.Model):
     """Device share snapshot data."""
 
-    snapshotdate = models.BigIntegerField(db_column="snapshotDate")
+    snapshotdate = EpochMillisField(db_column="snapshotDate")
     device = models.TextField()
     sharepct = models.FloatField(db_column="sharePct")
 
     objects = DeviceShareManager()
+    Row = DeviceShareRow
 
     class Meta:
         managed = False
@@ -0,0 +1,270 @@
+"""On-demand profiling of individual analytics requests.
+
+A slow endpoint in production rarely reproduces locally, so any analytics
+request can run under a profiler when asked to:
+
+* by header: ``X-Analytics-Profile: <ANALYTICS_PROFILE_TOKEN>``; requests
+  with a wrong or missing token are served normally
+* by sampling: a random ``ANALYTICS_PROFILE_SAMPLE_RATE`` fraction of requests
+
+With no token configured and a zero rate, the check is two settings reads
+and nothing is installed.
+
+``ANALYTICS_PROFILER`` picks the profiler. ``"sampler"`` (the default) is a
+thread that records the request thread's stack every
+``ANALYTICS_PROFILE_INTERVAL_MS``. Its cost is independent of how many calls
+the view makes, and it writes collapsed stacks (``<id>.folded``) that
+flame-graph tools read. ``"cprofile"`` records every call and writes a
+``pstats`` file (``<id>.prof``). Since Python 3.12 cProfile hooks the whole
+process, so only one request is profiled that way at a time; concurrent ones
+use the sampler.
+
+Every statement the request runs on the ``analytics`` alias is timed too.
+``<id>.json`` holds the request, its SQL timings and a summary of the
+profile. The newest ``ANALYTICS_PROFILE_KEEP`` profiles are kept in
+``ANALYTICS_STATE_DIR/profiles``; staff can list and download them at
+``/admin/profiles/``.
+"""
+
+import hmac
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import UTC, datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+
+from .slow_queries import ALIAS, loggable
+
+HEADER = "HTTP_X_ANALYTICS_PROFILE"
+TOP_FUNCTIONS = 40  # functions listed in the cProfile summary
+TOP_STACKS = 20  # stacks listed in the sampler summary
+FILE_TYPES = {".json": "application/json", ".folded": "text/plain", ".prof": None}
+
+_cprofile_lock = threading.Lock()
+
+
+def profile_dir():
+    return Path(settings.ANALYTICS_STATE_DIR) / "profiles"
+
+
+def has_profile_token(request):
+    """Whether ``request`` carries the configured ``ANALYTICS_PROFILE_TOKEN``."""
+    token = getattr(settings, "ANALYTICS_PROFILE_TOKEN", None)
+    given = request.META.get(HEADER)
+    if not token or given is None:
+        return False
+    return hmac.compare_digest(given.encode(), token.encode())
+
+
+def profile_reason(request):
+    """Why ``request`` should be profiled ("header" or "sampled"), or None."""
+    if has_profile_token(request):
+        return "header"
+    rate = getattr(settings, "ANALYTICS_PROFILE_SAMPLE_RATE", 0)
+    if rate and random.random() < rate:
+        return "sampled"
+    return None
+
+
+def short_path(filename):
+    """The last two components of a source path."""
+    return "/".join(Path(filename).parts[-2:])
+
+
+class StackSampler:
+    """Counts the stacks of one thread, sampled from another thread."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="analytics-profiler", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_qualname} "
+                    f"({short_path(code.co_filename)}:{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def folded(self):
+        """Collapsed stacks, ``"root;...;leaf count"`` per line."""
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.samples.most_common()
+        )
+
+    def summary(self):
+        return {
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples.total(),
+            "stacks": [
+                {"stack": stack.split(";"), "count": count}
+                for stack, count in self.samples.most_common(TOP_STACKS)
+            ],
+        }
+
+
+def cprofile_summary(profile):
+    """The functions with the most cumulative time."""
+    import pstats
+
+    stats = pstats.Stats(profile).stats
+    rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)
+    return {
+        "functions": [
+            {
+                "function": f"{name} ({short_path(filename)}:{line})",
+                "calls": calls,
+                "tottime_ms": round(tottime * 1000, 3),
+                "cumtime_ms": round(cumtime * 1000, 3),
+            }
+            for (filename, line, name), (_, calls, tottime, cumtime, _) in rows[
+                :TOP_FUNCTIONS
+            ]
+        ]
+    }
+
+
+class SqlTimer:
+    """Execute wrapper recording each statement's duration."""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.statements.append(
+                {
+                    "sql": sql,
+                    "params": loggable(params, many),
+                    "ms": round((time.perf_counter() - start) * 1000, 3),
+                }
+            )
+
+
+def profile_request(view_name, request, reason, call):
+    """Run ``call()`` under the profiler and store the result.
+
+    Returns ``call()``'s response with an ``X-Analytics-Profile-Id`` header.
+    """
+    mode = getattr(settings, "ANALYTICS_PROFILER", "sampler")
+    # One cProfile at a time per process; the others are sampled.
+    if mode == "cprofile" and not _cprofile_lock.acquire(blocking=False):
+        mode = "sampler"
+    try:
+        if mode == "cprofile":
+            import cProfile
+
+            profiler = cProfile.Profile()
+            begin, end = profiler.enable, profiler.disable
+        else:
+            interval = getattr(settings, "ANALYTICS_PROFILE_INTERVAL_MS", 1) / 1000
+            profiler = StackSampler(threading.get_ident(), interval)
+            begin, end = profiler.start, profiler.stop
+        timer = SqlTimer()
+        started = datetime.now(UTC)
+        start = time.perf_counter()
+        with connections[ALIAS].execute_wrapper(timer):
+            begin()
+            try:
+                response = call()
+            finally:
+                end()
+    finally:
+        if mode == "cprofile":
+            _cprofile_lock.release()
+    seconds = time.perf_counter() - start
+
+    profile_id = f"{started:%Y%m%dT%H%M%S%fZ}-{view_name}"
+    entry = {
+        "id": profile_id,
+        "at": started.isoformat(timespec="milliseconds"),
+        "view": view_name,
+        "method": request.method,
+        "path": request.get_full_path(),
+        "status": response.status_code,
+        "reason": reason,
+        "profiler": mode,
+        "ms": round(seconds * 1000, 3),
+        "sql_ms": round(sum(item["ms"] for item in timer.statements), 3),
+        "sql": timer.statements,
+    }
+    root = profile_dir()
+    root.mkdir(parents=True, exist_ok=True)
+    if mode == "cprofile":
+        entry["profile"] = cprofile_summary(profiler)
+        profiler.dump_stats(root / f"{profile_id}.prof")
+    else:
+        entry["profile"] = profiler.summary()
+        (root / f"{profile_id}.folded").write_text(profiler.folded())
+    # The JSON last: listed profiles always have their profile file.
+    tmp = root / f"{profile_id}.json.tmp"
+    tmp.write_text(json.dumps(entry, default=str))
+    tmp.replace(root / f"{profile_id}.json")
+    prune(root)
+    response["X-Analytics-Profile-Id"] = profile_id
+    return response
+
+
+def prune(root=None):
+    """Delete all but the newest ``ANALYTICS_PROFILE_KEEP`` profiles."""
+    root = root or profile_dir()
+    keep = getattr(settings, "ANALYTICS_PROFILE_KEEP", 100)
+    # Ids start with a UTC timestamp, so names sort oldest first.
+    entries = sorted(root.glob("*.json"))
+    for path in entries[: max(0, len(entries) - keep)]:
+        for suffix in FILE_TYPES:
+            path.with_suffix(suffix).unlink(missing_ok=True)
+
+
+def list_profiles():
+    """Stored profiles, newest first, without their SQL and stacks."""
+    profiles = []
+    for path in sorted(profile_dir().glob("*.json"), reverse=True):
+        try:
+            entry = json.loads(path.read_text())
+        except (FileNotFoundError, ValueError):
+            continue  # pruned or half-written meanwhile
+        entry["sql_count"] = len(entry.pop("sql"))
+        entry.pop("profile")
+        entry["files"] = {
+            suffix[1:]: path.with_suffix(suffix).name
+            for suffix in FILE_TYPES
+            if path.with_suffix(suffix).exists()
+        }
+        profiles.append(entry)
+    return profiles
+
+
+def profile_file(name):
+    """Path of a stored profile file, or None if ``name`` is not one."""
+    path = profile_dir() / name
+    if path.name != name or path.suffix not in FILE_TYPES or not path.is_file():
+        return None
+    return path
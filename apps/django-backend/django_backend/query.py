@@ -0,0 +1,519 @@
+"""Declarative metrics queries over the analytics tables.
+
+``/analytics/query`` answers ad-hoc questions without a new view per
+question. It takes a spec such as::
+
+    {"metrics": ["visits", "sessions"], "start": "2024-04-01",
+     "end": "2024-06-30", "granularity": "week", "order": "-visits"}
+
+A spec is normalized into a hashable :class:`QuerySpec`, which also keys the
+result cache. It compiles to one parameterized statement built only from
+the allow-listed catalogue below. Every predicate is either a range on the
+indexed date (or ``(year, month)``) columns or a match on the indexed
+dimension. On SQLite, SQL aggregates at the table's stored grain and the
+rows are rolled up into calendar buckets in the requested timezone in
+Python. PostgreSQL buckets with ``date_trunc`` in the requested timezone
+itself, except for percentiles, which need the stored-grain values.
+
+A spec without a bounded date range scans the whole table. The cost guard
+rejects such specs when the table holds more than
+``ANALYTICS_QUERY_ROW_BUDGET`` rows. Bounded ranges may span at most
+``ANALYTICS_QUERY_MAX_DAYS``.
+"""
+
+import math
+from collections.abc import Mapping
+from datetime import date, timedelta
+from operator import itemgetter
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import connections
+
+from .dates import GRANULARITIES
+from .models import (
+    DeviceShare,
+    KpiSnapshot,
+    RevenueDaily,
+    SignupByChannel,
+    TrafficDaily,
+)
+from .versioning import data_version
+
+MAX_LIMIT = 1000
+# Dates whose day bounds and comparison windows stay inside the calendar in
+# every timezone.
+DATE_RANGE = (date(1970, 1, 1), date(9998, 12, 31))
+ORDER_DIRECTIONS = ("", "-")
+PERCENTILES = {"p50": 0.5, "p90": 0.9, "p95": 0.95, "p99": 0.99}
+AGGREGATES = ("sum", "avg", "max", *PERCENTILES)
+ACCURACIES = ("exact", "approx")
+# Sources with a maintained reservoir sample (see :mod:`.sampling`).
+SAMPLED_SOURCES = ("traffic", "revenue")
+
+
+class InvalidQuery(ValueError):
+    """A query spec is malformed or outside the allow-list."""
+
+
+class Source(NamedTuple):
+    """An analytics table and its indexed access paths."""
+
+    model: type
+    time_field: str | None  # Unix-ms field; None means (year, month) columns
+    dimension: str | None  # field usable for group_by and filters
+
+    @property
+    def table(self):
+        return self.model._meta.db_table
+
+    def column(self, field):
+        return self.model._meta.get_field(field).column
+
+
+class Metric(NamedTuple):
+    source: str
+    field: str
+    aggregate: str  # default aggregate: "sum", "avg" or "max"
+
+
+SOURCES = {
+    "traffic": Source(TrafficDaily, "date", None),
+    "revenue": Source(RevenueDaily, "date", None),
+    "signups": Source(SignupByChannel, None, "channel"),
+    "device_share": Source(DeviceShare, "snapshotdate", "device"),
+    "kpis": Source(KpiSnapshot, "capturedat", None),
+}
+
+METRICS = {
+    "visits": Metric("traffic", "visits", "sum"),
+    "sessions": Metric("traffic", "sessions", "sum"),
+    "revenue_cents": Metric("revenue", "valuecents", "sum"),
+    "signups": Metric("signups", "signups", "sum"),
+    "device_share_pct": Metric("device_share", "sharepct", "avg"),
+    "total_users": Metric("kpis", "totalusers", "max"),
+    "conversion_pct": Metric("kpis", "conversionpct", "avg"),
+}
+
+DIMENSIONS = tuple(
+    sorted({s.dimension for s in SOURCES.values() if s.dimension})
+)
+MONTH_GRANULARITIES = ("month", "quarter")
+SPEC_FIELDS = (
+    "metrics", "start", "end", "granularity", "group_by", "order", "limit",
+    "aggregate", "accuracy",
+)  # fmt: skip
+
+
+class QuerySpec(NamedTuple):
+    """A validated, normalized query spec."""
+
+    metrics: tuple
+    start: date | None
+    end: date | None  # inclusive
+    granularity: str
+    group_by: str | None
+    filters: tuple  # allowed values of the source dimension, sorted
+    order: str
+    limit: int | None
+    aggregate: str | None  # overrides each metric's default aggregate
+    accuracy: str
+
+    @property
+    def source_name(self):
+        return METRICS[self.metrics[0]].source
+
+    @property
+    def source(self):
+        return SOURCES[self.source_name]
+
+    def aggregate_of(self, name):
+        return self.aggregate or METRICS[name].aggregate
+
+    def to_dict(self):
+        """JSON-friendly form, echoed back in responses."""
+        source = self.source
+        return {
+            "metrics": list(self.metrics),
+            "start": self.start and self.start.isoformat(),
+            "end": self.end and self.end.isoformat(),
+            "granularity": self.granularity,
+            "group_by": self.group_by,
+            "filters": {source.dimension: list(self.filters)}
+            if self.filters
+            else {},
+            "order": self.order,
+            "limit": self.limit,
+            "aggregate": self.aggregate,
+            "accuracy": self.accuracy,
+        }
+
+
+def _names(value, field):
+    """Read a list of names given as a list or a comma-separated string."""
+    if value is None or value == "":
+        return ()
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, list | tuple) or not all(
+        isinstance(item, str) for item in value
+    ):
+        raise InvalidQuery(f"{field} must be a list of names")
+    return tuple(item.strip() for item in value if item.strip())
+
+
+def _date(data, field):
+    value = data.get(field)
+    if value is None or value == "":
+        return None
+    try:
+        value = date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise InvalidQuery(f"{field} must be a YYYY-MM-DD date") from None
+    low, high = DATE_RANGE
+    if not low <= value <= high:
+        raise InvalidQuery(f"{field} must be between {low} and {high}")
+    return value
+
+
+def _choice(value, field, allowed):
+    if value not in allowed:
+        raise InvalidQuery(f"{field} must be one of: {', '.join(allowed)}")
+    return value
+
+
+def parse_spec(data):
+    """Validate a raw spec mapping and return a :class:`QuerySpec`."""
+    if not isinstance(data, Mapping):
+        raise InvalidQuery("query spec must be an object")
+
+    metrics = tuple(dict.fromkeys(_names(data.get("metrics"), "metrics")))
+    if not metrics:
+        raise InvalidQuery("metrics is required")
+    for name in metrics:
+        _choice(name, "metrics", tuple(METRICS))
+    if len({METRICS[name].source for name in metrics}) > 1:
+        raise InvalidQuery("metrics must come from the same table")
+    source = SOURCES[METRICS[metrics[0]].source]
+
+    start, end = _date(data, "start"), _date(data, "end")
+    if start and end and start > end:
+        raise InvalidQuery("start must not be after end")
+
+    allowed = GRANULARITIES if source.time_field else MONTH_GRANULARITIES
+    granularity = _choice(
+        data.get("granularity") or allowed[0], "granularity", allowed
+    )
+
+    dimensions = (source.dimension,) if source.dimension else ()
+    group_by = data.get("group_by") or None
+    if group_by is not None:
+        _choice(group_by, "group_by", dimensions)
+
+    filters = data.get("filters") or {}
+    if not isinstance(filters, Mapping):
+        raise InvalidQuery("filters must be an object")
+    for field in filters:
+        _choice(field, "filters", dimensions)
+    values = ()
+    if source.dimension:
+        values = tuple(sorted(set(_names(filters.get(source.dimension), "filters"))))
+
+    order = data.get("order") or "period"
+    _choice(
+        order,
+        "order",
+        tuple(f"{d}{key}" for key in ("period", *metrics) for d in ORDER_DIRECTIONS),
+    )
+
+    limit = data.get("limit")
+    if limit is not None and limit != "":
+        try:
+            limit = int(limit)
+            if not 1 <= limit <= MAX_LIMIT:
+                raise ValueError
+        except (TypeError, ValueError):
+            raise InvalidQuery(f"limit must be between 1 and {MAX_LIMIT}") from None
+    else:
+        limit = None
+
+    aggregate = data.get("aggregate") or None
+    if aggregate is not None:
+        _choice(aggregate, "aggregate", AGGREGATES)
+    accuracy = _choice(data.get("accuracy") or "exact", "accuracy", ACCURACIES)
+    if accuracy == "approx":
+        if METRICS[metrics[0]].source not in SAMPLED_SOURCES:
+            sampled = [n for n, m in METRICS.items() if m.source in SAMPLED_SOURCES]
+            raise InvalidQuery(
+                f"accuracy=approx is only available for {', '.join(sampled)}"
+            )
+        if aggregate == "max":
+            raise InvalidQuery("accuracy=approx does not support aggregate=max")
+
+    return QuerySpec(
+        metrics,
+        start,
+        end,
+        granularity,
+        group_by,
+        values,
+        order,
+        limit,
+        aggregate,
+        accuracy,
+    )
+
+
+def check_cost(spec):
+    """Reject specs whose scan would exceed the configured budget.
+
+    A bounded range is an index range scan and is only limited in length.
+    An open range is a full scan, estimated from the table's row count in
+    the (already cached) data version. Approximate queries read the sample
+    and are never rejected.
+    """
+    if spec.accuracy == "approx":
+        return
+    if spec.start and spec.end:
+        max_days = getattr(settings, "ANALYTICS_QUERY_MAX_DAYS", 3660)
+        days = (spec.end - spec.start).days + 1
+        if days > max_days:
+            raise InvalidQuery(f"date range spans {days} days (max {max_days})")
+        return
+    budget = getattr(settings, "ANALYTICS_QUERY_ROW_BUDGET", 50_000)
+    table = spec.source.table
+    _, (rows, _) = data_version.get((table,))
+    if rows > budget:
+        raise InvalidQuery(
+            f"query would scan all {rows} rows of {table} (budget {budget}); "
+            f"bound it with start and end"
+        )
+
+
+def time_bounds(spec, calendar):
+    """``(low, high)`` Unix-ms bounds of the spec's local dates, or None."""
+    low = high = None
+    if spec.start:
+        low = calendar.day_of(spec.start).start_ms
+    if spec.end:
+        high = calendar.day_of(spec.end + timedelta(days=1)).start_ms
+    return low, high
+
+
+def compile_spec(spec, calendar, connection, table=None):
+    """Compile ``spec`` into ``(sql, params)`` for ``connection``.
+
+    The statement returns one row per stored time key (per bucket where
+    :func:`buckets_in_sql`), and dimension value when grouping, ordered by
+    time. Averages come back as a SUM and a
+    COUNT so they can be rolled up exactly; percentiles take the per-key
+    value and are computed over the rolled-up values. ``table`` replaces the
+    source's quoted table name (the archive reads its copy).
+    """
+    source = spec.source
+    qn = connection.ops.quote_name
+
+    def col(field):
+        return qn(source.column(field))
+
+    if source.time_field:
+        keys = [col(source.time_field)]
+    else:
+        keys = [col("year"), col("month")]
+    if spec.group_by:
+        keys.append(col(source.dimension))
+
+    selects = list(keys)
+    select_params = []
+    bucketed = source.time_field and buckets_in_sql(spec, connection)
+    if bucketed:
+        bucket = f"date_trunc(%s, {keys[0]} AT TIME ZONE %s) AT TIME ZONE %s"
+        selects[0] = epoch_ms(connection, bucket)
+        select_params = [spec.granularity, calendar.tz_name, calendar.tz_name]
+    elif source.time_field:
+        # Select dates as milliseconds while filtering and grouping on the
+        # raw, indexed column.
+        selects[0] = epoch_ms(connection, keys[0])
+    for name in spec.metrics:
+        aggregate = spec.aggregate_of(name)
+        column = col(METRICS[name].field)
+        if aggregate == "avg":
+            selects += [f"SUM({column})", f"COUNT({column})"]
+        elif aggregate == "max":
+            selects.append(f"MAX({column})")
+        else:
+            selects.append(f"SUM({column})")
+
+    where, params = [], []
+    if source.time_field:
+        low, high = time_bounds(spec, calendar)
+        placeholder = ms_placeholder(connection)
+        if low is not None:
+            where.append(f"{keys[0]} >= {placeholder}")
+            params.append(low)
+        if high is not None:
+            where.append(f"{keys[0]} < {placeholder}")
+            params.append(high)
+    else:
+        if spec.start:
+            where.append(f"({keys[0]}, {keys[1]}) >= (%s, %s)")
+            params += [spec.start.year, spec.start.month]
+        if spec.end:
+            where.append(f"({keys[0]}, {keys[1]}) <= (%s, %s)")
+            params += [spec.end.year, spec.end.month]
+    if spec.filters:
+        placeholders = ", ".join(["%s"] * len(spec.filters))
+        where.append(f"{col(source.dimension)} IN ({placeholders})")
+        params += spec.filters
+
+    time_keys = ", ".join(keys[:1] if source.time_field else keys[:2])
+    group_keys = ", ".join(keys)
+    if bucketed:
+        # Refer to the bucket expression by position rather than repeat it.
+        group_keys = ", ".join(str(i + 1) for i in range(len(keys)))
+        time_keys = "1"
+    sql = f"SELECT {', '.join(selects)} FROM {table or qn(source.table)}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" GROUP BY {group_keys} ORDER BY {time_keys}"
+    return sql, select_params + params
+
+
+def buckets_in_sql(spec, connection):
+    """Whether ``connection`` can bucket ``spec``'s rows by local date."""
+    return connection.vendor == "postgresql" and not any(
+        spec.aggregate_of(name) in PERCENTILES for name in spec.metrics
+    )
+
+
+def epoch_ms(connection, expression):
+    """SQL selecting a date ``expression`` as Unix milliseconds.
+
+    Prisma's SQLite stores milliseconds in DATETIME-declared columns, whose
+    driver converters would mangle them; PostgreSQL stores timestamptz.
+    """
+    if connection.vendor == "postgresql":
+        return f"(EXTRACT(EPOCH FROM {expression}) * 1000)::bigint"
+    return f"CAST({expression} AS BIGINT)"
+
+
+def ms_placeholder(connection):
+    """Placeholder comparing a date column with a Unix-ms parameter."""
+    if connection.vendor == "postgresql":
+        return "to_timestamp(%s / 1000.0)"
+    return "%s"
+
+
+def month_bucket(year, month, granularity):
+    """Bucket key for a (year, month) pair, matching :class:`dates.Day`."""
+    if granularity == "quarter":
+        return f"{year}-Q{(month - 1) // 3 + 1}"
+    return f"{year}-{month:02d}"
+
+
+def nearest_rank(values, fraction):
+    """Nearest-rank percentile of sorted ``values``."""
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def rollup(spec, calendar, rows):
+    """Combine stored-grain rows into calendar buckets, ordered and limited."""
+    source = spec.source
+    width = 1 if source.time_field else 2
+    group = width + bool(spec.group_by)
+    # One slot per selected aggregate column: "sum", "max" or "list".
+    slots = []
+    for name in spec.metrics:
+        aggregate = spec.aggregate_of(name)
+        if aggregate == "avg":
+            slots += ["sum", "sum"]
+        elif aggregate in PERCENTILES:
+            slots.append("list")
+        else:
+            slots.append(aggregate)
+
+    buckets = {}
+    for row in rows:
+        if source.time_field:
+            period = calendar.bucket(row[0], spec.granularity)
+        else:
+            period = month_bucket(row[0], row[1], spec.granularity)
+        key = (period, row[width] if spec.group_by else None)
+        values = row[group:]
+        totals = buckets.get(key)
+        if totals is None:
+            buckets[key] = [
+                [value] if slot == "list" else value
+                for slot, value in zip(slots, values, strict=True)
+            ]
+            continue
+        for i, slot in enumerate(slots):
+            if slot == "list":
+                totals[i].append(values[i])
+            elif slot == "max":
+                totals[i] = max(totals[i], values[i])
+            else:
+                totals[i] += values[i]
+
+    results = []
+    for (period, dimension), totals in sorted(buckets.items()):
+        point = {"period": period}
+        if spec.group_by:
+            point[spec.group_by] = dimension
+        i = 0
+        for name in spec.metrics:
+            aggregate = spec.aggregate_of(name)
+            if aggregate == "avg":
+                total, count = totals[i : i + 2]
+                point[name] = round(total / count, 2) if count else None
+                i += 2
+                continue
+            if aggregate in PERCENTILES:
+                point[name] = nearest_rank(sorted(totals[i]), PERCENTILES[aggregate])
+            else:
+                point[name] = totals[i]
+            i += 1
+        results.append(point)
+    return order_rows(spec, results)
+
+
+def order_rows(spec, results):
+    """Apply the spec's ordering and limit to result rows."""
+    order = spec.order.lstrip("-")
+    descending = spec.order.startswith("-")
+    if order != "period":
+        results.sort(key=itemgetter(order), reverse=descending)
+    elif descending:
+        results.reverse()
+    return results[: spec.limit]
+
+
+def run_query(spec, calendar, using="analytics"):
+    """Execute ``spec`` and return its result rows.
+
+    Callers are expected to apply :func:`check_cost` first. Approximate
+    specs are answered from the sample instead of the table, and traffic and
+    revenue specs from the mapped series file when it is current (see
+    :mod:`.series`). Archived rows (see :mod:`.retention`) are read as well
+    when the range reaches them.
+    """
+    if spec.accuracy == "approx":
+        from .sampling import approximate
+
+        return approximate(spec, calendar, using)
+    connection = connections[using]
+    from .series import SERIES, series
+
+    rows = None
+    if spec.source.table in SERIES:
+        rows = series.spec_rows(spec, calendar)
+    if rows is None:
+        sql, params = compile_spec(spec, calendar, connection)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+    if connection.vendor == "sqlite":
+        from .retention import archived_rows
+
+        rows += archived_rows(spec, calendar, connection)
+    return rollup(spec, calendar, rows)
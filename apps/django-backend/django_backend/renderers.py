@@ -0,0 +1,66 @@
+"""Compact binary renderers for the time-series endpoints.
+
+Both renderers expect columnar data, a mapping of column name to a list of
+values, so each key is encoded once instead of once per row. They depend on
+optional packages (``msgpack``, ``pyarrow``); a renderer whose package is
+missing is left out of ``COLUMNAR_RENDERERS`` and content negotiation falls
+back to JSON. The packages are imported on first render, not at URLconf load.
+"""
+
+from importlib.util import find_spec
+
+from rest_framework.renderers import BaseRenderer
+
+
+class MessagePackRenderer(BaseRenderer):
+    """Render columnar data as a MessagePack map of arrays."""
+
+    media_type = "application/x-msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        import msgpack
+
+        return msgpack.packb(data, use_bin_type=True)
+
+
+class ArrowStreamRenderer(BaseRenderer):
+    """Render columnar data as a single-batch Arrow IPC stream."""
+
+    media_type = "application/vnd.apache.arrow.stream"
+    format = "arrow"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        import pyarrow
+        import pyarrow.ipc
+
+        # Scalar payloads (e.g. validation errors) become a one-row batch.
+        columns = {
+            name: values if isinstance(values, list) else [values]
+            for name, values in data.items()
+        }
+        batch = pyarrow.record_batch(columns)
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_stream(sink, batch.schema) as writer:
+            writer.write_batch(batch)
+        return sink.getvalue().to_pybytes()
+
+
+COLUMNAR_RENDERERS = tuple(
+    renderer
+    for renderer, package in (
+        (MessagePackRenderer, "msgpack"),
+        (ArrowStreamRenderer, "pyarrow"),
+    )
+    if find_spec(package) is not None
+)
+
+COLUMNAR_FORMATS = frozenset(renderer.format for renderer in COLUMNAR_RENDERERS)
@@ -0,0 +1,515 @@
+"""Retention: archive old daily facts, keep monthly aggregates.
+
+``TrafficDaily``, ``RevenueDaily`` and ``DeviceShare`` grow by a row (or a
+snapshot) a day. ``manage.py apply_retention --keep-days N`` moves rows
+older than a cutoff out of the Prisma SQLite file into an archive SQLite
+file (``ANALYTICS_ARCHIVE_DB``, by default ``<db>.archive.db`` next to it):
+
+* the raw rows, into tables with the Prisma DDL of the originals
+* monthly aggregates of them (``TrafficMonthly`` ...): row count, and sum
+  and max of each metric per local month (and device)
+* ``ArchiveCutoff``: per table, the timestamp every archived row is below,
+  and the timezone of the months
+
+The cutoff is the start of the month ``keep_days`` before now, moved back
+further if needed so that the newest 60 days (or snapshots) stay live,
+because the latest-N endpoints read those from the live table. Rows move in
+one transaction. The main file is then compacted: the first run switches it
+to ``auto_vacuum=INCREMENTAL`` with one full VACUUM, later runs release free
+pages with ``PRAGMA incremental_vacuum``.
+
+Reads are unchanged for ranges after the cutoff. ``/analytics/query`` and
+``/analytics/compare`` ranges that start before it also read the archive,
+attached to the connection on first use (outside a transaction). Month and
+quarter queries with month-aligned ranges, no percentiles and the archive's
+timezone read the monthly aggregates, other queries the archived raw rows;
+either way the results equal those from the unarchived table.
+
+Samples (:mod:`.sampling`) and the KPI state (:mod:`.kpis`) keep what they
+had already seen, but rebuilding them only sees live rows. SQLite only.
+"""
+
+import re
+import time
+from datetime import timedelta
+from pathlib import Path
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from .changes import last_seq, log_installed, mark_archived
+from .query import METRICS, PERCENTILES, SOURCES, compile_spec, time_bounds
+from .versioning import data_version
+
+SCHEMA = "archive"
+CUTOFF_TABLE = "ArchiveCutoff"
+ARCHIVED_SOURCES = ("traffic", "revenue", "device_share")
+KEEP_NEWEST = 60  # highest limit/snapshots the latest-N endpoints accept
+CREATE = re.compile(r"^CREATE (UNIQUE )?(TABLE|INDEX) ", re.IGNORECASE)
+
+
+class Archive(NamedTuple):
+    """The archive file of a database and what it holds."""
+
+    path: Path
+    cutoffs: dict  # {table: Unix ms every archived row is below}
+    zones: dict  # {table: timezone of its monthly aggregates}
+
+
+def archive_path(using="analytics"):
+    """The archive file for ``using``, or None for an in-memory database."""
+    configured = getattr(settings, "ANALYTICS_ARCHIVE_DB", None)
+    if configured:
+        return Path(configured)
+    connection = connections[using]
+    if connection.vendor != "sqlite" or connection.is_in_memory_db():
+        return None
+    name = Path(connection.settings_dict["NAME"])
+    return name.with_name(f"{name.stem}.archive{name.suffix}")
+
+
+def monthly_table(source):
+    return f"{source.table.removesuffix('Daily')}Monthly"
+
+
+def metric_columns(source_name):
+    """Stored columns of the metrics read from a source."""
+    source = SOURCES[source_name]
+    return list(
+        dict.fromkeys(
+            source.column(metric.field)
+            for metric in METRICS.values()
+            if metric.source == source_name
+        )
+    )
+
+
+_archives = {}  # path -> ((mtime_ns, size), Archive)
+
+
+def get_archive(connection):
+    """The :class:`Archive` of ``connection``'s database, or None."""
+    if connection.vendor != "sqlite":
+        return None
+    path = archive_path(connection.alias)
+    if path is None:
+        return None
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    cached = _archives.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    import sqlite3
+
+    reader = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = reader.execute(
+            f'SELECT "tableName", "cutoff", "tz" FROM "{CUTOFF_TABLE}"'
+        ).fetchall()
+    except sqlite3.OperationalError:
+        rows = []  # created but never written
+    finally:
+        reader.close()
+    archive = Archive(
+        path,
+        {table: cutoff for table, cutoff, _ in rows},
+        {table: tz_name for table, _, tz_name in rows},
+    )
+    _archives[path] = (stamp, archive)
+    return archive
+
+
+def attach(connection, path):
+    """ATTACH ``path`` as ``archive`` unless this connection already has it.
+
+    SQLite refuses ATTACH inside a transaction, so the first archive read of
+    a connection must happen outside ``atomic()``.
+    """
+    connection.ensure_connection()
+    attached = getattr(connection, "_analytics_archive", None)
+    if attached == (connection.connection, path):
+        return
+    if attached is not None:
+        detach(connection)  # another archive file, or a stale connection
+    with connection.cursor() as cursor:
+        cursor.execute(f"ATTACH DATABASE %s AS {SCHEMA}", [str(path)])
+    connection._analytics_archive = (connection.connection, path)
+
+
+def detach(connection):
+    """DETACH the archive if this connection has it attached."""
+    attached = getattr(connection, "_analytics_archive", None)
+    if attached and attached[0] is connection.connection:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DETACH DATABASE {SCHEMA}")
+    connection._analytics_archive = None
+
+
+def archived_table(connection, table):
+    return f"{SCHEMA}.{connection.ops.quote_name(table)}"
+
+
+def uses_monthly(spec, calendar, archive, cutoff):
+    """Whether the monthly aggregates answer ``spec``'s archived part."""
+    if spec.granularity not in ("month", "quarter"):
+        return False
+    if calendar.tz_name != archive.zones[spec.source.table]:
+        return False
+    if any(spec.aggregate_of(name) in PERCENTILES for name in spec.metrics):
+        return False
+    # Whole months only: a range edge inside an archived month would need
+    # that month's days.
+    if spec.start and spec.start.day != 1:
+        return False
+    if spec.end and (spec.end + timedelta(days=1)).day != 1:
+        return calendar.day_of(spec.end.replace(day=1)).start_ms >= cutoff
+    return True
+
+
+def compile_monthly(spec, calendar, connection):
+    """``(sql, params)`` reading ``spec``'s rows from the monthly aggregates.
+
+    Rows have the shape :func:`query.compile_spec` returns, one per month,
+    so :func:`query.rollup` combines them with the live rows.
+    """
+    source = spec.source
+    qn = connection.ops.quote_name
+    keys = [qn("monthStart")]
+    if spec.group_by:
+        keys.append(qn(source.column(source.dimension)))
+    selects = list(keys)
+    for name in spec.metrics:
+        aggregate = spec.aggregate_of(name)
+        column = source.column(METRICS[name].field)
+        if aggregate == "avg":
+            selects += [f"SUM({qn(column + 'Sum')})", f"SUM({qn('rowCount')})"]
+        elif aggregate == "max":
+            selects.append(f"MAX({qn(column + 'Max')})")
+        else:
+            selects.append(f"SUM({qn(column + 'Sum')})")
+    where, params = [], []
+    low, high = time_bounds(spec, calendar)
+    if low is not None:
+        where.append(f"{keys[0]} >= %s")
+        params.append(low)
+    if high is not None:
+        where.append(f"{keys[0]} < %s")
+        params.append(high)
+    if spec.filters:
+        placeholders = ", ".join(["%s"] * len(spec.filters))
+        where.append(f"{qn(source.column(source.dimension))} IN ({placeholders})")
+        params += spec.filters
+    sql = (
+        f"SELECT {', '.join(selects)} "
+        f"FROM {archived_table(connection, monthly_table(source))}"
+    )
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" GROUP BY {', '.join(keys)} ORDER BY {keys[0]}"
+    return sql, params
+
+
+def archived_source_table(connection, source, low):
+    """The attached archive copy of ``source``'s table, if it holds rows at or
+    after ``low`` (Unix ms, None for no bound); else None.
+    """
+    archive = get_archive(connection)
+    cutoff = archive and archive.cutoffs.get(source.table)
+    if cutoff is None or (low is not None and low >= cutoff):
+        return None
+    attach(connection, archive.path)
+    return archived_table(connection, source.table)
+
+
+def archived_rows(spec, calendar, connection):
+    """Rows of ``spec`` from the archive, in :func:`query.compile_spec` shape.
+
+    Empty when no part of the spec's range is archived.
+    """
+    if spec.source_name not in ARCHIVED_SOURCES:
+        return []
+    low, _ = time_bounds(spec, calendar)
+    table = archived_source_table(connection, spec.source, low)
+    if table is None:
+        return []
+    archive = get_archive(connection)
+    if uses_monthly(spec, calendar, archive, archive.cutoffs[spec.source.table]):
+        sql, params = compile_monthly(spec, calendar, connection)
+    else:
+        sql, params = compile_spec(spec, calendar, connection, table=table)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def retention_cutoff(connection, source, keep_days, calendar, now_ms):
+    """Month start before which ``source``'s rows are archived, or None."""
+    qn = connection.ops.quote_name
+    today = calendar.day(now_ms).date
+    first = (today - timedelta(days=keep_days)).replace(day=1)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT DISTINCT CAST({qn(source.column(source.time_field))} AS BIGINT) "
+            f"FROM main.{qn(source.table)} ORDER BY 1 DESC LIMIT 1 OFFSET %s",
+            [KEEP_NEWEST - 1],
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None  # fewer than KEEP_NEWEST days: keep everything
+    first = min(first, calendar.day(row[0]).date.replace(day=1))
+    return calendar.day_of(first).start_ms
+
+
+def create_archive_tables(connection, source_name):
+    """Create a source's archive tables, the raw one from the live DDL."""
+    source = SOURCES[source_name]
+    qn = connection.ops.quote_name
+    keys = [qn("monthStart")]
+    columns = [f"{qn('monthStart')} INTEGER NOT NULL"]
+    if source.dimension:
+        keys.append(qn(source.column(source.dimension)))
+        columns.append(f"{keys[-1]} TEXT NOT NULL")
+    columns.append(f"{qn('rowCount')} INTEGER NOT NULL")
+    for column in metric_columns(source_name):
+        field = next(f for f in source.model._meta.fields if f.column == column)
+        kind = "REAL" if field.get_internal_type() == "FloatField" else "INTEGER"
+        columns += [
+            f"{qn(column + 'Sum')} {kind} NOT NULL",
+            f"{qn(column + 'Max')} {kind} NOT NULL",
+        ]
+    columns.append(f"PRIMARY KEY ({', '.join(keys)})")
+    with connection.cursor() as cursor:
+        # The table and its unique keys, so re-archiving an upserted row
+        # replaces the archived copy.
+        cursor.execute(
+            "SELECT sql FROM main.sqlite_master WHERE tbl_name = %s "
+            "AND (type = 'table' OR sql LIKE 'CREATE UNIQUE INDEX%%')",
+            [source.table],
+        )
+        for (ddl,) in cursor.fetchall():
+            cursor.execute(
+                CREATE.sub(
+                    lambda m: f"CREATE {m[1] or ''}{m[2]} IF NOT EXISTS {SCHEMA}.",
+                    ddl,
+                )
+            )
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS "
+            f"{archived_table(connection, monthly_table(source))} "
+            f"({', '.join(columns)})"
+        )
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {archived_table(connection, CUTOFF_TABLE)} "
+            f'("tableName" TEXT NOT NULL PRIMARY KEY, "cutoff" INTEGER NOT NULL, '
+            f'"tz" TEXT NOT NULL, "archivedAt" INTEGER NOT NULL)'
+        )
+
+
+def rebuild_months(connection, source_name, low, high, calendar):
+    """Recompute the monthly aggregates of archived rows in ``[low, high)``.
+
+    ``low`` and ``high`` are month starts. Returns the number of rows written.
+    """
+    source = SOURCES[source_name]
+    qn = connection.ops.quote_name
+    date_column = qn(source.column(source.time_field))
+    dimension = [qn(source.column(source.dimension))] if source.dimension else []
+    metrics = [qn(column) for column in metric_columns(source_name)]
+    monthly = archived_table(connection, monthly_table(source))
+    months = {}
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT CAST({date_column} AS BIGINT), {', '.join(dimension + metrics)} "
+            f"FROM {archived_table(connection, source.table)} "
+            f"WHERE {date_column} >= %s AND {date_column} < %s",
+            [low, high],
+        )
+        for timestamp, *rest in cursor.fetchall():
+            first = calendar.day(timestamp).date.replace(day=1)
+            key = (calendar.day_of(first).start_ms, *rest[: len(dimension)])
+            values = rest[len(dimension) :]
+            totals = months.get(key)
+            if totals is None:
+                months[key] = [1, *(v for value in values for v in (value, value))]
+                continue
+            totals[0] += 1
+            for i, value in enumerate(values):
+                totals[2 * i + 1] += value
+                totals[2 * i + 2] = max(totals[2 * i + 2], value)
+        cursor.execute(
+            f"DELETE FROM {monthly} WHERE {qn('monthStart')} >= %s "
+            f"AND {qn('monthStart')} < %s",
+            [low, high],
+        )
+        columns = [qn("monthStart"), *dimension, qn("rowCount")]
+        for column in metric_columns(source_name):
+            columns += [qn(column + "Sum"), qn(column + "Max")]
+        cursor.executemany(
+            f"INSERT INTO {monthly} ({', '.join(columns)}) "
+            f"VALUES ({', '.join(['%s'] * len(columns))})",
+            [(*key, *totals) for key, totals in months.items()],
+        )
+    return len(months)
+
+
+def move_rows(connection, source_name, cutoff, previous, calendar, now_ms):
+    """Move a source's rows below ``cutoff`` to the attached archive.
+
+    Updates the monthly aggregates of the months rows moved into (all of
+    them if the archive's months are in another timezone) and the table's
+    cutoff. Returns the number of monthly rows written.
+    """
+    source = SOURCES[source_name]
+    qn = connection.ops.quote_name
+    table = source.table
+    live = f"main.{qn(table)}"
+    archived = archived_table(connection, table)
+    date_column = qn(source.column(source.time_field))
+    columns = ", ".join(qn(field.column) for field in source.model._meta.fields)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT MIN(CAST({date_column} AS BIGINT)) FROM {live} "
+            f"WHERE {date_column} < %s",
+            [cutoff],
+        )
+        (low,) = cursor.fetchone()
+        cursor.execute(
+            f"INSERT OR REPLACE INTO {archived} ({columns}) "
+            f"SELECT {columns} FROM {live} WHERE {date_column} < %s",
+            [cutoff],
+        )
+        logged = None
+        if log_installed(connection.alias):
+            logged = last_seq(connection.alias)
+        cursor.execute(f"DELETE FROM {live} WHERE {date_column} < %s", [cutoff])
+        if logged is not None:
+            # The change log's delete triggers fired; these rows live on.
+            mark_archived(table, logged, connection.alias)
+        if previous and table in previous.cutoffs:
+            cutoff = max(cutoff, previous.cutoffs[table])
+            if previous.zones[table] != calendar.tz_name:
+                monthly = archived_table(connection, monthly_table(source))
+                cursor.execute(f"DELETE FROM {monthly}")
+                cursor.execute(
+                    f"SELECT MIN(CAST({date_column} AS BIGINT)) FROM {archived}"
+                )
+                (low,) = cursor.fetchone()
+        months = 0
+        if low is not None:
+            first = calendar.day_of(calendar.day(low).date.replace(day=1))
+            months = rebuild_months(
+                connection, source_name, first.start_ms, cutoff, calendar
+            )
+        cursor.execute(
+            f"INSERT OR REPLACE INTO {archived_table(connection, CUTOFF_TABLE)} "
+            f'("tableName", "cutoff", "tz", "archivedAt") VALUES (%s, %s, %s, %s)',
+            [table, cutoff, calendar.tz_name, now_ms],
+        )
+    return months
+
+
+def pragma(cursor, name):
+    cursor.execute(f"PRAGMA {name}")
+    return cursor.fetchone()[0]
+
+
+def compact(connection):
+    """Return free pages of the main database to the filesystem.
+
+    Returns ``{"mode", "bytes_before", "bytes_after", "reclaimed"}``, sizes
+    from the page count.
+    """
+    with connection.cursor() as cursor:
+        page_size = pragma(cursor, "page_size")
+        before = pragma(cursor, "page_count")
+        if pragma(cursor, "auto_vacuum") == 2:
+            mode = "incremental"
+            cursor.execute("PRAGMA incremental_vacuum")
+            cursor.fetchall()  # runs one step per row
+        else:
+            # auto_vacuum only changes with a VACUUM, which also frees the
+            # pages of this run.
+            mode = "full"
+            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            cursor.execute("VACUUM")
+        after = pragma(cursor, "page_count")
+    return {
+        "mode": mode,
+        "bytes_before": before * page_size,
+        "bytes_after": after * page_size,
+        "reclaimed": (before - after) * page_size,
+    }
+
+
+def apply_retention(
+    keep_days,
+    using="analytics",
+    calendar=None,
+    now_ms=None,
+    dry_run=False,
+    vacuum=True,
+):
+    """Archive rows older than ``keep_days`` and compact the database.
+
+    Returns ``{"archive", "archive_bytes", "tables": {table: {"cutoff",
+    "moved", "months"}}, "vacuum"}``; ``vacuum`` is :func:`compact`'s
+    report, or None. A dry run only counts the rows it would move and
+    returns no sizes. Raises ``ValueError`` for a database
+    that cannot be archived.
+    """
+    from .dates import get_calendar
+
+    connection = connections[using]
+    if connection.vendor != "sqlite":
+        raise ValueError(f"{using} is {connection.vendor}; retention is SQLite only")
+    if keep_days < 1:
+        raise ValueError("keep_days must be at least 1")
+    path = archive_path(using)
+    if path is None:
+        raise ValueError("in-memory database: set ANALYTICS_ARCHIVE_DB")
+    calendar = calendar or get_calendar()
+    if now_ms is None:
+        now_ms = int(time.time() * 1000)
+    qn = connection.ops.quote_name
+
+    plan = {}
+    with connection.cursor() as cursor:
+        for name in ARCHIVED_SOURCES:
+            source = SOURCES[name]
+            cutoff = retention_cutoff(connection, source, keep_days, calendar, now_ms)
+            if cutoff is None:
+                continue
+            cursor.execute(
+                f"SELECT COUNT(*) FROM main.{qn(source.table)} "
+                f"WHERE {qn(source.column(source.time_field))} < %s",
+                [cutoff],
+            )
+            plan[name] = {"cutoff": cutoff, "moved": cursor.fetchone()[0], "months": 0}
+    report = {"archive": str(path), "tables": {}, "vacuum": None}
+    if dry_run:
+        report["tables"] = {SOURCES[name].table: item for name, item in plan.items()}
+        return report
+
+    previous = get_archive(connection)
+    attach(connection, path)
+    try:
+        for name in ARCHIVED_SOURCES:
+            create_archive_tables(connection, name)
+        with transaction.atomic(using):
+            for name, item in plan.items():
+                item["months"] = move_rows(
+                    connection, name, item["cutoff"], previous, calendar, now_ms
+                )
+                report["tables"][SOURCES[name].table] = item
+    finally:
+        # Free the file for other processes; readers re-attach on demand.
+        detach(connection)
+    data_version.invalidate()
+    if vacuum:
+        report["vacuum"] = compact(connection)
+    report["archive_bytes"] = path.stat().st_size
+    return report
@@ -0,0 +1,293 @@
+"""Reservoir samples for approximate long-range answers.
+
+``/analytics/query`` with ``accuracy=approx`` answers sums, averages and
+percentiles over ``TrafficDaily`` and ``RevenueDaily`` from a fixed-size
+uniform sample of their rows rather than from the tables. Each answer comes
+with the half-width of its 95% confidence interval (``<metric>_error``):
+
+* sum: the expansion estimator ``N/n * sum(x in bucket)``, with the
+  finite-population variance of the zero-padded bucket indicator
+* avg: the in-bucket sample mean and its standard error
+* percentiles: the nearest-rank sample quantile, with a distribution-free
+  interval from the binomial spread of order-statistic ranks
+
+Samples are maintained with Algorithm L over rows in id order, so keeping a
+sample current only reads rows above its id watermark. ``manage.py
+refresh_samples`` builds them and persists them to ``ANALYTICS_STATE_DIR``.
+Each process loads the saved samples and syncs them when a table's data
+version moves. Requests never build a sample from scratch, which would read
+the whole table: until ``refresh_samples`` has run, approximate queries are
+answered exactly (subject to the row budget). Updates and deletes of already
+sampled rows are only picked up by ``refresh_samples --rebuild``.
+"""
+
+import json
+import math
+import random
+import threading
+from pathlib import Path
+
+from django.conf import settings
+
+from .query import (
+    METRICS,
+    PERCENTILES,
+    SOURCES,
+    nearest_rank,
+    order_rows,
+    time_bounds,
+)
+from .versioning import data_version
+
+STATE_VERSION = 1
+Z_95 = 1.959964
+
+
+class Reservoir:
+    """Uniform random sample of at most ``size`` rows (Algorithm L).
+
+    Rows are ``(timestamp_ms, *fields)``. After the reservoir fills, each
+    accepted row costs three random draws and rejected rows cost none, so
+    the RNG work grows with ``size * log(seen / size)``.
+    """
+
+    def __init__(self, size, fields, seed=0):
+        self.size = size
+        self.fields = tuple(fields)
+        self.rows = []
+        self.seen = 0
+        self.watermark = 0  # highest row id offered
+        self.version = None  # data version last synced to (not persisted)
+        self._random = random.Random(seed)
+        self._weight = None
+        self._next = None
+
+    def add(self, row):
+        """Offer one row to the sample."""
+        self.seen += 1
+        if self.seen <= self.size:
+            self.rows.append(row)
+            if self.seen == self.size:
+                self._weight = math.exp(math.log(self._uniform()) / self.size)
+                self._advance()
+            return
+        if self.seen == self._next:
+            self.rows[self._random.randrange(self.size)] = row
+            self._weight *= math.exp(math.log(self._uniform()) / self.size)
+            self._advance()
+
+    def _uniform(self):
+        value = 0.0
+        while value == 0.0:
+            value = self._random.random()
+        return value
+
+    def _advance(self):
+        skip = 0
+        if self._weight < 1.0:
+            skip = math.floor(math.log(self._uniform()) / math.log1p(-self._weight))
+        self._next = self.seen + skip + 1
+
+    def to_dict(self):
+        version, internal, gauss = self._random.getstate()
+        return {
+            "version": STATE_VERSION,
+            "size": self.size,
+            "fields": list(self.fields),
+            "rows": self.rows,
+            "seen": self.seen,
+            "watermark": self.watermark,
+            "weight": self._weight,
+            "next": self._next,
+            "random": [version, list(internal), gauss],
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        reservoir = cls(state["size"], state["fields"])
+        reservoir.rows = [tuple(row) for row in state["rows"]]
+        reservoir.seen = state["seen"]
+        reservoir.watermark = state["watermark"]
+        reservoir._weight = state["weight"]
+        reservoir._next = state["next"]
+        version, internal, gauss = state["random"]
+        reservoir._random.setstate((version, tuple(internal), gauss))
+        return reservoir
+
+
+def sample_fields(source_name):
+    """Metric fields kept in the sample of ``source_name``."""
+    return tuple(
+        dict.fromkeys(
+            metric.field
+            for metric in METRICS.values()
+            if metric.source == source_name
+        )
+    )
+
+
+def new_sample(source_name):
+    size = getattr(settings, "ANALYTICS_SAMPLE_SIZE", 10_000)
+    return Reservoir(size, sample_fields(source_name))
+
+
+def sync_sample(reservoir, source_name, using="analytics"):
+    """Offer rows added since the reservoir's watermark, in id order."""
+    source = SOURCES[source_name]
+    rows = (
+        source.model.objects.using(using)
+        .filter(id__gt=reservoir.watermark)
+        .order_by("id")
+        .values_list("id", f"{source.time_field}_int", *reservoir.fields)
+    )
+    for row_id, *values in rows.iterator(chunk_size=10_000):
+        reservoir.add(tuple(values))
+        reservoir.watermark = row_id
+    return reservoir
+
+
+def state_path(source_name):
+    table = SOURCES[source_name].table
+    return Path(settings.ANALYTICS_STATE_DIR) / "samples" / f"{table}.json"
+
+
+def read_sample(source_name):
+    """Load the persisted sample, or None if none is usable."""
+    try:
+        state = json.loads(state_path(source_name).read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+    if (
+        state.get("version") != STATE_VERSION
+        or tuple(state["fields"]) != sample_fields(source_name)
+    ):
+        return None
+    return Reservoir.from_dict(state)
+
+
+def load_sample(source_name):
+    """Load the persisted sample, or an empty one if none is usable."""
+    return read_sample(source_name) or new_sample(source_name)
+
+
+def save_sample(reservoir, source_name):
+    """Persist a sample atomically."""
+    path = state_path(source_name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(reservoir.to_dict()))
+    tmp.replace(path)
+
+
+class SampleStore:
+    """Per-process samples, synced when their table's data version moves.
+
+    Only samples persisted by ``refresh_samples`` are loaded; until one is,
+    the source is not :meth:`ready`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def _load(self, source_name):
+        # Called with the lock held. A missing sample is looked for again on
+        # the next call, so a later refresh_samples run is picked up.
+        reservoir = self._samples.get(source_name)
+        if reservoir is None:
+            reservoir = read_sample(source_name)
+            if reservoir is not None:
+                self._samples[source_name] = reservoir
+        return reservoir
+
+    def ready(self, source_name):
+        """Whether ``source_name`` has a sample to answer from."""
+        with self._lock:
+            return self._load(source_name) is not None
+
+    def get(self, source_name, using="analytics"):
+        """The synced sample of ``source_name``, or None if not :meth:`ready`."""
+        version = data_version.get((SOURCES[source_name].table,))
+        with self._lock:
+            reservoir = self._load(source_name)
+            if reservoir is None:
+                return None
+            if reservoir.version != version:
+                sync_sample(reservoir, source_name, using)
+                reservoir.version = version
+            return reservoir
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+
+samples = SampleStore()
+
+
+def estimate(aggregate, values, sampled, population):
+    """Estimate ``aggregate`` from one bucket's sampled ``values``.
+
+    ``sampled`` is the whole sample size and ``population`` the number of
+    table rows it was drawn from. Returns ``(estimate, error)`` where error
+    is the half-width of a 95% confidence interval.
+    """
+    count = len(values)
+    fpc = max(0.0, 1 - sampled / population)  # finite population correction
+    total = sum(values)
+    squares = sum(value * value for value in values)
+    if aggregate == "sum":
+        mean = total / sampled
+        variance = (squares - sampled * mean * mean) / max(sampled - 1, 1)
+        error = Z_95 * population * math.sqrt(fpc * max(variance, 0.0) / sampled)
+        return round(total * population / sampled), round(error)
+    if aggregate == "avg":
+        mean = total / count
+        variance = (squares - count * mean * mean) / max(count - 1, 1)
+        error = Z_95 * math.sqrt(fpc * max(variance, 0.0) / count)
+        return round(mean, 2), round(error, 2)
+    fraction = PERCENTILES[aggregate]
+    ordered = sorted(values)
+    spread = Z_95 * math.sqrt(count * fraction * (1 - fraction) * fpc)
+    low = ordered[max(0, math.ceil(count * fraction - spread) - 1)]
+    high = ordered[min(count, math.ceil(count * fraction + spread)) - 1]
+    return nearest_rank(ordered, fraction), (high - low) / 2
+
+
+def approximate(spec, calendar, using="analytics"):
+    """Answer ``spec`` from the source's sample; see :func:`estimate`.
+
+    Callers check :meth:`SampleStore.ready` first and send exact specs
+    through the row budget instead.
+    """
+    reservoir = samples.get(spec.source_name, using)
+    low, high = time_bounds(spec, calendar)
+    buckets = {}
+    for row in reservoir.rows:
+        timestamp = row[0]
+        if (low is not None and timestamp < low) or (
+            high is not None and timestamp >= high
+        ):
+            continue
+        period = calendar.bucket(timestamp, spec.granularity)
+        buckets.setdefault(period, []).append(row)
+
+    columns = {
+        name: reservoir.fields.index(METRICS[name].field) + 1
+        for name in spec.metrics
+    }
+    sampled, population = len(reservoir.rows), reservoir.seen
+    results = []
+    for period, rows in sorted(buckets.items()):
+        point = {"period": period}
+        for name, column in columns.items():
+            value, error = estimate(
+                spec.aggregate_of(name),
+                [row[column] for row in rows],
+                sampled,
+                population,
+            )
+            point[name] = value
+            point[f"{name}_error"] = error
+        results.append(point)
+    return order_rows(spec, results)
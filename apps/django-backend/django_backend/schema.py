@@ -0,0 +1,28 @@
+"""DDL for analytics databases that Prisma does not manage.
+
+Prisma owns the SQLite schema (prisma/migrations). A PostgreSQL
+``analytics`` alias gets the equivalent tables with native date types from
+``sql/postgresql.sql``.
+"""
+
+from pathlib import Path
+
+POSTGRES_SCHEMA = Path(__file__).resolve().parent / "sql" / "postgresql.sql"
+
+
+def statements(script):
+    """Split a DDL script into statements (no procedural bodies allowed)."""
+    for chunk in script.split(";"):
+        lines = [line for line in chunk.splitlines() if not line.startswith("--")]
+        statement = "\n".join(lines).strip()
+        if statement:
+            yield statement
+
+
+def create_postgres_schema(connection):
+    """Create the analytics tables and indexes on ``connection`` if missing."""
+    if connection.vendor != "postgresql":
+        raise ValueError(f"expected a PostgreSQL connection, got {connection.vendor}")
+    with connection.cursor() as cursor:
+        for statement in statements(POSTGRES_SCHEMA.read_text()):
+            cursor.execute(statement)
@@ -7,6 +7,58 @@ and date formatting.
 
 from rest_framework import serializers
 
+from .dates import get_calendar
+
+
+def format_day(timestamp_ms, calendar=None):
+    """Format a Unix timestamp (ms) as 'Jan 5' to match Next.js backend."""
+    return (calendar or get_calendar()).label(timestamp_ms)
+
+
+class CalendarMixin:
+    """Resolve the request calendar from serializer context.
+
+    Views pass ``context={"calendar": ...}`` for a per-request ``tz``;
+    otherwise the TIME_ZONE calendar is used.
+    """
+
+    @property
+    def calendar(self):
+        return self.context.get("calendar") or get_calendar()
+
+
+class AnomalyMixin:
+    """Add an ``anomaly`` field to points when the view asks for it.
+
+    Views pass ``context={"anomalies": {day_ms: {series: score}}}``; each
+    point then carries its flagged series' z-scores, or null.
+    """
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        scores = self.context.get("anomalies")
+        if scores is not None:
+            data["anomaly"] = scores.get(instance.date_ms)
+        return data
+
+
+def pivot(rows):
+    """Pivot ``(period, column, value)`` rows into a dense matrix.
+
+    Rows must arrive ordered by period. Returns ``(periods, columns, values)``
+    where ``values[i][j]`` is the value for ``periods[i]`` and ``columns[j]``,
+    or ``None`` when that cell has no row.
+    """
+    periods = []
+    cells = {}
+    for period, column, value in rows:
+        if not periods or periods[-1] != period:
+            periods.append(period)
+        cells[period, column] = value
+    columns = sorted({column for _, column in cells})
+    values = [[cells.get((p, c)) for c in columns] for p in periods]
+    return periods, columns, values
+
 
 class KpiResponseSerializer(serializers.Serializer):
     """Response for /analytics/kpis endpoint."""
@@ -38,7 +90,7 @@ class KpiResponseSerializer(serializers.Serializer):
         return f"${dollars / 1000:.1f}k" if dollars >= 1000 else f"${dollars:,.0f}"
 
 
-class TrafficPointSerializer(serializers.Serializer):
+class TrafficPointSerializer(AnomalyMixin, CalendarMixin, serializers.Serializer):
     """Single traffic data point."""
 
     day = serializers.SerializerMethodField()
@@ -46,9 +98,8 @@ class TrafficPointSerializer(serializers.Serializer):
     sessions = serializers.IntegerField()
 
     def get_day(self, obj):
-        """Format datetime as 'Jan 5' format to match Next.js backend."""
-        dt = obj.date_datetime
-        return dt.strftime("%b %-d") if dt else None
+        """Format date as 'Jan 5' format to match Next.js backend."""
+        return self.calendar.label(obj.date_ms)
 
 
 class TrafficResponseSerializer(serializers.Serializer):
@@ -57,6 +108,19 @@ class TrafficResponseSerializer(serializers.Serializer):
     data = TrafficPointSerializer(many=True)
 
 
+class TrafficColumnsSerializer(CalendarMixin, serializers.Serializer):
+    """Columnar response for /analytics/traffic (binary formats)."""
+
+    def to_representation(self, instance):
+        """Convert date_int/visits/sessions columns to day/visits/sessions."""
+        label = self.calendar.label
+        return {
+            "day": [label(ts) for ts in instance["date_int"]],
+            "visits": instance["visits"],
+            "sessions": instance["sessions"],
+        }
+
+
 class SignupPointSerializer(serializers.Serializer):
     """Single signup data point."""
 
@@ -70,16 +134,41 @@ class SignupResponseSerializer(serializers.Serializer):
     data = SignupPointSerializer(many=True)
 
 
-class RevenuePointSerializer(serializers.Serializer):
+class SignupTrendResponseSerializer(serializers.Serializer):
+    """Response for /analytics/signups/trend endpoint."""
+
+    def to_representation(self, instance):
+        """Pivot (year, month, channel, signups) rows into months x channels."""
+        periods, channels, values = pivot(
+            (f"{year}-{month:02d}", channel, signups)
+            for year, month, channel, signups in instance
+        )
+        return {"periods": periods, "channels": channels, "values": values}
+
+
+class SignupMatrixResponseSerializer(serializers.Serializer):
+    """Response for the /analytics/signups/{growth,mix,rolling} endpoints."""
+
+    def to_representation(self, instance):
+        """Label (matrix, months, values, totals) with periods and channels."""
+        matrix, months, values, totals = instance
+        return {
+            "periods": matrix.labels(months),
+            "channels": matrix.channels,
+            "values": values,
+            "total": totals,
+        }
+
+
+class RevenuePointSerializer(AnomalyMixin, CalendarMixin, serializers.Serializer):
     """Single revenue data point."""
 
     day = serializers.SerializerMethodField()
     value = serializers.SerializerMethodField()
 
     def get_day(self, obj):
-        """Format datetime as 'Jan 5' format to match Next.js backend."""
-        dt = obj.date_datetime
-        return dt.strftime("%b %-d") if dt else None
+        """Format date as 'Jan 5' format to match Next.js backend."""
+        return self.calendar.label(obj.date_ms)
 
     def get_value(self, obj):
         """Convert cents to dollars (rounded integer to match Next.js)."""
@@ -92,6 +181,18 @@ class RevenueResponseSerializer(serializers.Serializer):
     data = RevenuePointSerializer(many=True)
 
 
+class RevenueColumnsSerializer(CalendarMixin, serializers.Serializer):
+    """Columnar response for /analytics/revenue (binary formats)."""
+
+    def to_representation(self, instance):
+        """Convert date_int/valuecents columns to day/value."""
+        label = self.calendar.label
+        return {
+            "day": [label(ts) for ts in instance["date_int"]],
+            "value": [round(cents / 100) for cents in instance["valuecents"]],
+        }
+
+
 class DeviceSharePointSerializer(serializers.Serializer):
     """Single device share data point."""
 
@@ -105,6 +206,78 @@ class DeviceShareResponseSerializer(serializers.Serializer):
     data = DeviceSharePointSerializer(many=True)
 
 
+class DeviceShareTrendResponseSerializer(CalendarMixin, serializers.Serializer):
+    """Response for /analytics/device-share/trend endpoint."""
+
+    def to_representation(self, instance):
+        """Pivot (snapshotdate, device, sharepct) rows into snapshots x devices."""
+        calendar = self.calendar
+        periods, devices, values = pivot(
+            (calendar.day(snapshotdate).iso_date, device, sharepct)
+            for snapshotdate, device, sharepct in instance
+        )
+        return {"periods": periods, "devices": devices, "values": values}
+
+
+class AnomalyResponseSerializer(CalendarMixin, serializers.Serializer):
+    """Response for /analytics/anomalies endpoint."""
+
+    def to_representation(self, instance):
+        """Convert (day, series, value, expected, score) flags to points."""
+        calendar = self.calendar
+        return {
+            "data": [
+                {
+                    "date": calendar.day(day).iso_date,
+                    "day": calendar.label(day),
+                    "series": series,
+                    "value": value,
+                    "expected": expected,
+                    "score": score,
+                }
+                for day, series, value, expected, score in instance
+            ]
+        }
+
+
+class ComparisonResponseSerializer(serializers.Serializer):
+    """Response for /analytics/compare endpoint."""
+
+    def to_representation(self, instance):
+        """Windows, totals and deltas; revenue in dollars like /revenue."""
+        scale = 100 if instance.metric == "revenue" else 1
+
+        def amount(value):
+            return round(value / scale, 2) if scale != 1 else value
+
+        def window(total):
+            return {
+                "start": total.window.start.isoformat(),
+                "end": total.window.end.isoformat(),
+                "value": amount(total.value),
+                "days": total.days,
+            }
+
+        return {
+            "metric": instance.metric,
+            "period": instance.period,
+            "against": instance.against,
+            "current": window(instance.current),
+            "comparison": window(instance.comparison),
+            "change": amount(instance.change),
+            "change_pct": instance.change_pct,
+        }
+
+
+class QueryResponseSerializer(serializers.Serializer):
+    """Response for /analytics/query endpoint."""
+
+    def to_representation(self, instance):
+        """Echo the normalized spec alongside its result rows."""
+        spec, rows = instance
+        return {"spec": spec.to_dict(), "data": rows}
+
+
 class ErrorResponseSerializer(serializers.Serializer):
     """Error response for validation failures."""
 
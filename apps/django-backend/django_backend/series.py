@@ -0,0 +1,264 @@
+"""Memory-mapped columnar copies of the daily time series.
+
+Each worker that reads ``TrafficDaily`` or ``RevenueDaily`` history pays for
+it in queries and in row objects it keeps. ``manage.py export_series``
+writes each table to a fixed-width columnar file in
+``ANALYTICS_SERIES_DIR`` (default ``ANALYTICS_STATE_DIR/series``), which
+every worker maps read-only, so the pages are shared through the OS page
+cache:
+
+* a header: magic, format version, byte order, row and column counts,
+  export time, a digest of the table's data version, and the column names
+* the dates as int64 Unix ms, ascending
+* one int32 column per metric (visits, sessions / valueCents)
+
+A range is two binary searches over the mapped dates; the newest N rows are
+the last N of every column. Exports write a temporary file and rename it
+over the old one, so readers see either file whole. A worker re-maps when
+the file's inode changes and keeps using an old mapping until then.
+
+With ``ANALYTICS_SERVE_SERIES`` on, the traffic and revenue views answer
+latest-N reads, and ``/analytics/query`` answers exact traffic and revenue
+ranges, from the mapped file. That only happens while the file's digest
+matches the table's current data version; otherwise they query the
+database as before. Re-export after each ingest (or run the command with
+``--interval``).
+"""
+
+import bisect
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from pathlib import Path
+
+from django.conf import settings
+
+from .models import RevenueDaily, TrafficDaily
+from .query import METRICS, time_bounds
+from .versioning import data_version
+
+MAGIC = b"OVTSCOL\x00"
+FORMAT_VERSION = 1
+# magic, format version, little-endian flag, column count, rows, exported at
+# (Unix ms), data version digest
+HEADER = struct.Struct("<8sHBBQq16s")
+NAME = struct.Struct("16s")
+SERIES = {
+    "TrafficDaily": (TrafficDaily, ("visits", "sessions")),
+    "RevenueDaily": (RevenueDaily, ("valuecents",)),
+}
+
+
+def series_dir():
+    configured = getattr(settings, "ANALYTICS_SERIES_DIR", None)
+    return Path(configured or Path(settings.ANALYTICS_STATE_DIR) / "series")
+
+
+def series_path(table):
+    return series_dir() / f"{table}.cols"
+
+
+def version_tag(version):
+    """16-byte digest of a :data:`data_version` value."""
+    return hashlib.sha256(repr(version).encode()).digest()[:16]
+
+
+def data_offset(columns):
+    """Offset of the dates column: the header, padded to 8 bytes."""
+    size = HEADER.size + NAME.size * columns
+    return size + -size % 8
+
+
+def read_header(path):
+    """``(tag, rows)`` of a series file, or None if it is not one."""
+    try:
+        with open(path, "rb") as file:
+            head = file.read(HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(head) < HEADER.size:
+        return None
+    magic, version, _, _, rows, _, tag = HEADER.unpack(head)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        return None
+    return tag, rows
+
+
+def export(table, force=False, using="analytics"):
+    """Write ``table`` to its series file unless the file is current.
+
+    Returns the number of rows written, or None if the file already matched
+    the table's data version. Raises ``ValueError`` for a value outside the
+    int32 range.
+    """
+    model, fields = SERIES[table]
+    # The version is read before the rows: rows written meanwhile leave the
+    # file behind the database, so readers fall back until the next export.
+    data_version.invalidate()
+    tag = version_tag(data_version.get((table,)))
+    path = series_path(table)
+    current = read_header(path)
+    if current is not None and current[0] == tag and not force:
+        return None
+
+    dates, columns = array("q"), [array("i") for _ in fields]
+    if columns[0].itemsize != 4:
+        raise ValueError("this platform's C int is not 32 bits")
+    rows = model.objects.using(using).order_by("date").values_list("date_int", *fields)
+    try:
+        for date_ms, *values in rows.iterator(chunk_size=10_000):
+            dates.append(date_ms)
+            for column, value in zip(columns, values, strict=True):
+                column.append(value)
+    except OverflowError:
+        raise ValueError(f"{table} holds a value outside the int32 range") from None
+
+    header = HEADER.pack(
+        MAGIC,
+        FORMAT_VERSION,
+        sys.byteorder == "little",
+        len(fields),
+        len(dates),
+        int(time.time() * 1000),
+        tag,
+    )
+    names = b"".join(NAME.pack(field.encode()) for field in fields)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as file:
+        file.write(header + names)
+        file.write(b"\0" * (data_offset(len(fields)) - len(header) - len(names)))
+        dates.tofile(file)
+        for column in columns:
+            column.tofile(file)
+        file.flush()
+        os.fsync(file.fileno())
+    tmp.replace(path)
+    return len(dates)
+
+
+class SeriesFile:
+    """A mapped series file: ``dates`` and ``columns`` are zero-copy views."""
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            stat = os.fstat(file.fileno())
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.stamp = (stat.st_ino, stat.st_mtime_ns)
+        header = HEADER.unpack_from(self._map)
+        magic, version, little, count, rows, _, self.tag = header
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a series file")
+        if little != (sys.byteorder == "little"):
+            raise ValueError(f"{path} was written with another byte order")
+        names = [
+            NAME.unpack_from(self._map, HEADER.size + i * NAME.size)[0]
+            for i in range(count)
+        ]
+        offset = data_offset(count)
+        if len(self._map) != offset + rows * (8 + 4 * count):
+            raise ValueError(f"{path} is truncated")
+        view = memoryview(self._map)
+        self.rows = rows
+        self.dates = view[offset : offset + 8 * rows].cast("q")
+        offset += 8 * rows
+        self.columns = {}
+        for name in names:
+            self.columns[name.rstrip(b"\0").decode()] = view[
+                offset : offset + 4 * rows
+            ].cast("i")
+            offset += 4 * rows
+
+    def latest(self, limit):
+        """Slice of the newest ``limit`` rows."""
+        return slice(max(0, self.rows - limit), self.rows)
+
+    def between(self, low=None, high=None):
+        """Slice of the rows dated in ``[low, high)`` (Unix ms; None: open)."""
+        start = 0 if low is None else bisect.bisect_left(self.dates, low)
+        stop = self.rows if high is None else bisect.bisect_left(self.dates, high)
+        return slice(start, max(start, stop))
+
+    def read(self, span, fields):
+        """``{"date_int": [...], field: [...]}`` lists for the rows in ``span``."""
+        data = {"date_int": self.dates[span].tolist()}
+        for field in fields:
+            data[field] = self.columns[field][span].tolist()
+        return data
+
+
+class SeriesStore:
+    """Per-process mappings of the series files."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._files = {}
+
+    def get(self, table):
+        """The mapped file of ``table`` if it is current, else None."""
+        if not getattr(settings, "ANALYTICS_SERVE_SERIES", False):
+            return None
+        tag = version_tag(data_version.get((table,)))
+        with self._lock:
+            mapped = self._files.get(table)
+        if mapped is not None and mapped.tag == tag:
+            return mapped
+        path = series_path(table)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        if mapped is None or mapped.stamp != (stat.st_ino, stat.st_mtime_ns):
+            try:
+                mapped = SeriesFile(path)
+            except (OSError, ValueError):
+                return None
+            # The old mapping closes once no reader holds a view of it.
+            with self._lock:
+                self._files[table] = mapped
+        return mapped if mapped.tag == tag else None
+
+    def recent_columns(self, model, limit):
+        """:meth:`get_recent_columns` of ``model``'s manager, or None."""
+        mapped = self.get(model._meta.db_table)
+        if mapped is None:
+            return None
+        return mapped.read(mapped.latest(limit), model.objects.columns[1:])
+
+    def recent_rows(self, model, limit):
+        """Ascending ``model.Row`` tuples of the newest rows (id None), or None."""
+        columns = self.recent_columns(model, limit)
+        if columns is None:
+            return None
+        rows = zip(*columns.values(), strict=True)
+        return [model.Row(None, *values) for values in rows]
+
+    def spec_rows(self, spec, calendar):
+        """Rows of :func:`.query.compile_spec` for ``spec``, or None.
+
+        Dates are unique, so each stored row is its own group: a sum, max or
+        percentile input is the value itself and an average is ``(value, 1)``.
+        """
+        mapped = self.get(spec.source.table)
+        if mapped is None:
+            return None
+        span = mapped.between(*time_bounds(spec, calendar))
+        columns = [mapped.dates[span].tolist()]
+        for name in spec.metrics:
+            values = mapped.columns[METRICS[name].field][span].tolist()
+            columns.append(values)
+            if spec.aggregate_of(name) == "avg":
+                columns.append([1] * len(values))
+        return list(zip(*columns, strict=True))
+
+    def clear(self):
+        with self._lock:
+            self._files.clear()
+
+
+series = SeriesStore()
@@ -0,0 +1,224 @@
+"""Slow-query log for the analytics database.
+
+Every connection to the ``analytics`` alias gets an execute wrapper that
+times each statement. Statements slower than ``ANALYTICS_SLOW_QUERY_MS`` are
+written as JSON lines to ``ANALYTICS_STATE_DIR/slow-queries.log``, which is
+rotated at ``ANALYTICS_SLOW_QUERY_LOG_BYTES`` keeping
+``ANALYTICS_SLOW_QUERY_LOG_BACKUPS`` old files. A record has:
+
+* the SQL, its params and the duration in milliseconds
+* the innermost view frame and app frame (usually a manager method) it came
+  from, found by walking the stack
+* the first time a process logs a statement, the query plan (``EXPLAIN
+  QUERY PLAN`` on SQLite, ``EXPLAIN`` on PostgreSQL)
+
+Fast statements cost two clock reads. The stack walk and the EXPLAIN only
+happen once a statement is known to be slow.
+
+``manage.py slow_queries`` summarizes the log by statement. Set
+``ANALYTICS_SLOW_QUERY_MS`` to None to turn logging off.
+"""
+
+import json
+import logging
+import sys
+import threading
+import time
+from datetime import UTC, datetime
+from pathlib import Path
+
+from django.conf import settings
+
+ALIAS = "analytics"
+PACKAGE = __name__.rpartition(".")[0]
+MAX_EXPLAINED = 1_000  # distinct statements remembered as already explained
+MAX_PARAMS = 20
+
+logger = logging.getLogger(__name__)
+logger.propagate = False
+_handler_lock = threading.Lock()
+_handler_path = None
+_explained = set()
+_local = threading.local()
+
+
+def log_path():
+    return Path(settings.ANALYTICS_STATE_DIR) / "slow-queries.log"
+
+
+def log_paths():
+    """The log and its rotated backups, newest first."""
+    path = log_path()
+    backups = getattr(settings, "ANALYTICS_SLOW_QUERY_LOG_BACKUPS", 3)
+    return [path] + [path.with_name(f"{path.name}.{i}") for i in range(1, backups + 1)]
+
+
+def _ensure_handler():
+    """Point the logger at the current log path, rotating as configured."""
+    from logging.handlers import RotatingFileHandler  # not needed at startup
+
+    global _handler_path
+    path = log_path()
+    if path == _handler_path:
+        return
+    with _handler_lock:
+        if path == _handler_path:
+            return
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        handler = RotatingFileHandler(
+            path,
+            maxBytes=getattr(settings, "ANALYTICS_SLOW_QUERY_LOG_BYTES", 5_000_000),
+            backupCount=getattr(settings, "ANALYTICS_SLOW_QUERY_LOG_BACKUPS", 3),
+            encoding="utf-8",
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        _handler_path = path
+
+
+def callers(frame):
+    """``(view, caller)``: innermost view and non-view app frames."""
+    view = caller = None
+    while frame is not None and (view is None or caller is None):
+        module = frame.f_globals.get("__name__", "")
+        # Dunder frames are plumbing (e.g. the row iterable), not callers.
+        if (
+            module.startswith(PACKAGE)
+            and module != __name__
+            and not frame.f_code.co_name.startswith("__")
+        ):
+            name = f"{module.rpartition('.')[2]}.{frame.f_code.co_qualname}"
+            if module == f"{PACKAGE}.views":
+                view = view or name
+            else:
+                caller = caller or name
+        frame = frame.f_back
+    return view, caller
+
+
+def explain(connection, sql, params):
+    """Query plan lines for ``sql``, or None if it cannot be explained."""
+    if not sql.lstrip().upper().startswith(("SELECT", "WITH")):
+        return None
+    prefix = "EXPLAIN QUERY PLAN " if connection.vendor == "sqlite" else "EXPLAIN "
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            rows = cursor.fetchall()
+    except Exception:  # the plan is best effort; never fail the query
+        return None
+    if connection.vendor == "sqlite":
+        # (id, parent, notused, detail)
+        return [row[-1] for row in rows]
+    return [row[0] for row in rows]
+
+
+def loggable(params, many):
+    if many:
+        return {"rows": len(params) if hasattr(params, "__len__") else None}
+    if params is None:
+        return None
+    params = list(params.values() if isinstance(params, dict) else params)
+    return params[:MAX_PARAMS]
+
+
+def record(connection, sql, params, many, seconds):
+    """Write one slow statement to the log."""
+    view, caller = callers(sys._getframe(2))
+    entry = {
+        "at": datetime.now(UTC).isoformat(timespec="milliseconds"),
+        "ms": round(seconds * 1000, 2),
+        "sql": sql,
+        "params": loggable(params, many),
+        "view": view,
+        "caller": caller,
+    }
+    key = (connection.alias, sql)
+    if not many and key not in _explained:
+        if len(_explained) >= MAX_EXPLAINED:
+            _explained.clear()
+        _explained.add(key)
+        entry["plan"] = explain(connection, sql, params)
+    _ensure_handler()
+    logger.info(json.dumps(entry, default=str))
+
+
+def slow_query_wrapper(execute, sql, params, many, context):
+    threshold = getattr(settings, "ANALYTICS_SLOW_QUERY_MS", None)
+    if threshold is None or getattr(_local, "active", False):
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        seconds = time.perf_counter() - start
+        if seconds * 1000 >= threshold:
+            _local.active = True
+            try:
+                record(context["connection"], sql, params, many, seconds)
+            finally:
+                _local.active = False
+
+
+def install(sender, connection, **kwargs):
+    """``connection_created`` handler adding the wrapper to the alias."""
+    if connection.alias == ALIAS and slow_query_wrapper not in (
+        connection.execute_wrappers
+    ):
+        connection.execute_wrappers.append(slow_query_wrapper)
+
+
+def clear():
+    """Forget which statements were explained, so they are again."""
+    _explained.clear()
+
+
+def read_log(paths=None):
+    """Parsed records from the log and its backups, oldest first."""
+    records = []
+    for path in reversed(paths or log_paths()):
+        try:
+            lines = path.read_text(encoding="utf-8").splitlines()
+        except FileNotFoundError:
+            continue
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def summarize(records):
+    """Per-statement totals, worst total time first.
+
+    Returns dicts with the statement's ``sql``, ``count``, ``total_ms``,
+    ``max_ms``, the ``callers`` seen and its latest ``plan``.
+    """
+    stats = {}
+    for entry in records:
+        item = stats.setdefault(
+            entry["sql"],
+            {
+                "sql": entry["sql"],
+                "count": 0,
+                "total_ms": 0.0,
+                "max_ms": 0.0,
+                "callers": {},
+                "plan": None,
+            },
+        )
+        item["count"] += 1
+        item["total_ms"] += entry["ms"]
+        item["max_ms"] = max(item["max_ms"], entry["ms"])
+        where = " <- ".join(
+            name for name in (entry.get("caller"), entry.get("view")) if name
+        )
+        item["callers"][where or "?"] = None
+        if entry.get("plan"):
+            item["plan"] = entry["plan"]
+    return sorted(stats.values(), key=lambda item: item["total_ms"], reverse=True)
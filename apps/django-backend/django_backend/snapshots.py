@@ -0,0 +1,308 @@
+"""Pre-rendered endpoint snapshots.
+
+The analytics data changes a few times a day, but every cache miss in every
+process re-renders it. ``manage.py publish_snapshots`` (run after each
+ingest) renders the JSON response of every published endpoint, for each
+parameter value its ``snapshot_variants`` lists, into
+``ANALYTICS_SNAPSHOT_DIR``:
+
+* ``objects/ab/<sha256>.json``: one file per distinct body, named by its
+  digest, next to ``.gz``/``.br``/``.zst`` precompressed variants.
+  Identical bodies (``limit=60`` on a 15-row table and ``limit=15``) are
+  stored once.
+* ``manifest.json``: for each variant, its URL and digest, plus the data
+  version and content checksum of each source table at publish time.
+
+Publishing is incremental. A view is re-rendered only when the checksum of
+one of its tables changed since the last manifest (or with ``--force``).
+The checksum is a row count, max id and per-column sums, so it also catches
+Prisma's in-place upserts.
+
+With ``ANALYTICS_SERVE_SNAPSHOTS`` on, views answer JSON requests whose
+normalized params were published straight from these files, with a weak
+ETag of the digest and 304s for matching ``If-None-Match``. A snapshot is
+only served while its tables' data version matches the one recorded at
+publish time. Otherwise the view falls back to rendering live. A front
+proxy can serve the same files from the manifest's url -> digest map.
+"""
+
+import hashlib
+import json
+import threading
+from datetime import UTC, datetime
+from pathlib import Path
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.db import connections
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+
+from .caching import COMPRESSORS, MAX_LEVELS, compress_variants, negotiate_encoding
+from .models import (
+    DeviceShare,
+    EpochMillisField,
+    KpiSnapshot,
+    RevenueDaily,
+    SignupByChannel,
+    TrafficDaily,
+)
+from .query import epoch_ms
+from .versioning import data_version
+
+MANIFEST_VERSION = 1
+CONTENT_TYPE = "application/json"
+EXTENSIONS = {"br": ".br", "zstd": ".zst", "gzip": ".gz"}
+MODELS = (KpiSnapshot, TrafficDaily, SignupByChannel, RevenueDaily, DeviceShare)
+
+
+def snapshot_dir():
+    configured = getattr(settings, "ANALYTICS_SNAPSHOT_DIR", None)
+    return Path(configured or Path(settings.ANALYTICS_STATE_DIR) / "snapshots")
+
+
+def object_path(root, digest, coding=None):
+    return root / "objects" / digest[:2] / f"{digest}.json{EXTENSIONS.get(coding, '')}"
+
+
+def variant_key(view_name, params):
+    """Manifest key of a view's normalized params (as passed to ``cached``)."""
+    return f"{view_name}?{json.dumps(params, sort_keys=True, default=str)}"
+
+
+def variant_url(path, params):
+    """A URL the view answers with ``params``."""
+    query = [
+        (name, str(value).lower() if isinstance(value, bool) else value)
+        for name, value in sorted(params.items())
+    ]
+    return f"{path}?{urlencode(query)}" if query else path
+
+
+def table_checksums(using="analytics"):
+    """``{table: [count, max id, column sums...]}``, read in one query.
+
+    Unlike :func:`versioning.table_fingerprints` this changes when a row is
+    updated in place, and only for the table the row is in.
+    """
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    terms = []
+    for model in MODELS:
+        table = qn(model._meta.db_table)
+        sums = ["COUNT(*)", "MAX(id)"]
+        for field in model._meta.fields:
+            if field.primary_key:
+                continue
+            column = qn(field.column)
+            if isinstance(field, EpochMillisField):
+                column = epoch_ms(connection, column)
+            elif field.get_internal_type() == "TextField":
+                column = f"LENGTH({column})"
+            sums.append(f"SUM(CAST({column} AS DOUBLE PRECISION))")
+        terms.append([f"(SELECT {term} FROM {table})" for term in sums])
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT {', '.join(sum(terms, []))}")
+        row = list(cursor.fetchone())
+    checksums, start = {}, 0
+    for model, model_terms in zip(MODELS, terms, strict=True):
+        checksums[model._meta.db_table] = row[start : start + len(model_terms)]
+        start += len(model_terms)
+    return checksums
+
+
+def _write(path, body):
+    tmp = path.with_name(f"{path.name}.tmp")
+    tmp.write_bytes(body)
+    tmp.replace(path)
+
+
+def write_object(root, body):
+    """Store ``body`` and its compressed variants; return its digest."""
+    digest = hashlib.sha256(body).hexdigest()
+    path = object_path(root, digest)
+    if path.exists():
+        return digest
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if len(body) >= getattr(settings, "ANALYTICS_COMPRESSION_MIN_BYTES", 512):
+        # Published once, served many times: spend the time on the ratio.
+        for coding, variant in compress_variants(body, MAX_LEVELS).items():
+            _write(object_path(root, digest, coding), variant)
+    # The identity file last: its presence means the object is complete.
+    _write(path, body)
+    return digest
+
+
+def load_manifest(root=None):
+    try:
+        manifest = json.loads(((root or snapshot_dir()) / "manifest.json").read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+    return manifest if manifest.get("version") == MANIFEST_VERSION else None
+
+
+def publish(views, force=False, calendar=None):
+    """Render ``{url name: view class}`` into the snapshot directory.
+
+    Returns ``{"rendered", "kept", "objects", "removed"}`` counts: variants
+    rendered and carried over, distinct objects referenced, and unreferenced
+    objects deleted.
+    """
+    from .dates import get_calendar
+
+    calendar = calendar or get_calendar()
+    root = snapshot_dir()
+    root.mkdir(parents=True, exist_ok=True)
+    old = load_manifest(root) or {"checksums": {}, "entries": {}}
+    # Versions are read before rendering: data written meanwhile leaves the
+    # manifest behind the database, so views fall back to live rendering.
+    data_version.invalidate()
+    versions = {
+        ",".join(view.tables): repr(data_version.get(view.tables))
+        for view in views.values()
+    }
+    checksums = table_checksums()
+    renderer = JSONRenderer()
+    entries, rendered, kept = {}, 0, 0
+    for name, view in views.items():
+        previous = {
+            key: entry
+            for key, entry in old["entries"].items()
+            if entry["endpoint"] == name
+        }
+        unchanged = all(
+            old["checksums"].get(table) == checksums[table] for table in view.tables
+        )
+        if previous and unchanged and not force:
+            entries.update(previous)
+            kept += len(previous)
+            continue
+        path = reverse(name)
+        for params, compute in view.snapshot_variants(calendar):
+            digest = write_object(root, renderer.render(compute()))
+            entries[variant_key(view.__name__, params)] = {
+                "endpoint": name,
+                "url": variant_url(path, params),
+                "digest": digest,
+            }
+            rendered += 1
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "published_at": datetime.now(UTC).isoformat(timespec="seconds"),
+        "tz": calendar.tz_name,
+        "checksums": checksums,
+        "versions": versions,
+        "entries": entries,
+    }
+    _write(root / "manifest.json", json.dumps(manifest, indent=1).encode())
+    # Keep objects of the previous manifest too: processes that have not
+    # reloaded yet may still serve them.
+    live = {entry["digest"] for entry in entries.values()}
+    keep = live | {entry["digest"] for entry in old["entries"].values()}
+    removed = 0
+    for path in root.glob("objects/*/*"):
+        if path.name.split(".", 1)[0] not in keep:
+            path.unlink(missing_ok=True)
+            removed += 1
+    return {
+        "rendered": rendered,
+        "kept": kept,
+        "objects": len(live),
+        "removed": removed,
+    }
+
+
+class SnapshotPayload:
+    """A published body and its variants, served like a cache entry."""
+
+    __slots__ = ("data", "body", "content_type", "variants", "digest")
+
+    def __init__(self, root, digest):
+        self.data = None  # never parsed; the body is served as is
+        self.digest = digest
+        self.content_type = CONTENT_TYPE
+        self.body = object_path(root, digest).read_bytes()
+        self.variants = {}
+        for coding in COMPRESSORS:
+            try:
+                self.variants[coding] = object_path(root, digest, coding).read_bytes()
+            except FileNotFoundError:
+                continue
+
+    @property
+    def etag(self):
+        return f'W/"{self.digest}"'
+
+    def select(self, accept_encoding):
+        """Return ``(coding, body)`` for the client's Accept-Encoding."""
+        coding = negotiate_encoding(accept_encoding, self.variants)
+        if coding is None:
+            return None, self.body
+        return coding, self.variants[coding]
+
+
+class SnapshotStore:
+    """Per-process view of the published manifest and its objects.
+
+    The manifest is re-read when its file changes; loaded payloads are kept
+    by digest, so a republish only loads objects that changed.
+    """
+
+    max_payloads = 256
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._manifest = None
+        self._root = None
+        self._payloads = {}
+
+    def lookup(self, view_name, params, tables, version):
+        """The published payload for a request, or None to render live."""
+        if not getattr(settings, "ANALYTICS_SERVE_SNAPSHOTS", False):
+            return None
+        manifest = self._current()
+        if manifest is None:
+            return None
+        entry = manifest["entries"].get(variant_key(view_name, params))
+        if entry is None or manifest["versions"].get(",".join(tables)) != repr(version):
+            return None
+        return self._payload(entry["digest"])
+
+    def _current(self):
+        root = snapshot_dir()
+        try:
+            stat = (root / "manifest.json").stat()
+        except FileNotFoundError:
+            return None
+        stamp = (root, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if stamp != self._stamp:
+                self._manifest = load_manifest(root)
+                self._stamp = stamp
+                self._root = root
+            return self._manifest
+
+    def _payload(self, digest):
+        with self._lock:
+            payload = self._payloads.get(digest)
+        if payload is None:
+            try:
+                payload = SnapshotPayload(self._root, digest)
+            except FileNotFoundError:
+                return None
+            with self._lock:
+                if len(self._payloads) >= self.max_payloads:
+                    self._payloads.clear()
+                self._payloads[digest] = payload
+        return payload
+
+    def clear(self):
+        with self._lock:
+            self._stamp = None
+            self._manifest = None
+            self._root = None
+            self._payloads.clear()
+
+
+snapshots = SnapshotStore()
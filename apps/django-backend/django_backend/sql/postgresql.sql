@@ -0,0 +1,65 @@
+-- Analytics tables for a PostgreSQL "analytics" database.
+--
+-- Same tables and columns as prisma/migrations, with dates as timestamptz.
+-- The unique B-tree indexes serve point lookups, latest-N reads and upserts.
+-- The date columns of the append-mostly daily tables also get BRIN indexes:
+-- a few pages that let long range scans skip most of the heap. Prisma's
+-- plain B-tree "*_date_idx" duplicates of the unique indexes are left out.
+--
+-- Apply with: python manage.py create_analytics_schema
+
+CREATE TABLE IF NOT EXISTS "KpiSnapshot" (
+    "id" INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    "capturedAt" TIMESTAMPTZ NOT NULL,
+    "totalUsers" INTEGER NOT NULL,
+    "sessions" INTEGER NOT NULL,
+    "conversionPct" DOUBLE PRECISION NOT NULL,
+    "revenueCents" INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS "TrafficDaily" (
+    "id" INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    "date" TIMESTAMPTZ NOT NULL,
+    "visits" INTEGER NOT NULL,
+    "sessions" INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS "SignupByChannel" (
+    "id" INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    "year" INTEGER NOT NULL,
+    "month" INTEGER NOT NULL,
+    "channel" TEXT NOT NULL,
+    "signups" INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS "RevenueDaily" (
+    "id" INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    "date" TIMESTAMPTZ NOT NULL,
+    "valueCents" INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS "DeviceShare" (
+    "id" INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    "snapshotDate" TIMESTAMPTZ NOT NULL,
+    "device" TEXT NOT NULL,
+    "sharePct" DOUBLE PRECISION NOT NULL
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS "KpiSnapshot_capturedAt_key"
+    ON "KpiSnapshot" ("capturedAt");
+CREATE UNIQUE INDEX IF NOT EXISTS "TrafficDaily_date_key"
+    ON "TrafficDaily" ("date");
+CREATE INDEX IF NOT EXISTS "TrafficDaily_date_brin"
+    ON "TrafficDaily" USING BRIN ("date");
+CREATE INDEX IF NOT EXISTS "SignupByChannel_year_month_idx"
+    ON "SignupByChannel" ("year", "month");
+CREATE UNIQUE INDEX IF NOT EXISTS "SignupByChannel_year_month_channel_key"
+    ON "SignupByChannel" ("year", "month", "channel");
+CREATE UNIQUE INDEX IF NOT EXISTS "RevenueDaily_date_key"
+    ON "RevenueDaily" ("date");
+CREATE INDEX IF NOT EXISTS "RevenueDaily_date_brin"
+    ON "RevenueDaily" USING BRIN ("date");
+CREATE INDEX IF NOT EXISTS "DeviceShare_snapshotDate_idx"
+    ON "DeviceShare" ("snapshotDate");
+CREATE UNIQUE INDEX IF NOT EXISTS "DeviceShare_snapshotDate_device_key"
+    ON "DeviceShare" ("snapshotDate", "device");
@@ -0,0 +1,175 @@
+"""Server-Sent Events fan-out for live dashboard widgets.
+
+Without a stream every dashboard polls every endpoint to notice new data.
+``/analytics/stream`` instead holds one SSE connection per dashboard. A
+single :class:`TableWatcher` per process polls the data version (see
+:mod:`django_backend.versioning`) once per interval for all connections. A
+widget's payload is recomputed only when the version of its tables moves. It
+is pushed only when the rendered payload actually differs from the last one
+sent, so 1,000 connected dashboards cost one poll loop and one computation
+per changed widget.
+
+Slow clients are handled by conflation. Each :class:`Subscriber` keeps at
+most one pending event per widget, so a client that reads slower than the
+data changes skips intermediate versions instead of buffering them. Memory
+per client stays bounded and the newest payload is always the one delivered.
+Transport-level backpressure is left to the ASGI server, whose ``send``
+blocks while the socket buffer is full.
+
+The stream needs an ASGI server. Under WSGI, Django buffers async iterators.
+"""
+
+import asyncio
+import contextlib
+import json
+import logging
+from typing import Any, NamedTuple
+
+from asgiref.sync import sync_to_async
+
+from .dates import get_calendar
+from .versioning import data_version
+
+logger = logging.getLogger(__name__)
+
+
+class Widget(NamedTuple):
+    """A dashboard widget: the tables it reads and how to build its payload."""
+
+    tables: tuple
+    compute: Any  # callable(calendar) -> JSON-serializable payload
+
+
+def format_event(seq, name, body):
+    """Encode one SSE event; ``body`` is single-line JSON."""
+    return f"id: {seq}\nevent: {name}\ndata: {body}\n\n".encode()
+
+
+class Subscriber:
+    """One connected client and its pending events, conflated per widget."""
+
+    def __init__(self, widgets, tz_name):
+        self.channels = frozenset((name, tz_name) for name in widgets)
+        self.pending = {}
+        self.delivered = 0
+        self.conflated = 0
+        self._wake = asyncio.Event()
+
+    def offer(self, name, event):
+        """Queue ``event`` for widget ``name``, replacing an unsent one."""
+        if name in self.pending:
+            self.conflated += 1
+        self.pending[name] = event
+        self._wake.set()
+
+    async def next_events(self, timeout):
+        """Wait up to ``timeout`` seconds and drain the pending events."""
+        if not self.pending:
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self._wake.wait(), timeout)
+        self._wake.clear()
+        events = list(self.pending.values())
+        self.pending.clear()
+        self.delivered += len(events)
+        return events
+
+
+class TableWatcher:
+    """Per-process poll loop fanning widget payloads out to subscribers.
+
+    The loop runs while anyone is subscribed and stops with the last
+    subscriber. Channels are ``(widget, tz)`` pairs, so one computation
+    serves every subscriber of the same widget and timezone.
+    """
+
+    def __init__(self, widgets, interval=1.0, version=None):
+        self.widgets = widgets
+        self.interval = interval
+        self.version = version or data_version.get
+        self.polls = 0
+        self._channels = {}
+        # channel -> (data version, JSON body, encoded event)
+        self._last = {}
+        self._seq = 0
+        self._task = None
+
+    @property
+    def subscribers(self):
+        return {sub for subs in self._channels.values() for sub in subs}
+
+    async def subscribe(self, subscriber):
+        """Register ``subscriber`` and queue the current payload of each widget."""
+        for channel in subscriber.channels:
+            self._channels.setdefault(channel, set()).add(subscriber)
+        changed = await sync_to_async(self._collect)(subscriber.channels)
+        self._publish(changed)
+        fresh = {channel for channel, _ in changed}
+        for channel in subscriber.channels - fresh:
+            subscriber.offer(channel[0], self._last[channel][2])
+        self._ensure_running()
+
+    def unsubscribe(self, subscriber):
+        for channel in subscriber.channels:
+            subs = self._channels.get(channel)
+            if subs is not None:
+                subs.discard(subscriber)
+                if not subs:
+                    del self._channels[channel]
+                    self._last.pop(channel, None)
+
+    async def stream(self, subscriber, heartbeat=15.0):
+        """Yield SSE bytes for ``subscriber`` until the client goes away."""
+        try:
+            await self.subscribe(subscriber)
+            yield f"retry: {int(self.interval * 1000) * 3}\n\n".encode()
+            while True:
+                events = await subscriber.next_events(heartbeat)
+                yield b"".join(events) if events else b": keepalive\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        task = self._task
+        if task is None or task.done() or task.get_loop() is not loop:
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while self._channels:
+            await asyncio.sleep(self.interval)
+            self.polls += 1
+            try:
+                changed = await sync_to_async(self._collect)(list(self._channels))
+            except Exception:
+                logger.exception("analytics stream poll failed")
+                continue
+            self._publish(changed)
+
+    def _collect(self, channels):
+        """Recompute channels whose tables changed; return new events.
+
+        Runs in a worker thread (it queries the database).
+        """
+        changed = []
+        for channel in channels:
+            name, tz_name = channel
+            widget = self.widgets[name]
+            version = self.version(widget.tables)
+            last = self._last.get(channel)
+            if last is not None and last[0] == version:
+                continue
+            payload = widget.compute(get_calendar(tz_name))
+            body = json.dumps(payload, separators=(",", ":"))
+            if last is not None and last[1] == body:
+                self._last[channel] = (version, body, last[2])
+                continue
+            self._seq += 1
+            event = format_event(self._seq, name, body)
+            self._last[channel] = (version, body, event)
+            changed.append((channel, event))
+        return changed
+
+    def _publish(self, changed):
+        for channel, event in changed:
+            for subscriber in self._channels.get(channel, ()):
+                subscriber.offer(channel[0], event)
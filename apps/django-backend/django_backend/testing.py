@@ -0,0 +1,189 @@
+"""Analytics test database: the Prisma schema plus synthetic data.
+
+Tests run against the schema Prisma actually creates, applied from the SQL
+in ``prisma/migrations`` (DATETIME-declared date columns and every index),
+rather than hand-written approximations of it. A :class:`Dataset`
+describes the synthetic rows. Its defaults are the small fixture set the
+test suite asserts against, and larger ones scale the daily, monthly and
+snapshot tables for performance tests.
+
+Building a dataset is done once. The schema and rows are bulk-loaded into a
+template SQLite file under ``ANALYTICS_STATE_DIR/test-templates``, named by
+a digest of the migrations and the dataset. Each test process then copies
+the template into its analytics test database with the SQLite backup API,
+which costs a page copy instead of re-running DDL and inserts. A PostgreSQL
+analytics database gets the schema from ``sql/postgresql.sql`` and the same
+rows through ``bulk_create``.
+"""
+
+import hashlib
+import os
+import sqlite3
+from pathlib import Path
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import connections
+
+from .dates import DAY_MS
+from .models import (
+    DeviceShare,
+    KpiSnapshot,
+    RevenueDaily,
+    SignupByChannel,
+    TrafficDaily,
+)
+from .schema import create_postgres_schema
+
+MIGRATIONS = Path(__file__).resolve().parents[3] / "prisma" / "migrations"
+FACTORY_VERSION = 1  # bump when the generated rows change
+
+START_MS = 1704441600000  # Jan 5, 2024 08:00 UTC: first day, latest snapshot
+KPIS = (
+    (1704441600000, 15234, 45678, 3.2, 123456),
+    (1704528000000, 15500, 46000, 3.5, 150000),
+)
+CHANNELS = ("organic", "paid", "referral", "social")
+DEVICES = (("desktop", 45.5), ("mobile", 40.2), ("tablet", 14.3))
+
+
+class Dataset(NamedTuple):
+    """Shape of the synthetic analytics data."""
+
+    days: int = 15  # TrafficDaily/RevenueDaily rows, daily from START_MS
+    months: int = 2  # SignupByChannel months per channel, back from 2024-01
+    snapshots: int = 2  # DeviceShare snapshots, daily back from START_MS
+
+    def tables(self):
+        """``(model, columns, rows)`` per table, in insertion order."""
+        yield (
+            KpiSnapshot,
+            ("capturedat", "totalusers", "sessions", "conversionpct", "revenuecents"),
+            iter(KPIS),
+        )
+        yield (
+            TrafficDaily,
+            ("date", "visits", "sessions"),
+            (
+                (START_MS + i * DAY_MS, 1000 + i * 10, 800 + i * 8)
+                for i in range(self.days)
+            ),
+        )
+        yield (
+            RevenueDaily,
+            ("date", "valuecents"),
+            ((START_MS + i * DAY_MS, 50000 + i * 1000) for i in range(self.days)),
+        )
+        yield (
+            SignupByChannel,
+            ("year", "month", "channel", "signups"),
+            (
+                (*month_back(k), channel, self._signups(channel, k))
+                for channel in CHANNELS
+                for k in range(self.months)
+            ),
+        )
+        yield (
+            DeviceShare,
+            ("snapshotdate", "device", "sharepct"),
+            (
+                (START_MS - k * DAY_MS, device, share - 5 if k else share)
+                for device, share in DEVICES
+                for k in range(self.snapshots)
+            ),
+        )
+
+    @staticmethod
+    def _signups(channel, months_back):
+        return 100 * (ord(channel[0]) % 10) if months_back == 0 else 50
+
+
+DEFAULT_DATASET = Dataset()
+
+
+def month_back(months):
+    """``(year, month)`` that many months before January 2024."""
+    year, month = divmod(2024 * 12 - months, 12)
+    return year, month + 1
+
+
+def migration_scripts():
+    """Prisma migration SQL, oldest first."""
+    return [path.read_text() for path in sorted(MIGRATIONS.glob("*/migration.sql"))]
+
+
+def apply_migrations(connection):
+    """Create the Prisma schema on a raw ``sqlite3`` connection."""
+    for script in migration_scripts():
+        connection.executescript(script)
+
+
+def insert_sql(model, columns):
+    names = ", ".join(f'"{model._meta.get_field(name).column}"' for name in columns)
+    placeholders = ", ".join("?" * len(columns))
+    return f'INSERT INTO "{model._meta.db_table}" ({names}) VALUES ({placeholders})'
+
+
+def build_template(path, dataset=DEFAULT_DATASET):
+    """Write the schema and ``dataset`` to a new SQLite file at ``path``."""
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute("PRAGMA journal_mode=OFF")
+        connection.execute("PRAGMA synchronous=OFF")
+        apply_migrations(connection)
+        for model, columns, rows in dataset.tables():
+            connection.executemany(insert_sql(model, columns), rows)
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def template_path(dataset=DEFAULT_DATASET):
+    digest = hashlib.sha256(
+        repr((FACTORY_VERSION, tuple(dataset), migration_scripts())).encode()
+    ).hexdigest()[:16]
+    return Path(settings.ANALYTICS_STATE_DIR) / "test-templates" / f"{digest}.db"
+
+
+def ensure_template(dataset=DEFAULT_DATASET):
+    """Path of the template for ``dataset``, building it if missing."""
+    path = template_path(dataset)
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.unlink(missing_ok=True)
+        build_template(tmp, dataset)
+        tmp.replace(path)
+    return path
+
+
+def load_test_data(connection, dataset=DEFAULT_DATASET):
+    """Replace the contents of the analytics test database with ``dataset``."""
+    if connection.vendor == "postgresql":
+        create_postgres_schema(connection)
+        for model, columns, rows in dataset.tables():
+            model.objects.using(connection.alias).bulk_create(
+                (model(**dict(zip(columns, row, strict=True))) for row in rows),
+                batch_size=5_000,
+            )
+        return
+    connection.ensure_connection()
+    source = sqlite3.connect(ensure_template(dataset))
+    try:
+        source.backup(connection.connection)
+    finally:
+        source.close()
+
+
+_prepared = set()
+
+
+def prepare_test_database(alias="analytics", dataset=DEFAULT_DATASET):
+    """Load ``dataset`` into ``alias``'s test database, once per process.
+
+    Tests must not commit: each test's changes are rolled back, so the
+    loaded rows serve every test case in the process.
+    """
+    if alias not in _prepared:
+        load_test_data(connections[alias], dataset)
+        _prepared.add(alias)
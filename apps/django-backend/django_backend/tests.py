@@ -1,138 +1,139 @@
 """Tests for analytics API endpoints, models, and serializers."""
 
-from datetime import datetime
-
+import asyncio
+import gzip
+import io
+import json
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import UTC, date, datetime
+from importlib.util import find_spec
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import skipUnless
+from zoneinfo import ZoneInfo
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.db import connections
-from django.test import TestCase
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
 from rest_framework.test import APITestCase
 
+from benchmarks.parity import Backend, diff_json, read_mix
+from benchmarks.startup import probe
+
+from .admission import Admission, ClientBuckets, Overloaded, TokenBucket, admission
+from .anomalies import AnomalyDetector, detectors, load_detector
+from .caching import (
+    MAX_LEVELS,
+    CachedPayload,
+    ResponseCache,
+    compress_variants,
+    negotiate_encoding,
+    response_cache,
+)
+from .changes import (
+    acknowledge,
+    change_heads,
+    changed_rows,
+    changes_since,
+    compact_changes,
+    last_seq,
+    position,
+)
+from .coalescing import SingleFlight, request_key
+from .cohorts import ROLLING_WINDOWS, SignupMatrix, matrices
+from .comparison import compare, compile_comparison, windows
+from .dates import Calendar, get_calendar
+from .kpis import (
+    DAY_MS,
+    KpiEngine,
+    RollingWindow,
+    load_engine,
+    save_engine,
+    sync_engine,
+)
 from .models import (
     DeviceShare,
+    EpochMillisField,
     KpiSnapshot,
     RevenueDaily,
     SignupByChannel,
     TrafficDaily,
 )
+from .profiling import list_profiles
+from .query import compile_spec, parse_spec, run_query
+from .retention import apply_retention, detach
+from .sampling import Reservoir, load_sample, samples
 from .serializers import (
     DeviceShareResponseSerializer,
     KpiResponseSerializer,
     RevenuePointSerializer,
     TrafficPointSerializer,
 )
+from .series import SeriesFile, export, series, series_path
+from .slow_queries import clear as clear_explained
+from .slow_queries import read_log
+from .snapshots import load_manifest, publish, snapshots
+from .streaming import Subscriber, TableWatcher, Widget
+from .testing import (
+    START_MS,
+    Dataset,
+    ensure_template,
+    load_test_data,
+    prepare_test_database,
+)
+from .versioning import data_version
+from .views import KpisView, SignupRollingView, TrafficView, stream_watcher
 
 
-class BaseTestCase(TestCase):
-    """Base test case with common fixtures."""
-
-    databases = ["analytics"]
+class StateDirMixin:
+    """Per-test ANALYTICS_STATE_DIR for tests that persist state."""
 
-    @classmethod
-    def _create_schema(cls):
-        """Create tables for unmanaged models."""
-        with connections["analytics"].cursor() as cursor:
-            # Create tables with Django's expected id column
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS KpiSnapshot (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    capturedAt INTEGER UNIQUE NOT NULL,
-                    totalUsers INTEGER NOT NULL,
-                    sessions INTEGER NOT NULL,
-                    conversionPct REAL NOT NULL,
-                    revenueCents INTEGER NOT NULL
-                )
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS TrafficDaily (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    date INTEGER UNIQUE NOT NULL,
-                    visits INTEGER NOT NULL,
-                    sessions INTEGER NOT NULL
-                )
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS RevenueDaily (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    date INTEGER UNIQUE NOT NULL,
-                    valueCents INTEGER NOT NULL
-                )
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS SignupByChannel (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    year INTEGER NOT NULL,
-                    month INTEGER NOT NULL,
-                    channel TEXT NOT NULL,
-                    signups INTEGER NOT NULL,
-                    UNIQUE (year, month, channel)
-                )
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS DeviceShare (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    snapshotDate INTEGER NOT NULL,
-                    device TEXT NOT NULL,
-                    sharePct REAL NOT NULL,
-                    UNIQUE (snapshotDate, device)
-                )
-            """)
+    def use_state_dir(self, **extra_settings):
+        """Override ANALYTICS_STATE_DIR with a temp dir for this test; return it."""
+        state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(state_dir.cleanup)
+        settings_override = override_settings(
+            ANALYTICS_STATE_DIR=state_dir.name, **extra_settings
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        return Path(state_dir.name)
 
-    @classmethod
-    def setUpTestData(cls):
-        """Create test data once for the entire test class."""
-        # Create schema for unmanaged models
-        cls._create_schema()
-
-        # KPI snapshots
-        cls.kpi1 = KpiSnapshot.objects.create(
-            capturedat=1704441600000,  # Jan 5, 2024
-            totalusers=15234,
-            sessions=45678,
-            conversionpct=3.2,
-            revenuecents=123456,
-        )
-        cls.kpi2 = KpiSnapshot.objects.create(
-            capturedat=1704528000000,  # Jan 6, 2024
-            totalusers=15500,
-            sessions=46000,
-            conversionpct=3.5,
-            revenuecents=150000,
-        )
-
-        # Traffic data
-        for i in range(15):
-            TrafficDaily.objects.create(
-                date=1704441600000 + (i * 86400000),  # Daily increments
-                visits=1000 + i * 10,
-                sessions=800 + i * 8,
-            )
 
-        # Revenue data
-        for i in range(15):
-            RevenueDaily.objects.create(
-                date=1704441600000 + (i * 86400000),
-                valuecents=50000 + i * 1000,
-            )
+class BaseTestCase(StateDirMixin, TestCase):
+    """Base test case with common fixtures."""
 
-        # Signup data (two months)
-        channels = ["organic", "paid", "referral", "social"]
-        for channel in channels:
-            signups = 100 * (ord(channel[0]) % 10)
-            SignupByChannel.objects.create(
-                year=2024, month=1, channel=channel, signups=signups
-            )
-            SignupByChannel.objects.create(
-                year=2023, month=12, channel=channel, signups=50
-            )
+    databases = ["analytics"]
 
-        # Device share data (two snapshots)
-        devices = [("desktop", 45.5), ("mobile", 40.2), ("tablet", 14.3)]
-        for device, share in devices:
-            DeviceShare.objects.create(
-                snapshotdate=1704441600000, device=device, sharepct=share
-            )
-            DeviceShare.objects.create(
-                snapshotdate=1704355200000, device=device, sharepct=share - 5
-            )
+    @classmethod
+    def setUpClass(cls):
+        # The Prisma schema and fixture rows, copied from a cached template.
+        prepare_test_database()
+        super().setUpClass()
+
+    def setUp(self):
+        # Rolled-back test transactions fire no signals; start every test
+        # with fresh data versions and an empty response cache.
+        super().setUp()
+        data_version.invalidate()
+        response_cache.clear()
+        samples.clear()
+        detectors.clear()
+        matrices.clear()
+        admission.reset()
+        snapshots.clear()
+        series.clear()
 
 
 # API Endpoint Tests
@@ -239,6 +240,73 @@ class TrafficEndpointTest(BaseTestCase, APITestCase):
         visits = [point["visits"] for point in response.data["data"]]
         self.assertEqual(visits, sorted(visits))
 
+    def test_timezone_parameter(self):
+        """Labels follow the tz parameter."""
+        utc = self.client.get("/analytics/traffic/?limit=15&tz=UTC")
+        hst = self.client.get("/analytics/traffic/?limit=15&tz=Pacific/Honolulu")
+        self.assertEqual(utc.data["data"][0]["day"], "Jan 5")
+        self.assertEqual(hst.data["data"][0]["day"], "Jan 4")
+
+    def test_unknown_timezone(self):
+        """Rejects an unknown tz."""
+        response = self.client.get("/analytics/traffic/?tz=Mars/Olympus")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("error", response.data)
+
+
+@skipUnless(find_spec("msgpack"), "msgpack not installed")
+class ColumnarFormatTest(BaseTestCase, APITestCase):
+    """Tests for columnar binary encodings of the time-series endpoints."""
+
+    def test_msgpack_traffic_columns(self):
+        """MessagePack returns one array per column matching the JSON rows."""
+        import msgpack
+
+        json_rows = self.client.get("/analytics/traffic/?limit=5").data["data"]
+        response = self.client.get(
+            "/analytics/traffic/?limit=5", HTTP_ACCEPT="application/x-msgpack"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/x-msgpack")
+        columns = msgpack.unpackb(response.content)
+        self.assertEqual(columns["day"], [row["day"] for row in json_rows])
+        self.assertEqual(columns["visits"], [row["visits"] for row in json_rows])
+
+    def test_msgpack_revenue_columns(self):
+        """Revenue columns carry rounded dollar values."""
+        import msgpack
+
+        response = self.client.get(
+            "/analytics/revenue/?limit=3", HTTP_ACCEPT="application/x-msgpack"
+        )
+        columns = msgpack.unpackb(response.content)
+        self.assertEqual(columns["value"], [620, 630, 640])
+
+    @skipUnless(find_spec("pyarrow"), "pyarrow not installed")
+    def test_arrow_traffic_stream(self):
+        """Arrow IPC stream decodes to the same columns."""
+        import pyarrow.ipc
+
+        response = self.client.get(
+            "/analytics/traffic/?limit=3",
+            HTTP_ACCEPT="application/vnd.apache.arrow.stream",
+        )
+        table = pyarrow.ipc.open_stream(response.content).read_all()
+        self.assertEqual(table.column_names, ["day", "visits", "sessions"])
+        self.assertEqual(table.column("visits").to_pylist(), [1120, 1130, 1140])
+
+    def test_json_remains_default(self):
+        """Requests without a binary Accept still get JSON rows."""
+        response = self.client.get("/analytics/traffic/?limit=1")
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertIn("Accept", response["Vary"])
+
+    def test_columns_skip_model_instances(self):
+        """The columnar path reads tuples, not model instances."""
+        columns = TrafficDaily.objects.get_recent_columns(3)
+        self.assertEqual(set(columns), {"date_int", "visits", "sessions"})
+        self.assertTrue(all(isinstance(v, int) for v in columns["date_int"]))
+
 
 class RevenueEndpointTest(BaseTestCase, APITestCase):
     """Tests for /analytics/revenue endpoint."""
@@ -331,9 +399,737 @@ class DeviceShareEndpointTest(BaseTestCase, APITestCase):
         self.assertEqual(names, sorted(names))
 
 
+class SignupTrendEndpointTest(BaseTestCase, APITestCase):
+    """Tests for /analytics/signups/trend endpoint."""
+
+    def test_pivoted_matrix(self):
+        """Returns months x channels, oldest month first."""
+        response = self.client.get("/analytics/signups/trend/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["periods"], ["2023-12", "2024-01"])
+        self.assertEqual(
+            response.data["channels"], ["organic", "paid", "referral", "social"]
+        )
+        self.assertEqual(response.data["values"][0], [50, 50, 50, 50])
+        self.assertEqual(response.data["values"][1], [100, 200, 400, 500])
+
+    def test_months_limit(self):
+        """Only the requested number of months is returned."""
+        response = self.client.get("/analytics/signups/trend/?months=1")
+        self.assertEqual(response.data["periods"], ["2024-01"])
+
+    def test_months_validation(self):
+        """Rejects months outside 1..60."""
+        response = self.client.get("/analytics/signups/trend/?months=0")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data["error"], "months must be between 1 and 60"
+        )
+
+
+class CompareEndpointTest(BaseTestCase, APITestCase):
+    """Tests for /analytics/compare."""
+
+    def compare(self, **params):
+        return self.client.get("/analytics/compare/", {"tz": "UTC", **params})
+
+    def test_week_against_previous(self):
+        """Mon-Wed of a week against Mon-Wed of the week before."""
+        response = self.compare(metric="visits", period="week", date="2024-01-17")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data["current"],
+            {"start": "2024-01-15", "end": "2024-01-17", "value": 3330, "days": 3},
+        )
+        self.assertEqual(
+            response.data["comparison"],
+            {"start": "2024-01-08", "end": "2024-01-10", "value": 3120, "days": 3},
+        )
+        self.assertEqual(response.data["change"], 210)
+        self.assertEqual(response.data["change_pct"], 6.7)
+
+    def test_revenue_in_dollars_without_base(self):
+        """Revenue is in dollars; an empty comparison window has no percent."""
+        response = self.compare(
+            metric="revenue", period="month", against="yoy", date="2024-01-10"
+        )
+        self.assertEqual(response.data["current"]["value"], 3150)
+        self.assertEqual(response.data["comparison"]["start"], "2023-01-01")
+        self.assertEqual(response.data["comparison"]["days"], 0)
+        self.assertEqual(response.data["change"], 3150)
+        self.assertIsNone(response.data["change_pct"])
+
+    def test_invalid_parameters(self):
+        """Unknown metrics, periods and dates are rejected."""
+        for params in (
+            {"metric": "signups"},
+            {"metric": "visits", "period": "hour"},
+            {"metric": "visits", "against": "last"},
+            {"metric": "visits", "date": "yesterday"},
+            {"metric": "visits", "date": "0001-01-15", "period": "month",
+             "against": "yoy"},
+            {"metric": "visits", "date": "0001-01-01", "period": "day"},
+            {"metric": "visits", "date": "9999-12-31", "period": "day"},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.compare(**params).status_code, 400)
+
+    @skipUnless(
+        connections["analytics"].vendor == "sqlite", "SQLite query plans"
+    )
+    def test_single_index_range_scan(self):
+        """Both windows come from one range scan of the date index."""
+        current, comparison = windows(date(2024, 1, 17), "week", "yoy")
+        connection = connections["analytics"]
+        sql, params = compile_comparison(
+            "visits", current, comparison, get_calendar("UTC"), connection
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            plan = [row[-1] for row in cursor.fetchall()]
+        self.assertEqual(len(plan), 1)
+        self.assertIn("USING INDEX TrafficDaily_date", plan[0])
+
+
+class CompareWindowsTest(SimpleTestCase):
+    """Tests for the comparison windows."""
+
+    def test_windows(self):
+        """Windows are period-to-date spans of equal length where possible."""
+        day = date.fromisoformat
+        for anchor, period, against, expected in (
+            ("2024-01-17", "day", "previous", ("2024-01-16", "2024-01-16")),
+            ("2024-01-17", "week", "yoy", ("2023-01-16", "2023-01-18")),
+            ("2024-03-31", "month", "previous", ("2024-02-01", "2024-02-29")),
+            ("2024-05-15", "quarter", "previous", ("2024-01-01", "2024-02-14")),
+            ("2024-02-29", "year", "yoy", ("2023-01-01", "2023-02-28")),
+        ):
+            with self.subTest(anchor=anchor, period=period, against=against):
+                _, comparison = windows(day(anchor), period, against)
+                self.assertEqual(comparison, tuple(map(day, expected)))
+
+
+class SignupMatrixEndpointTest(BaseTestCase, APITestCase):
+    """Tests for /analytics/signups/{growth,mix,rolling} endpoints."""
+
+    def test_growth(self):
+        """Month-over-month change per channel and in total."""
+        response = self.client.get("/analytics/signups/growth/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["periods"], ["2023-12", "2024-01"])
+        self.assertEqual(response.data["values"][0], [None] * 4)
+        self.assertEqual(response.data["values"][1], [100.0, 300.0, 700.0, 900.0])
+        self.assertEqual(response.data["total"], [None, 500.0])
+
+    def test_mix(self):
+        """Channel shares of each month's signups."""
+        response = self.client.get("/analytics/signups/mix/?months=1")
+        self.assertEqual(response.data["values"], [[8.3, 16.7, 33.3, 41.7]])
+        self.assertEqual(response.data["total"], [1200])
+
+    def test_rolling_fills_gaps(self):
+        """Missing months count as zero in trailing sums."""
+        SignupByChannel.objects.create(
+            year=2024, month=3, channel="paid", signups=10
+        )
+        response = self.client.get("/analytics/signups/rolling/?window=3")
+        self.assertEqual(
+            response.data["periods"], ["2023-12", "2024-01", "2024-02", "2024-03"]
+        )
+        self.assertEqual(response.data["values"][2], [150, 250, 450, 550])
+        self.assertEqual(response.data["values"][3], [100, 210, 400, 500])
+        self.assertEqual(response.data["total"][:2], [None, None])
+
+    def test_rolling_window_validation(self):
+        """Only 3, 6 and 12 month windows are offered."""
+        response = self.client.get("/analytics/signups/rolling/?window=4")
+        self.assertEqual(response.status_code, 400)
+
+    def test_incremental_refresh(self):
+        """New and upserted recent months update in place; older rows rebuild."""
+        matrix = matrices.get()
+        SignupByChannel.objects.filter(year=2024, month=1, channel="paid").update(
+            signups=250
+        )
+        SignupByChannel.objects.create(
+            year=2024, month=2, channel="paid", signups=10
+        )
+        data_version.invalidate()
+        self.assertIs(matrices.get(), matrix)
+        self.assertEqual(matrix.rows[-2:], [[100, 250, 400, 500], [0, 10, 0, 0]])
+        SignupByChannel.objects.create(
+            year=2023, month=6, channel="paid", signups=10
+        )
+        rebuilt = matrices.get()
+        self.assertIsNot(rebuilt, matrix)
+        self.assertEqual(rebuilt.labels(1), ["2024-02"])
+        self.assertEqual(len(rebuilt.rows), 9)
+
+    def test_older_month_upsert_rebuilds(self):
+        """An in-place update of an older month is picked up."""
+        matrix = matrices.get()
+        SignupByChannel.objects.filter(year=2023, month=12, channel="paid").update(
+            signups=120
+        )
+        SignupByChannel.objects.create(
+            year=2024, month=2, channel="paid", signups=10
+        )
+        data_version.invalidate()
+        rebuilt = matrices.get()
+        self.assertIsNot(rebuilt, matrix)
+        self.assertEqual(rebuilt.rows[0][1], 120)
+        response = self.client.get("/analytics/signups/mix/?months=3")
+        self.assertEqual(response.data["total"][0], sum(rebuilt.rows[0]))
+
+
+class SignupMatrixTest(SimpleTestCase):
+    """Tests for the dense signup matrix."""
+
+    def test_rolling_matches_direct_sums(self):
+        """Prefix-sum windows equal summing the rows directly."""
+        matrix = SignupMatrix(["a", "b"])
+        for index in range(30):
+            matrix.set_month(index, {"a": index * 3 % 7, "b": index})
+        values, totals = matrix.rolling(6, 30)
+        for i in range(5, 30):
+            rows = matrix.rows[i - 5 : i + 1]
+            expected = [sum(column) for column in zip(*rows, strict=True)]
+            self.assertEqual(values[i], expected)
+            self.assertEqual(totals[i], sum(expected))
+
+
+class DeviceShareTrendEndpointTest(BaseTestCase, APITestCase):
+    """Tests for /analytics/device-share/trend endpoint."""
+
+    def test_pivoted_matrix(self):
+        """Returns snapshots x devices, oldest snapshot first."""
+        response = self.client.get("/analytics/device-share/trend/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["periods"], ["2024-01-04", "2024-01-05"])
+        self.assertEqual(response.data["devices"], ["desktop", "mobile", "tablet"])
+        self.assertEqual(response.data["values"][1], [45.5, 40.2, 14.3])
+
+    def test_missing_cells_are_null(self):
+        """Devices absent from a snapshot are reported as null."""
+        DeviceShare.objects.create(
+            snapshotdate=1704528000000, device="watch", sharepct=1.0
+        )
+        response = self.client.get("/analytics/device-share/trend/?snapshots=2")
+        self.assertEqual(response.data["periods"], ["2024-01-05", "2024-01-06"])
+        self.assertEqual(response.data["values"][1], [None, None, None, 1.0])
+
+
 # Model Manager Tests
 
 
+class QueryEndpointTest(BaseTestCase, APITestCase):
+    """Tests for /analytics/query endpoint."""
+
+    def query(self, **spec):
+        return self.client.post("/analytics/query/", spec, format="json")
+
+    def test_weekly_rollup(self):
+        """Daily rows roll up into ISO weeks."""
+        response = self.query(metrics=["visits"], granularity="week")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data["data"],
+            [
+                {"period": "2024-W01", "visits": 3030},
+                {"period": "2024-W02", "visits": 7420},
+                {"period": "2024-W03", "visits": 5600},
+            ],
+        )
+
+    def test_date_range(self):
+        """start and end are inclusive local dates."""
+        response = self.query(
+            metrics=["visits", "sessions"], start="2024-01-06", end="2024-01-07"
+        )
+        periods = [point["period"] for point in response.data["data"]]
+        self.assertEqual(periods, ["2024-01-06", "2024-01-07"])
+        self.assertEqual(response.data["data"][0]["sessions"], 808)
+
+    def test_timezone(self):
+        """Buckets follow the tz parameter."""
+        response = self.client.get(
+            "/analytics/query/?metrics=revenue_cents&tz=Pacific/Honolulu&limit=1"
+        )
+        self.assertEqual(response.data["data"][0]["period"], "2024-01-04")
+
+    def test_group_and_filter(self):
+        """Signups grouped by channel with a channel filter, via GET."""
+        response = self.client.get(
+            "/analytics/query/?metrics=signups&granularity=quarter"
+            "&group_by=channel&channel=paid,organic"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data["data"],
+            [
+                {"period": "2023-Q4", "channel": "organic", "signups": 50},
+                {"period": "2023-Q4", "channel": "paid", "signups": 50},
+                {"period": "2024-Q1", "channel": "organic", "signups": 100},
+                {"period": "2024-Q1", "channel": "paid", "signups": 200},
+            ],
+        )
+        self.assertEqual(
+            response.data["spec"]["filters"], {"channel": ["organic", "paid"]}
+        )
+
+    def test_month_range(self):
+        """Month sources filter on (year, month)."""
+        response = self.query(metrics=["signups"], start="2024-01-01")
+        self.assertEqual(
+            response.data["data"], [{"period": "2024-01", "signups": 1200}]
+        )
+
+    def test_average(self):
+        """Averages are exact across rolled-up rows."""
+        response = self.query(metrics=["device_share_pct"], order="-period")
+        self.assertEqual(
+            response.data["data"][0],
+            {"period": "2024-01-05", "device_share_pct": 33.33},
+        )
+
+    def test_order_and_limit(self):
+        """Orders by a metric, descending, and truncates."""
+        response = self.query(
+            metrics=["visits"], granularity="week", order="-visits", limit=1
+        )
+        self.assertEqual(
+            response.data["data"], [{"period": "2024-W02", "visits": 7420}]
+        )
+
+    def test_rejects_outside_allow_list(self):
+        """Unknown metrics, mixed tables and unindexed groupings are rejected."""
+        for spec in (
+            {"metrics": ["bounce_rate"]},
+            {"metrics": ["visits", "revenue_cents"]},
+            {"metrics": ["visits"], "group_by": "channel"},
+            {"metrics": ["signups"], "granularity": "week"},
+            {"metrics": ["signups"], "filters": {"device": ["mobile"]}},
+            {"metrics": ["visits"], "order": "sessions"},
+            {"metrics": ["visits"], "start": "2024-02-01", "end": "2024-01-01"},
+            {"metrics": ["visits"], "end": "9999-12-31"},
+            {"metrics": ["visits"], "start": "9999-01-01", "end": "9999-12-31"},
+            {"metrics": ["visits"], "end": "9999-12-31", "accuracy": "approx"},
+            {"metrics": ["visits"], "start": "0001-01-01"},
+        ):
+            with self.subTest(spec=spec):
+                response = self.query(**spec)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("error", response.data)
+        response = self.client.get("/analytics/query/?metrics=visits&end=9999-12-31")
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(ANALYTICS_QUERY_ROW_BUDGET=10)
+    def test_cost_guard(self):
+        """Full scans over the row budget are rejected; ranges are allowed."""
+        response = self.query(metrics=["visits"])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("budget 10", response.data["error"])
+        response = self.query(
+            metrics=["visits"], start="2024-01-01", end="2024-01-31"
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_single_statement_and_cache(self):
+        """One parameterized statement; equivalent specs share a cache entry."""
+        self.query(metrics=["visits"], granularity="week")  # warm data version
+        response_cache.clear()
+        with self.assertNumQueries(1, using="analytics"):
+            self.query(metrics=["visits", "sessions"], start="2024-01-06")
+        with self.assertNumQueries(0, using="analytics"):
+            self.query(
+                start="2024-01-06", metrics="visits,sessions", granularity="day"
+            )
+
+
+class ApproximateQueryTest(BaseTestCase, APITestCase):
+    """Tests for accuracy=approx on /analytics/query."""
+
+    def setUp(self):
+        super().setUp()
+        self.use_state_dir()
+
+    def query(self, **spec):
+        return self.client.post("/analytics/query/", spec, format="json")
+
+    def refresh(self):
+        call_command("refresh_samples", stdout=io.StringIO())
+
+    def test_exact_until_sample_is_refreshed(self):
+        """Without a persisted sample, approx queries are answered exactly."""
+        spec = {"metrics": ["visits"], "granularity": "month", "accuracy": "approx"}
+        response = self.query(**spec)
+        self.assertEqual(response.data["spec"]["accuracy"], "exact")
+        self.assertNotIn("visits_error", response.data["data"][0])
+        self.refresh()
+        response_cache.clear()
+        response = self.query(**spec)
+        self.assertEqual(response.data["spec"]["accuracy"], "approx")
+        self.assertEqual(response.data["data"][0]["visits_error"], 0)
+
+    def test_full_sample_is_exact(self):
+        """When the sample holds every row, answers are exact with no error."""
+        self.refresh()
+        for aggregate in ("sum", "avg", "p90"):
+            spec = {"metrics": ["visits"], "granularity": "month"}
+            exact = self.query(**spec, aggregate=aggregate).data["data"][0]
+            approx = self.query(**spec, aggregate=aggregate, accuracy="approx")
+            point = approx.data["data"][0]
+            self.assertEqual(point["visits"], exact["visits"])
+            self.assertEqual(point["visits_error"], 0)
+
+    @override_settings(ANALYTICS_SAMPLE_SIZE=8)
+    def test_partial_sample_reports_error(self):
+        """A partial sample scales up sums and reports a positive error."""
+        self.refresh()
+        response = self.query(
+            metrics=["revenue_cents"], granularity="month", accuracy="approx"
+        )
+        point = response.data["data"][0]
+        self.assertGreater(point["revenue_cents_error"], 0)
+        exact = sum(50000 + i * 1000 for i in range(15))
+        self.assertLess(abs(point["revenue_cents"] - exact), exact * 0.2)
+
+    def test_exact_percentile(self):
+        """Exact percentiles use the nearest rank."""
+        response = self.query(metrics=["visits"], granularity="month", aggregate="p50")
+        self.assertEqual(response.data["data"][0]["visits"], 1070)
+
+    def test_rejects_unsampled_tables(self):
+        """Only sampled tables support accuracy=approx."""
+        response = self.query(metrics=["signups"], accuracy="approx")
+        self.assertEqual(response.status_code, 400)
+
+    def test_refresh_command_persists_samples(self):
+        """refresh_samples saves a sample that later loads unchanged."""
+        call_command("refresh_samples", stdout=io.StringIO())
+        reservoir = load_sample("traffic")
+        self.assertEqual(reservoir.seen, 15)
+        self.assertEqual(len(reservoir.rows), 15)
+        self.assertEqual(reservoir.fields, ("visits", "sessions"))
+
+
+class AnomalyEndpointTest(BaseTestCase, APITestCase):
+    """Tests for /analytics/anomalies and the traffic anomaly field."""
+
+    def setUp(self):
+        super().setUp()
+        self.use_state_dir()
+        # Ten weeks of steady growth after the fixtures, then a spike.
+        TrafficDaily.objects.bulk_create(
+            TrafficDaily(
+                date=1704441600000 + i * 86400000,
+                visits=1000 + i * 10,
+                sessions=800 + i * 8,
+            )
+            for i in range(15, 85)
+        )
+        self.spike = TrafficDaily.objects.create(
+            date=1704441600000 + 85 * 86400000, visits=5000, sessions=1480
+        )
+        data_version.invalidate()
+
+    def test_flags_spike(self):
+        """Only the spiking series on the spiking day is flagged."""
+        response = self.client.get("/analytics/anomalies/?days=7")
+        self.assertEqual(response.status_code, 200)
+        [flag] = response.data["data"]
+        self.assertEqual(flag["date"], "2024-03-30")
+        self.assertEqual(flag["series"], "visits")
+        self.assertEqual(flag["value"], 5000)
+        self.assertGreater(flag["score"], 3)
+        self.assertLess(flag["expected"], 2000)
+
+    def test_traffic_anomaly_field(self):
+        """anomalies=true adds per-point scores; the default omits the field."""
+        response = self.client.get("/analytics/traffic/?limit=2&anomalies=true")
+        quiet, spike = response.data["data"]
+        self.assertIsNone(quiet["anomaly"])
+        self.assertEqual(list(spike["anomaly"]), ["visits"])
+        response = self.client.get("/analytics/traffic/?limit=2")
+        self.assertNotIn("anomaly", response.data["data"][0])
+
+    def test_invalid_flag(self):
+        """Rejects a non-boolean anomalies parameter."""
+        response = self.client.get("/analytics/traffic/?anomalies=maybe")
+        self.assertEqual(response.status_code, 400)
+
+    def test_command_persists_detector(self):
+        """detect_anomalies saves state that later loads with its flags."""
+        call_command("detect_anomalies", stdout=io.StringIO())
+        detector = load_detector()
+        self.assertEqual(detector.watermarks["TrafficDaily"], self.spike.id)
+        self.assertIn(self.spike.date, detector.flags)
+
+
+class AnomalyDetectorTest(SimpleTestCase):
+    """Tests for the weekday EWMA detector."""
+
+    def feed(self, detector, days, spikes=()):
+        for day in days:
+            value = 1000 + 30 * (day % 7) + (day * 37) % 11
+            if day in spikes:
+                value *= 3
+            detector.ingest("visits", day, day % 7, value)
+
+    def test_spikes_flagged_and_clamped(self):
+        """Spikes are flagged without desensitizing the weekday baseline."""
+        detector = AnomalyDetector(alpha=0.2, threshold=3.0)
+        self.feed(detector, range(200), spikes={140, 147})
+        self.assertEqual(sorted(detector.flags), [140, 147])
+
+    def test_constant_state(self):
+        """State size does not grow with history."""
+        short, long = AnomalyDetector(), AnomalyDetector()
+        self.feed(short, range(100))
+        self.feed(long, range(10_000))
+        for state in (short.to_dict(), long.to_dict()):
+            count, mean, var, _ = state["baselines"]["visits"]
+            self.assertEqual((len(count), len(mean), len(var)), (7, 7, 7))
+        self.assertEqual(long.baselines["visits"].count[0], 10_000 // 7 + 1)
+
+    def test_resume_from_state(self):
+        """A saved and restored detector scores later days identically."""
+        original = AnomalyDetector()
+        self.feed(original, range(100))
+        restored = AnomalyDetector.from_dict(json.loads(json.dumps(original.to_dict())))
+        self.feed(original, range(100, 200), spikes={150})
+        self.feed(restored, range(100, 200), spikes={150})
+        self.assertEqual(restored.flags, original.flags)
+        self.assertEqual(list(original.flags), [150])
+
+
+class ReservoirTest(TestCase):
+    """Tests for the Algorithm L reservoir."""
+
+    def test_bounded_uniform_sample(self):
+        """Keeps exactly size rows, drawn from across the stream."""
+        reservoir = Reservoir(100, ("value",))
+        for i in range(10_000):
+            reservoir.add((i, i))
+        self.assertEqual(reservoir.seen, 10_000)
+        self.assertEqual(len(set(reservoir.rows)), 100)
+        late = sum(1 for ts, _ in reservoir.rows if ts >= 5_000)
+        self.assertTrue(30 < late < 70)
+
+    def test_resume_from_state(self):
+        """A saved and restored reservoir continues identically."""
+        original = Reservoir(50, ("value",), seed=7)
+        for i in range(1_000):
+            original.add((i, i))
+        restored = Reservoir.from_dict(json.loads(json.dumps(original.to_dict())))
+        for i in range(1_000, 5_000):
+            original.add((i, i))
+            restored.add((i, i))
+        self.assertEqual(restored.rows, original.rows)
+
+
+class CompileSpecTest(SimpleTestCase):
+    """Tests for query spec compilation."""
+
+    def test_values_are_parameters(self):
+        """Filter values and bounds are bound, never inlined."""
+        spec = parse_spec(
+            {
+                "metrics": ["signups"],
+                "start": "2024-01-01",
+                "filters": {"channel": ["x') OR 1=1 --"]},
+            }
+        )
+        sql, params = compile_spec(spec, get_calendar(), connections["analytics"])
+        self.assertNotIn("OR 1=1", sql)
+        self.assertEqual(params, [2024, 1, "x') OR 1=1 --"])
+        self.assertIn('("year", "month") >= (%s, %s)', sql)
+
+    def test_postgres_buckets_with_date_trunc(self):
+        """PostgreSQL buckets by local date in SQL and binds ms bounds."""
+        postgres = SimpleNamespace(
+            vendor="postgresql", ops=connections["analytics"].ops
+        )
+        spec = parse_spec(
+            {"metrics": ["visits"], "granularity": "week", "start": "2024-01-01"}
+        )
+        calendar = get_calendar("Pacific/Honolulu")
+        sql, params = compile_spec(spec, calendar, postgres)
+        self.assertIn('date_trunc(%s, "date" AT TIME ZONE %s)', sql)
+        self.assertIn('"date" >= to_timestamp(%s / 1000.0)', sql)
+        self.assertTrue(sql.endswith("GROUP BY 1 ORDER BY 1"))
+        self.assertEqual(
+            params,
+            ["week", "Pacific/Honolulu", "Pacific/Honolulu", 1704103200000],
+        )
+
+    def test_postgres_percentiles_keep_stored_grain(self):
+        """Percentiles need per-day values, so rows are not bucketed in SQL."""
+        postgres = SimpleNamespace(
+            vendor="postgresql", ops=connections["analytics"].ops
+        )
+        spec = parse_spec({"metrics": ["visits"], "aggregate": "p90"})
+        sql, _ = compile_spec(spec, get_calendar(), postgres)
+        self.assertNotIn("date_trunc", sql)
+        self.assertIn('EXTRACT(EPOCH FROM "date")', sql)
+
+
+class EpochMillisFieldTest(SimpleTestCase):
+    """Tests for Unix-ms date conversion across backends."""
+
+    def test_postgres_round_trip(self):
+        """Milliseconds become timestamptz values and convert back."""
+        field = EpochMillisField()
+        postgres = SimpleNamespace(vendor="postgresql")
+        value = field.get_db_prep_value(1704441600000, postgres)
+        self.assertEqual(value, datetime(2024, 1, 5, 8, tzinfo=UTC))
+        self.assertEqual(field.from_db_value(value, None, postgres), 1704441600000)
+        self.assertEqual(field.db_type(postgres), "timestamptz")
+
+    def test_sqlite_passes_integers_through(self):
+        """SQLite stores the milliseconds themselves."""
+        field = EpochMillisField()
+        sqlite = connections["default"]
+        self.assertEqual(field.get_db_prep_value(1704441600000, sqlite), 1704441600000)
+
+
+@skipUnless(
+    connections["analytics"].vendor == "postgresql", "analytics is not PostgreSQL"
+)
+class PostgresBackendTest(BaseTestCase, APITestCase):
+    """Checks that only apply to a PostgreSQL analytics database."""
+
+    def test_dates_stored_as_timestamptz(self):
+        """Dates are native timestamps and read back as milliseconds."""
+        with connections["analytics"].cursor() as cursor:
+            cursor.execute('SELECT MIN("date") FROM "TrafficDaily"')
+            [(first,)] = cursor.fetchall()
+        self.assertEqual(first, datetime(2024, 1, 5, 8, tzinfo=UTC))
+        row = TrafficDaily.objects.order_by("date").first()
+        self.assertEqual((row.date, row.date_int), (1704441600000, 1704441600000))
+
+    def test_brin_indexes(self):
+        """The daily tables carry BRIN indexes on date."""
+        with connections["analytics"].cursor() as cursor:
+            cursor.execute(
+                "SELECT tablename FROM pg_indexes WHERE indexdef LIKE %s",
+                ["%USING brin%"],
+            )
+            tables = {name for (name,) in cursor.fetchall()}
+        self.assertEqual(tables, {"TrafficDaily", "RevenueDaily"})
+
+    def test_weekly_query_matches_python_rollup(self):
+        """date_trunc buckets agree with the calendar's ISO weeks."""
+        response = self.client.post(
+            "/analytics/query/",
+            {"metrics": ["visits"], "granularity": "week"},
+            format="json",
+        )
+        periods = [point["period"] for point in response.data["data"]]
+        self.assertEqual(periods, ["2024-W01", "2024-W02", "2024-W03"])
+        self.assertEqual(
+            sum(point["visits"] for point in response.data["data"]),
+            sum(1000 + i * 10 for i in range(15)),
+        )
+
+
+class StreamEndpointTest(BaseTestCase):
+    """Tests for /analytics/stream (SSE)."""
+
+    def tearDown(self):
+        # Under ASGI a disconnect cancels the stream; here, drop leftovers.
+        for subscriber in stream_watcher.subscribers:
+            stream_watcher.unsubscribe(subscriber)
+        super().tearDown()
+
+    async def test_initial_events(self):
+        """Each requested widget's payload is sent on connect."""
+        response = await self.async_client.get(
+            "/analytics/stream/?widgets=traffic,kpis"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        chunks = aiter(response.streaming_content)
+        self.assertTrue((await anext(chunks)).startswith(b"retry: "))
+        events = (await anext(chunks)).decode()
+        await chunks.aclose()
+        self.assertIn("event: traffic\n", events)
+        self.assertIn("event: kpis\n", events)
+        self.assertIn('"visits":1050', events)
+
+    def test_requires_asgi(self):
+        """Under WSGI the stream is refused instead of holding the worker."""
+        response = self.client.get("/analytics/stream/?widgets=kpis")
+        self.assertEqual(response.status_code, 501)
+        self.assertIn("ASGI", response.json()["error"])
+
+    async def test_unknown_widget(self):
+        """Rejects unknown widget names."""
+        response = await self.async_client.get("/analytics/stream/?widgets=nope")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("error", json.loads(response.content))
+
+
+class TableWatcherTest(SimpleTestCase):
+    """Tests for the shared SSE watcher."""
+
+    def setUp(self):
+        self.version = 1
+        self.payload = {"value": 1}
+        self.computations = 0
+        self.watcher = TableWatcher(
+            {"a": Widget(("A",), self.compute), "b": Widget(("B",), self.compute)},
+            interval=0.01,
+            version=lambda tables: (tables, self.version),
+        )
+
+    def compute(self, calendar):
+        self.computations += 1
+        return self.payload
+
+    async def test_one_poll_loop_for_all_subscribers(self):
+        """Many subscribers share one poll and one computation per change."""
+        subscribers = [Subscriber(["a"], "UTC") for _ in range(200)]
+        for subscriber in subscribers:
+            await self.watcher.subscribe(subscriber)
+            self.assertEqual(len(await subscriber.next_events(0)), 1)
+        self.assertEqual(self.computations, 1)
+
+        self.version, self.payload = 2, {"value": 2}
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.computations, 2)
+        self.assertLess(self.watcher.polls, 10)
+        for subscriber in subscribers:
+            events = await subscriber.next_events(0)
+            self.assertEqual(len(events), 1)
+            self.assertIn(b'"value":2', events[0])
+            self.watcher.unsubscribe(subscriber)
+        self.assertFalse(self.watcher.subscribers)
+
+    async def test_unchanged_payload_not_pushed(self):
+        """A version bump that leaves the payload unchanged sends nothing."""
+        subscriber = Subscriber(["a", "b"], "UTC")
+        await self.watcher.subscribe(subscriber)
+        self.assertEqual(len(await subscriber.next_events(0)), 2)
+        self.version = 2
+        await asyncio.sleep(0.05)
+        self.assertEqual(await subscriber.next_events(0), [])
+        self.watcher.unsubscribe(subscriber)
+
+    async def test_slow_subscriber_conflates(self):
+        """An unread widget keeps only its newest event."""
+        subscriber = Subscriber(["a"], "UTC")
+        await self.watcher.subscribe(subscriber)
+        for value in range(2, 6):
+            self.version, self.payload = value, {"value": value}
+            await asyncio.sleep(0.03)
+        events = await subscriber.next_events(0)
+        self.watcher.unsubscribe(subscriber)
+        self.assertEqual(len(events), 1)
+        self.assertIn(b'"value":5', events[0])
+        self.assertEqual(subscriber.conflated, 4)
+
+
 class KpiSnapshotManagerTest(BaseTestCase):
     """Tests for KpiSnapshotManager."""
 
@@ -403,11 +1199,22 @@ class SignupByChannelManagerTest(BaseTestCase):
         channels = [s.channel for s in latest]
         self.assertEqual(channels, sorted(channels))
 
+    def test_get_latest_month_single_query(self):
+        """get_latest_month() resolves the latest month in the same query."""
+        with self.assertNumQueries(1, using="analytics"):
+            list(SignupByChannel.objects.get_latest_month())
+
+    def test_get_trend_single_query(self):
+        """get_trend() returns the last N months in one query."""
+        with self.assertNumQueries(1, using="analytics"):
+            rows = SignupByChannel.objects.get_trend(1)
+        self.assertEqual({(y, m) for y, m, _, _ in rows}, {(2024, 1)})
+
     def test_get_latest_month_empty_db(self):
-        """get_latest_month() returns empty queryset when no data."""
+        """get_latest_month() returns no rows when no data."""
         SignupByChannel.objects.all().delete()
         latest = SignupByChannel.objects.get_latest_month()
-        self.assertEqual(latest.count(), 0)
+        self.assertEqual(latest, [])
 
 
 class DeviceShareManagerTest(BaseTestCase):
@@ -417,8 +1224,8 @@ class DeviceShareManagerTest(BaseTestCase):
         """get_latest_snapshot() returns the most recent snapshot."""
         latest = DeviceShare.objects.get_latest_snapshot()
         # All should have the same (latest) snapshotdate
-        dates = set(d.snapshotdate for d in latest)
-        self.assertEqual(len(dates), 1)
+        dates = set(d.snapshotdate_int for d in latest)
+        self.assertEqual(dates, {1704441600000})
 
     def test_get_latest_snapshot_ordering(self):
         """get_latest_snapshot() orders by device."""
@@ -426,16 +1233,251 @@ class DeviceShareManagerTest(BaseTestCase):
         devices = [d.device for d in latest]
         self.assertEqual(devices, sorted(devices))
 
+    def test_get_latest_snapshot_single_query(self):
+        """get_latest_snapshot() resolves the latest snapshot in one query."""
+        with self.assertNumQueries(1, using="analytics"):
+            list(DeviceShare.objects.get_latest_snapshot())
+
+    def test_get_trend_ordering(self):
+        """get_trend() orders rows by snapshot then device."""
+        rows = list(DeviceShare.objects.get_trend(2))
+        self.assertEqual(rows, sorted(rows))
+        self.assertEqual(len(rows), 6)
+
     def test_get_latest_snapshot_empty_db(self):
-        """get_latest_snapshot() returns empty queryset when no data."""
+        """get_latest_snapshot() returns no rows when no data."""
         DeviceShare.objects.all().delete()
         latest = DeviceShare.objects.get_latest_snapshot()
-        self.assertEqual(latest.count(), 0)
+        self.assertEqual(latest, [])
+
+
+class RowModeTest(BaseTestCase):
+    """Tests for the managers' read-only row mode."""
+
+    def test_rows_match_model_instances(self):
+        """Rows carry the same field values as model instances."""
+        for model, date_field in (
+            (KpiSnapshot, "capturedat"),
+            (TrafficDaily, "date"),
+            (RevenueDaily, "date"),
+            (SignupByChannel, None),
+            (DeviceShare, "snapshotdate"),
+        ):
+            with self.subTest(model=model.__name__):
+                queryset = model.objects.order_by("id")
+                rows = list(queryset.rows())
+                self.assertTrue(all(isinstance(row, model.Row) for row in rows))
+                expected = []
+                fields = [field.name for field in model._meta.fields]
+                for instance in queryset:
+                    values = {name: getattr(instance, name) for name in fields}
+                    if date_field:
+                        values[date_field] = getattr(instance, f"{date_field}_int")
+                    expected.append(values)
+                self.assertEqual([row._asdict() for row in rows], expected)
+
+    def test_daily_row_properties(self):
+        """Daily rows expose date_ms, date_int and date_datetime."""
+        row = TrafficDaily.objects.order_by("date").rows().first()
+        instance = TrafficDaily.objects.order_by("date").first()
+        self.assertEqual(row.date_ms, instance.date_ms)
+        self.assertEqual(row.date_int, instance.date_int)
+        self.assertEqual(row.date_datetime, instance.date_datetime)
+
+    def test_rows_are_read_only(self):
+        """Rows are slotted and immutable."""
+        row = next(iter(TrafficDaily.objects.get_recent(1)))
+        self.assertIsInstance(row, TrafficDaily.Row)
+        self.assertFalse(hasattr(row, "__dict__"))
+        with self.assertRaises(AttributeError):
+            row.visits = 0
+
+
+# KPI Engine Tests
+
+
+class RollingWindowTest(TestCase):
+    """Tests for RollingWindow running totals."""
+
+    def test_evicts_days_outside_window(self):
+        """Only the trailing N days contribute to the totals."""
+        window = RollingWindow(1, size=3)
+        for day in range(5):
+            window.add(day * DAY_MS, 10 + day)
+        self.assertEqual(window.totals, [12 + 13 + 14])
+        self.assertEqual(window.start, 2 * DAY_MS)
+
+    def test_upsert_replaces_day(self):
+        """Re-adding a day applies only the delta."""
+        window = RollingWindow(2, size=30)
+        window.add(0, 5, 1)
+        window.add(0, 7, 3)
+        self.assertEqual(window.totals, [7, 3])
+
+    def test_late_rows_outside_window_ignored(self):
+        """Rows older than the window do not change the totals."""
+        window = RollingWindow(1, size=2)
+        window.add(10 * DAY_MS, 1)
+        window.add(0, 100)
+        self.assertEqual(window.totals, [1])
+
+
+class KpiEngineTest(BaseTestCase):
+    """Tests for the incremental KPI engine."""
+
+    def setUp(self):
+        super().setUp()
+        self.use_state_dir()
+
+    def test_values_from_fact_tables(self):
+        """KPIs are derived from traffic, revenue and signups."""
+        engine = sync_engine(KpiEngine())
+        values = engine.values()
+        self.assertEqual(values["sessions"], sum(800 + i * 8 for i in range(15)))
+        self.assertEqual(
+            values["revenuecents"], sum(50000 + i * 1000 for i in range(15))
+        )
+        self.assertEqual(values["totalusers"], 1200 + 4 * 50)
+        visits = sum(1000 + i * 10 for i in range(15))
+        self.assertEqual(values["conversionpct"], round(1200 / visits * 100, 1))
+
+    def test_incremental_sync_matches_rebuild(self):
+        """Syncing new rows into persisted state equals a full rebuild."""
+        save_engine(sync_engine(KpiEngine()))
+        TrafficDaily.objects.create(date=1705737600000, visits=5, sessions=4)
+        RevenueDaily.objects.filter(date=1704441600000 + 14 * 86400000).update(
+            valuecents=1
+        )
+        incremental = sync_engine(load_engine())
+        self.assertEqual(incremental.values(), sync_engine(KpiEngine()).values())
+
+    def test_deleted_rows_rebuild(self):
+        """Deleting ingested rows rebuilds rather than keeping their values."""
+        save_engine(sync_engine(KpiEngine()))
+        RevenueDaily.objects.filter(date=1704441600000 + 14 * 86400000).delete()
+        SignupByChannel.objects.filter(year=2023, month=12, channel="paid").delete()
+        values = sync_engine(load_engine()).values()
+        self.assertEqual(values, sync_engine(KpiEngine()).values())
+        self.assertEqual(
+            values["revenuecents"], sum(50000 + i * 1000 for i in range(14))
+        )
+        self.assertEqual(values["totalusers"], 1400 - 50)
+
+    def test_command_writes_snapshot_served_by_view(self):
+        """snapshot_kpis writes the row KpisView then reads."""
+        call_command("snapshot_kpis", stdout=io.StringIO())
+        latest = KpiSnapshot.objects.get_latest()
+        self.assertEqual(latest.totalusers, 1400)
+        response = self.client.get("/analytics/kpis/")
+        users = [k for k in response.data["kpis"] if k["label"] == "Total Users"]
+        self.assertEqual(users[0]["value"], "1,400")
+
+
+# Startup Budget Tests
+
+
+class StartupBudgetTest(SimpleTestCase):
+    """Cold start budget for the API-only deployment profile."""
+
+    # Boot time is machine-dependent: see benchmarks.startup --max-seconds.
+    # rest_framework.compat imports django.contrib.postgres, and with it
+    # psycopg, whenever the postgres extra is installed.
+    max_modules = 600 + (100 if find_spec("psycopg") else 0)
+
+    def test_api_profile_within_budget(self):
+        """Booting settings_api stays within the module budget."""
+        report = probe("django_overthinglytics.settings_api")
+        self.assertLess(report["modules"], self.max_modules)
+
+    def test_api_profile_skips_unused_apps(self):
+        """The API profile installs none of the admin/auth/session apps."""
+        report = probe("django_overthinglytics.settings_api")
+        self.assertEqual(
+            report["apps"], ["rest_framework", "corsheaders", "django_backend"]
+        )
+
+
+# Parity Harness Tests
+
+
+class ParityHarnessTest(SimpleTestCase):
+    """Tests for the cross-backend parity harness helpers."""
+
+    def test_diff_lists_mismatches_by_path(self):
+        """Value, type, key and length mismatches are reported by JSON path."""
+        expected = {"data": [{"day": "Jan 5", "visits": 1}], "total": 2}
+        actual = {"data": [{"day": "Jan 6", "visits": 1.0}, {}], "extra": 0}
+        self.assertEqual(
+            sorted(diff_json(expected, actual)),
+            [
+                "$.data: 1 items != 2",
+                "$.data[0].day: 'Jan 5' != 'Jan 6'",
+                "$.data[0].visits: 1 != 1.0",
+                "$.extra: unexpected",
+                "$.total: missing",
+            ],
+        )
+        self.assertEqual(list(diff_json(expected, expected)), [])
+
+    def test_contract_paths_per_backend(self):
+        """Recorded paths are normalized, and Django gets trailing slashes."""
+        with tempfile.NamedTemporaryFile("w", suffix=".log") as log:
+            log.write(
+                '"GET /analytics/traffic/?limit=7 HTTP/1.1" 200 512\n'
+                "# /analytics/ignored\n"
+                "/analytics/kpis\n"
+            )
+            log.flush()
+            paths = read_mix(log.name)
+        self.assertEqual(paths, ["/analytics/traffic?limit=7", "/analytics/kpis"])
+        django = Backend("django", "http://127.0.0.1:8000", trailing_slash=True)
+        nextjs = Backend("next", "http://localhost:3000/api/")
+        self.assertEqual(
+            django.url(paths[0]), "http://127.0.0.1:8000/analytics/traffic/?limit=7"
+        )
+        self.assertEqual(nextjs.url(paths[1]), "http://localhost:3000/api/analytics/kpis")
 
 
 # Serializer Tests
 
 
+class CalendarTest(SimpleTestCase):
+    """Tests for timezone-aware day bucketing."""
+
+    def test_labels_match_zoneinfo_across_dst(self):
+        """Day keys agree with zoneinfo around DST transitions."""
+        calendar = Calendar("Europe/Berlin")
+        tz = ZoneInfo("Europe/Berlin")
+        for start in (1711753200000, 1729987200000):  # Mar 30 / Oct 27, 2024
+            for ts in range(start, start + 2 * DAY_MS, 15 * 60 * 1000):
+                local = datetime.fromtimestamp(ts / 1000, tz)
+                day = calendar.day(ts)
+                self.assertEqual(day.iso_date, local.date().isoformat())
+                self.assertEqual(day.label, f"{local:%b} {local.day}")
+
+    def test_day_start(self):
+        """start_ms is local midnight."""
+        day = Calendar("Pacific/Honolulu").day(1704441600000)  # 08:00 UTC
+        self.assertEqual(day.iso_date, "2024-01-04")
+        self.assertEqual(day.start_ms, 1704412800000 - 14 * 3600 * 1000)
+
+    def test_buckets(self):
+        """Week, month and quarter keys."""
+        calendar = Calendar("UTC")
+        ts = 1704441600000  # Jan 5, 2024
+        self.assertEqual(calendar.bucket(ts, "day"), "2024-01-05")
+        self.assertEqual(calendar.bucket(ts, "week"), "2024-W01")
+        self.assertEqual(calendar.bucket(ts, "month"), "2024-01")
+        self.assertEqual(calendar.bucket(ts, "quarter"), "2024-Q1")
+        # Dec 30, 2024 belongs to ISO week 1 of 2025.
+        self.assertEqual(calendar.bucket(1735516800000, "week"), "2025-W01")
+
+    def test_shared_instances(self):
+        """get_calendar returns one calendar per timezone."""
+        self.assertIs(get_calendar("UTC"), get_calendar())
+        self.assertIsNot(get_calendar("Asia/Tokyo"), get_calendar())
+
+
 class KpiResponseSerializerTest(BaseTestCase):
     """Tests for KpiResponseSerializer."""
 
@@ -506,3 +1548,779 @@ class DeviceShareResponseSerializerTest(BaseTestCase):
         self.assertIn("value", point)
         self.assertNotIn("device", point)
         self.assertNotIn("sharepct", point)
+
+
+# Coalescing Tests
+
+
+class SingleFlightTest(TestCase):
+    """Tests for SingleFlight request coalescing."""
+
+    def _slow_counter(self, release):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            release.wait(timeout=5)
+            return {"calls": len(calls)}
+
+        return calls, compute
+
+    def test_concurrent_threads_share_one_computation(self):
+        """Concurrent sync callers with the same key run fn once."""
+        flight = SingleFlight()
+        release = threading.Event()
+        calls, compute = self._slow_counter(release)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            futures = [pool.submit(flight.do, "k", compute) for _ in range(8)]
+            while flight.in_flight() == 0:
+                time.sleep(0.001)
+            time.sleep(0.05)
+            release.set()
+            results = [f.result() for f in futures]
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(r is results[0] for r in results))
+
+    def test_distinct_keys_run_separately(self):
+        """Different keys are not coalesced."""
+        flight = SingleFlight()
+        self.assertEqual(flight.do("a", lambda: 1), 1)
+        self.assertEqual(flight.do("b", lambda: 2), 2)
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_exception_propagates_and_clears(self):
+        """A failing computation raises and does not stay in flight."""
+        flight = SingleFlight()
+
+        def boom():
+            raise RuntimeError("boom")
+
+        with self.assertRaises(RuntimeError):
+            flight.do("k", boom)
+        self.assertEqual(flight.in_flight(), 0)
+        self.assertEqual(flight.do("k", lambda: "ok"), "ok")
+
+    def test_request_key_normalizes_param_order(self):
+        """Param order does not affect the key."""
+        self.assertEqual(
+            request_key("traffic", {"a": 1, "b": 2}, (1,)),
+            request_key("traffic", {"b": 2, "a": 1}, (1,)),
+        )
+
+
+# Caching and Compression Tests
+
+
+class NegotiateEncodingTest(TestCase):
+    """Tests for Accept-Encoding negotiation."""
+
+    available = ("br", "zstd", "gzip")
+
+    def test_server_preference_breaks_ties(self):
+        """Equal q-values pick the server's preferred coding."""
+        self.assertEqual(negotiate_encoding("gzip, br", self.available), "br")
+
+    def test_q_values(self):
+        """Higher q-values win; q=0 excludes a coding."""
+        self.assertEqual(
+            negotiate_encoding("br;q=0.5, gzip", self.available), "gzip"
+        )
+        self.assertIsNone(negotiate_encoding("gzip;q=0", ("gzip",)))
+
+    def test_wildcard_and_missing(self):
+        """A wildcard accepts anything; no header means identity."""
+        self.assertEqual(negotiate_encoding("*", ("gzip",)), "gzip")
+        self.assertIsNone(negotiate_encoding("", self.available))
+        self.assertIsNone(negotiate_encoding("deflate", self.available))
+
+
+class ResponseCacheTest(TestCase):
+    """Tests for the precompressed response cache."""
+
+    def test_small_bodies_not_compressed(self):
+        """Bodies under the threshold carry no variants."""
+        entry = CachedPayload({}, b"{}", "application/json", ttl=60)
+        self.assertEqual(entry.variants, {})
+        self.assertEqual(entry.select("gzip"), (None, b"{}"))
+
+    def test_large_bodies_precompressed(self):
+        """Bodies over the threshold get a gzip variant that round-trips."""
+        body = b'{"data": [' + b'{"visits": 1000},' * 100 + b"]}"
+        entry = CachedPayload({}, body, "application/json", ttl=60)
+        coding, compressed = entry.select("gzip")
+        self.assertEqual(coding, "gzip")
+        self.assertEqual(gzip.decompress(compressed), body)
+
+    @override_settings(ANALYTICS_COMPRESSION_LEVELS={"gzip": 1})
+    def test_compression_levels(self):
+        """Live variants use the configured levels; snapshots the maximum."""
+        body = b'{"data": [' + b'{"visits": 1000},' * 100 + b"]}"
+        entry = CachedPayload({}, body, "application/json", ttl=60)
+        self.assertEqual(entry.variants["gzip"], gzip.compress(body, 1, mtime=0))
+        self.assertEqual(
+            compress_variants(body, MAX_LEVELS)["gzip"],
+            gzip.compress(body, 9, mtime=0),
+        )
+
+    def test_lru_eviction_and_expiry(self):
+        """Oldest entries are evicted and expired entries are dropped."""
+        cache = ResponseCache(max_entries=2)
+        for key in "abc":
+            cache.set(key, CachedPayload({}, b"", "text/plain", ttl=60))
+        self.assertIsNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("c"))
+        cache.set("d", CachedPayload({}, b"", "text/plain", ttl=-1))
+        self.assertIsNone(cache.get("d"))
+
+
+class CompressedEndpointTest(BaseTestCase, APITestCase):
+    """Tests for cached, precompressed analytics responses."""
+
+    def test_gzip_variant_served(self):
+        """Clients accepting gzip get the compressed body."""
+        response = self.client.get(
+            "/analytics/traffic/?limit=15", HTTP_ACCEPT_ENCODING="gzip"
+        )
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        payload = json.loads(gzip.decompress(response.content))
+        self.assertEqual(len(payload["data"]), 15)
+
+    def test_identity_without_accept_encoding(self):
+        """Clients without Accept-Encoding get plain JSON."""
+        response = self.client.get("/analytics/traffic/?limit=15")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(len(json.loads(response.content)["data"]), 15)
+
+    def test_repeat_requests_hit_cache(self):
+        """The second identical request runs no analytics query for data."""
+        self.client.get("/analytics/revenue/?limit=5")
+        with self.assertNumQueries(0, using="analytics"):
+            response = self.client.get("/analytics/revenue/?limit=5")
+        self.assertEqual(len(response.data["data"]), 5)
+
+    def test_write_invalidates_cached_payload(self):
+        """A new row changes the data version and the served payload."""
+        self.client.get("/analytics/traffic/?limit=1")
+        TrafficDaily.objects.create(date=1709251200000, visits=7, sessions=7)
+        response = self.client.get("/analytics/traffic/?limit=1")
+        self.assertEqual(response.data["data"][0]["visits"], 7)
+
+
+class TokenBucketTest(SimpleTestCase):
+    """Tests for the admission token buckets."""
+
+    def test_burst_then_refill(self):
+        """A bucket serves its burst, then one token per 1/rate seconds."""
+        bucket = TokenBucket(rate=2, capacity=3, now=0.0)
+        self.assertEqual([bucket.take(now=0.0) for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(bucket.take(now=0.0), 0.5)
+        self.assertEqual(bucket.take(now=0.5), 0)
+        self.assertAlmostEqual(bucket.take(now=0.5), 0.5)
+
+    def test_client_buckets_are_bounded(self):
+        """Idle clients are forgotten once the table is full."""
+        buckets = ClientBuckets(rate=1, capacity=1, max_clients=2)
+        buckets.take("a", now=0.0)
+        buckets.take("b", now=0.0)
+        self.assertGreater(buckets.take("b", now=0.0), 0)
+        buckets.take("c", now=0.5)
+        self.assertEqual(len(buckets), 2)
+        # "a" was evicted and starts again with a full bucket
+        self.assertEqual(buckets.take("a", now=0.5), 0)
+
+    def test_concurrency_limit_sheds_after_timeout(self):
+        """A query waiting longer than the queue timeout is shed."""
+        gate = Admission(max_queries=1, queue_timeout=0.01)
+        release = threading.Event()
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            busy = pool.submit(gate.run_query, lambda: release.wait(5))
+            while not gate.querying:
+                time.sleep(0.001)
+            with self.assertRaises(Overloaded) as caught:
+                gate.run_query(lambda: None)
+            release.set()
+            busy.result()
+        self.assertEqual(caught.exception.status, 503)
+        self.assertEqual(gate.run_query(lambda: 42), 42)
+
+
+@override_settings(ANALYTICS_RATE_LIMIT_PER_CLIENT=(1, 2))
+class AdmissionEndpointTest(BaseTestCase, APITestCase):
+    """Tests for rate limiting and load shedding on the analytics routes."""
+
+    databases = ["default", "analytics"]
+
+    def test_over_limit_client_gets_429_with_retry_after(self):
+        """A client past its burst gets 429 and a Retry-After."""
+        self.client.get("/analytics/kpis/")
+        self.client.get("/analytics/revenue/")
+        response = self.client.get("/analytics/signups/")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "1")
+        self.assertIn("error", response.json())
+
+    def test_shed_request_served_last_response(self):
+        """A shed request for a URL seen before gets its last response."""
+        first = self.client.get("/analytics/traffic/?limit=3")
+        self.client.get("/analytics/kpis/")
+        response = self.client.get("/analytics/traffic/?limit=3")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Analytics-Stale"], "client_rate")
+        self.assertEqual(response.content, first.content)
+
+    def test_shed_post_not_served_another_spec(self):
+        """Shed query POSTs get a 429, not the last response of another spec."""
+        self.client.post(
+            "/analytics/query/",
+            {"metrics": ["visits"], "granularity": "month"},
+            format="json",
+        )
+        self.client.get("/analytics/kpis/")
+        response = self.client.post(
+            "/analytics/query/",
+            {"metrics": ["revenue_cents"], "granularity": "week"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 429)
+        self.assertFalse(response.has_header("X-Analytics-Stale"))
+
+    def test_clients_limited_separately(self):
+        """Each client address has its own bucket."""
+        for _ in range(2):
+            self.client.get("/analytics/kpis/")
+        response = self.client.get("/analytics/kpis/", REMOTE_ADDR="10.0.0.2")
+        self.assertEqual(response.status_code, 200)
+
+    def test_forwarded_for_does_not_reset_the_bucket(self):
+        """A new X-Forwarded-For per request does not get a new bucket."""
+        for i in range(2):
+            self.client.get("/analytics/kpis/", HTTP_X_FORWARDED_FOR=f"10.1.0.{i}")
+        response = self.client.get(
+            "/analytics/signups/", HTTP_X_FORWARDED_FOR="10.1.0.9"
+        )
+        self.assertEqual(response.status_code, 429)
+
+    def test_stats_count_shed_requests(self):
+        """/analytics/admission reports shed counts to operators only."""
+        for _ in range(4):
+            self.client.get("/analytics/kpis/")
+        self.assertEqual(self.client.get("/analytics/admission/").status_code, 403)
+        with self.settings(ANALYTICS_PROFILE_TOKEN="secret"):
+            response = self.client.get(
+                "/analytics/admission/", HTTP_X_ANALYTICS_PROFILE="secret"
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["shed"]["client_rate"], 2)
+        self.assertEqual(response.data["served_stale"], 2)
+        self.assertEqual(response.data["limits"]["per_client"], {"rate": 1, "burst": 2})
+        self.client.force_login(User.objects.create_user("ops", is_staff=True))
+        self.assertEqual(self.client.get("/analytics/admission/").status_code, 200)
+
+
+class CompiledQueryTest(BaseTestCase):
+    """Tests for the managers' compiled-SQL read paths."""
+
+    def test_results_match_orm_path(self):
+        """Compiled statements return what their ORM querysets return."""
+        cases = [
+            (KpiSnapshot.objects.latest, ()),
+            (SignupByChannel.objects.latest_month, ()),
+            (DeviceShare.objects.latest_snapshot, ()),
+        ]
+        for limit in (1, 3, 15, 60):
+            cases += [
+                (TrafficDaily.objects.newest, (limit,)),
+                (TrafficDaily.objects.newest_columns, (limit,)),
+                (RevenueDaily.objects.newest, (limit,)),
+                (RevenueDaily.objects.newest_columns, (limit,)),
+                (DeviceShare.objects.trend, (limit,)),
+            ]
+        for query, limits in cases:
+            with self.subTest(query=query.query.build.__qualname__, limits=limits):
+                rows = query(*limits)
+                expected = list(query.queryset(*limits))
+                self.assertEqual(rows, expected)
+                self.assertEqual(
+                    [type(row) for row in rows], [type(row) for row in expected]
+                )
+
+    def test_limits_become_placeholders(self):
+        """One statement per shape; limits, also in subqueries, are params."""
+        statement = TrafficDaily.objects.newest.statement(1)
+        self.assertIn("LIMIT %s", statement.sql)
+        self.assertNotIn("987654", statement.sql)
+        with self.assertNumQueries(1, using="analytics"):
+            self.assertEqual(len(TrafficDaily.objects.newest(7)), 7)
+        self.assertIs(TrafficDaily.objects.newest.statement(1), statement)
+        trend = DeviceShare.objects.trend.statement(1)
+        self.assertEqual(trend.sql.count("LIMIT %s"), 1)
+        self.assertEqual(
+            {row[0] for row in DeviceShare.objects.trend(1)}, {1704441600000}
+        )
+
+
+class IndexUsageTest(BaseTestCase):
+    """The manager reads are served by the Prisma indexes."""
+
+    def plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connections["analytics"].cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            return " | ".join(row[-1] for row in cursor.fetchall())
+
+    @skipUnless(
+        connections["analytics"].vendor == "sqlite", "SQLite query plans"
+    )
+    def test_latest_reads_use_indexes(self):
+        """Latest-N and latest-snapshot reads neither scan nor sort."""
+        for queryset, index in (
+            (TrafficDaily.objects.order_by("-date")[:10], "TrafficDaily_date"),
+            (RevenueDaily.objects.order_by("-date")[:10], "RevenueDaily_date"),
+            (KpiSnapshot.objects.order_by("-capturedat")[:1], "KpiSnapshot_capturedAt"),
+            (
+                DeviceShare.objects.latest_snapshot.queryset(),
+                "DeviceShare_snapshotDate",
+            ),
+            (
+                SignupByChannel.objects.latest_month.queryset(),
+                "SignupByChannel_year_month",
+            ),
+        ):
+            with self.subTest(index=index):
+                plan = self.plan(queryset)
+                self.assertIn(f"INDEX {index}", plan)
+                table = queryset.model._meta.db_table
+                self.assertNotRegex(plan, rf"SCAN {table}(?! USING)")
+
+
+class SlowQueryLogTest(BaseTestCase, APITestCase):
+    """Tests for the analytics slow-query log."""
+
+    def setUp(self):
+        super().setUp()
+        self.use_state_dir(ANALYTICS_SLOW_QUERY_MS=0)
+        clear_explained()
+
+    def records(self, caller):
+        return [entry for entry in read_log() if entry["caller"] == caller]
+
+    def test_records_caller_and_plan(self):
+        """A logged read names its view and manager method and has a plan."""
+        self.client.get("/analytics/traffic/?limit=3")
+        (entry,) = self.records("models.TrafficDailyManager.get_recent")
+        self.assertEqual(entry["view"], "views.TrafficView.compute")
+        self.assertGreaterEqual(entry["ms"], 0)
+        plan = " ".join(entry["plan"])
+        self.assertIn("TrafficDaily_date", plan)
+        self.assertIn("index", plan.lower())
+
+    def test_plan_captured_once_per_statement(self):
+        """Repeats of a statement are logged without a second EXPLAIN."""
+        for visits in (1000, 1100):
+            list(TrafficDaily.objects.filter(visits__gt=visits))
+        caller = "tests.SlowQueryLogTest.test_plan_captured_once_per_statement"
+        first, second = self.records(caller)
+        self.assertEqual((first["params"], second["params"]), ([1000], [1100]))
+        self.assertIn("plan", first)
+        self.assertNotIn("plan", second)
+
+    @override_settings(ANALYTICS_SLOW_QUERY_MS=None)
+    def test_disabled(self):
+        """No threshold, no log."""
+        list(TrafficDaily.objects.get_recent(3))
+        self.assertEqual(read_log(), [])
+
+    def test_summary_command(self):
+        """slow_queries lists statements by total time with their callers."""
+        for visits in (1000, 1100):
+            list(TrafficDaily.objects.filter(visits__gt=visits))
+        out = io.StringIO()
+        call_command("slow_queries", "--top", "1", stdout=out)
+        output = out.getvalue()
+        self.assertIn("#1 total", output)
+        self.assertIn("2 calls", output)
+        self.assertIn("from tests.SlowQueryLogTest.test_summary_command", output)
+
+
+class ProfilingTest(BaseTestCase, APITestCase):
+    """Tests for on-demand request profiling."""
+
+    databases = ["default", "analytics"]
+
+    def setUp(self):
+        super().setUp()
+        self.use_state_dir(ANALYTICS_PROFILE_TOKEN="secret")
+
+    def get(self, token="secret"):
+        return self.client.get(
+            "/analytics/traffic/?limit=3", HTTP_X_ANALYTICS_PROFILE=token
+        )
+
+    def test_header_with_token_profiles_request(self):
+        """The view runs under the sampler and its SQL is timed."""
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        (profile,) = list_profiles()
+        self.assertEqual(profile["id"], response["X-Analytics-Profile-Id"])
+        self.assertEqual(profile["view"], "TrafficView")
+        self.assertEqual(profile["reason"], "header")
+        self.assertGreaterEqual(profile["sql_count"], 1)
+        self.assertEqual(sorted(profile["files"]), ["folded", "json"])
+
+    def test_wrong_token_is_not_profiled(self):
+        """Without the configured token requests are served normally."""
+        response = self.get(token="guess")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("X-Analytics-Profile-Id"))
+        self.assertEqual(list_profiles(), [])
+
+    @override_settings(ANALYTICS_PROFILER="cprofile", ANALYTICS_PROFILE_KEEP=2)
+    def test_cprofile_ring_buffer(self):
+        """cProfile writes pstats files; only the newest profiles are kept."""
+        ids = [self.get()["X-Analytics-Profile-Id"] for _ in range(3)]
+        profiles = list_profiles()
+        self.assertEqual([p["id"] for p in profiles], ids[:0:-1])
+        self.assertEqual(sorted(profiles[0]["files"]), ["json", "prof"])
+
+    def test_admin_lists_and_downloads_profiles(self):
+        """Staff see the stored profiles and can download their files."""
+        profile_id = self.get()["X-Analytics-Profile-Id"]
+        self.assertEqual(self.client.get("/admin/profiles/").status_code, 302)
+        self.client.force_login(
+            User.objects.create_superuser("admin", "admin@example.com", "pw")
+        )
+        response = self.client.get("/admin/profiles/")
+        self.assertContains(response, "/analytics/traffic/?limit=3")
+        response = self.client.get(f"/admin/profiles/{profile_id}.json")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("attachment", response["Content-Disposition"])
+        body = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(body["id"], profile_id)
+        self.assertEqual(self.client.get("/admin/profiles/x.py").status_code, 404)
+
+
+class SnapshotPublishTest(BaseTestCase, APITestCase):
+    """Tests for static snapshot publishing and serving."""
+
+    views = {"kpis": KpisView, "traffic": TrafficView}
+
+    def setUp(self):
+        super().setUp()
+        self.root = self.use_state_dir(ANALYTICS_SERVE_SNAPSHOTS=True) / "snapshots"
+
+    def test_publishes_content_addressed_variants(self):
+        """Every limit gets an entry; identical bodies share one object."""
+        stats = publish(self.views)
+        self.assertEqual(stats["rendered"], 61)
+        entries = load_manifest(self.root)["entries"]
+        traffic = [e for e in entries.values() if e["endpoint"] == "traffic"]
+        self.assertEqual(len(traffic), 60)
+        self.assertIn("/analytics/traffic/?anomalies=false&limit=3&tz=UTC", [
+            entry["url"] for entry in traffic
+        ])
+        # 15 fixture days: limits 15 to 60 all render the same body.
+        self.assertEqual(len({entry["digest"] for entry in traffic}), 15)
+        self.assertTrue(list(self.root.glob("objects/*/*.json.gz")))
+
+    def test_republish_renders_only_changed_tables(self):
+        """Unchanged tables are kept; an in-place update re-renders its views."""
+        publish(self.views)
+        self.assertEqual(publish(self.views)["kept"], 61)
+        TrafficDaily.objects.filter(visits=1000).update(visits=999)
+        stats = publish(self.views)
+        self.assertEqual((stats["rendered"], stats["kept"]), (60, 1))
+
+    def test_signup_matrix_publishes_default_range(self):
+        """Matrix views publish the default months; other ranges render live."""
+        stats = publish({"signups-rolling": SignupRollingView})
+        self.assertEqual(stats["rendered"], len(ROLLING_WINDOWS))
+        response = self.client.get("/analytics/signups/rolling/?window=6")
+        self.assertTrue(response.has_header("ETag"))
+        response = self.client.get("/analytics/signups/rolling/?months=2")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("ETag"))
+
+    def test_serves_published_body_with_etag(self):
+        """A published variant is served from disk, then as 304."""
+        publish(self.views)
+        response = self.client.get("/analytics/traffic/?limit=3")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)["data"]), 3)
+        etag = response["ETag"]
+        self.assertTrue(etag.startswith('W/"'))
+        response = self.client.get(
+            "/analytics/traffic/?limit=3", HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+    def test_falls_back_when_data_changes(self):
+        """After new rows land, views render live until republished."""
+        publish(self.views)
+        TrafficDaily.objects.create(
+            date=1704441600000 + 15 * DAY_MS, visits=1, sessions=1
+        )
+        data_version.invalidate()
+        response = self.client.get("/analytics/traffic/?limit=3")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("ETag"))
+        self.assertEqual(response.data["data"][-1]["visits"], 1)
+
+
+class SeriesFileTest(BaseTestCase, APITestCase):
+    """Tests for the memory-mapped columnar series files."""
+
+    def setUp(self):
+        super().setUp()
+        self.use_state_dir(ANALYTICS_SERVE_SERIES=True)
+
+    def test_export_round_trip(self):
+        """The mapped columns match the table; unchanged tables are skipped."""
+        self.assertEqual(export("TrafficDaily"), 15)
+        self.assertIsNone(export("TrafficDaily"))
+        self.assertEqual(export("TrafficDaily", force=True), 15)
+        mapped = SeriesFile(series_path("TrafficDaily"))
+        self.assertEqual(
+            mapped.read(mapped.latest(4), ("visits", "sessions")),
+            TrafficDaily.objects.get_recent_columns(4),
+        )
+        span = mapped.between(START_MS + 2 * DAY_MS, START_MS + 5 * DAY_MS)
+        self.assertEqual(mapped.dates[span].tolist()[0], START_MS + 2 * DAY_MS)
+        self.assertEqual(span.stop - span.start, 3)
+
+    @skipUnless(
+        connections["analytics"].vendor == "sqlite",
+        "PostgreSQL integer columns cannot hold such values",
+    )
+    def test_rejects_values_outside_int32(self):
+        """Values that do not fit the int32 columns fail the export."""
+        RevenueDaily.objects.filter(valuecents=50000).update(valuecents=2**31)
+        with self.assertRaises(ValueError):
+            export("RevenueDaily")
+        self.assertFalse(series_path("RevenueDaily").exists())
+
+    def test_views_read_the_mapped_file(self):
+        """Latest-N views and range queries answer without querying rows."""
+        live = self.client.get("/analytics/revenue/?limit=5").data
+        spec = {"metrics": ["visits"], "granularity": "week", "aggregate": "avg"}
+        query = self.client.post("/analytics/query/", spec, format="json").data
+        call_command("export_series", stdout=io.StringIO())
+        response_cache.clear()
+        data_version.get(("RevenueDaily",))
+        data_version.get(("TrafficDaily",))
+        with self.assertNumQueries(0, using="analytics"):
+            response = self.client.get("/analytics/revenue/?limit=5")
+            mapped = self.client.post("/analytics/query/", spec, format="json")
+        self.assertEqual(response.data, live)
+        self.assertEqual(mapped.data["data"], query["data"])
+
+    def test_falls_back_when_data_changes(self):
+        """A file behind the table's data version is not used."""
+        export("TrafficDaily")
+        TrafficDaily.objects.create(date=START_MS + 15 * DAY_MS, visits=1, sessions=1)
+        data_version.invalidate()
+        response = self.client.get("/analytics/traffic/?limit=3")
+        self.assertEqual(response.data["data"][-1]["visits"], 1)
+        export("TrafficDaily")
+        response_cache.clear()
+        columns = series.recent_columns(TrafficDaily, 2)
+        self.assertEqual(columns["visits"], [1140, 1])
+
+
+class TestDataFactoryTest(StateDirMixin, SimpleTestCase):
+    """Tests for the template-based test data factory."""
+
+    def setUp(self):
+        self.use_state_dir()
+
+    def test_scaled_template(self):
+        """Templates hold the Prisma indexes and the requested row counts."""
+        path = ensure_template(Dataset(days=5_000, months=36, snapshots=30))
+        with closing(sqlite3.connect(path)) as connection:
+            counts = [
+                connection.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+                for table in ("TrafficDaily", "SignupByChannel", "DeviceShare")
+            ]
+            indexes = {
+                name
+                for (name,) in connection.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'index'"
+                )
+            }
+        self.assertEqual(counts, [5_000, 144, 90])
+        self.assertIn("TrafficDaily_date_key", indexes)
+        self.assertIn("SignupByChannel_year_month_channel_key", indexes)
+
+    def test_template_reused(self):
+        """A template is built once per dataset and then reused."""
+        first = ensure_template(Dataset(days=3))
+        built = first.stat().st_mtime_ns
+        self.assertEqual(ensure_template(Dataset(days=3)), first)
+        self.assertEqual(first.stat().st_mtime_ns, built)
+        self.assertNotEqual(ensure_template(Dataset(days=4)), first)
+
+
+class DataVersionTest(BaseTestCase):
+    """Tests for analytics table fingerprints."""
+
+    def test_version_changes_after_write(self):
+        """Writing through the ORM invalidates the cached version."""
+        before = data_version.get(("TrafficDaily",))
+        TrafficDaily.objects.create(
+            date=1709251200000, visits=1, sessions=1
+        )
+        self.assertNotEqual(data_version.get(("TrafficDaily",)), before)
+
+    def test_version_scoped_to_tables(self):
+        """Other tables' versions are unaffected by a write."""
+        before = data_version.get(("RevenueDaily",))
+        TrafficDaily.objects.create(
+            date=1709251200000, visits=1, sessions=1
+        )
+        self.assertEqual(data_version.get(("RevenueDaily",)), before)
+
+
+@skipUnless(
+    connections["analytics"].vendor == "sqlite", "change log triggers are SQLite only"
+)
+class ChangeLogTest(BaseTestCase):
+    """Tests for the trigger-maintained change log."""
+
+    def test_triggers_log_every_write(self):
+        """Inserts, updates and deletes are logged in order."""
+        start = last_seq()
+        row = TrafficDaily.objects.create(date=1709251200000, visits=1, sessions=1)
+        TrafficDaily.objects.filter(id=row.id).update(visits=2)
+        SignupByChannel.objects.filter(year=2024, month=1).delete()
+        changes = changes_since(start)
+        self.assertEqual(
+            [(c.table, c.op) for c in changes[:2]],
+            [("TrafficDaily", "I"), ("TrafficDaily", "U")],
+        )
+        self.assertEqual({c.row_id for c in changes[:2]}, {row.id})
+        self.assertEqual([c.op for c in changes[2:]], ["D"] * 4)
+        self.assertEqual([c.seq for c in changes], list(range(start + 1, start + 7)))
+        self.assertEqual(
+            changes_since(start, tables=["SignupByChannel"], limit=2), changes[2:4]
+        )
+        self.assertEqual(changed_rows(changes)["TrafficDaily"], {row.id: "U"})
+
+    def test_in_place_update_bumps_only_its_table(self):
+        """An upsert leaves count and max id alone but still moves the version."""
+        traffic = data_version.get(("TrafficDaily",))
+        revenue = data_version.get(("RevenueDaily",))
+        TrafficDaily.objects.filter(date=START_MS).update(visits=7)
+        data_version.invalidate()
+        self.assertNotEqual(data_version.get(("TrafficDaily",)), traffic)
+        self.assertEqual(data_version.get(("RevenueDaily",)), revenue)
+
+    def test_compaction_keeps_unacknowledged_and_newest(self):
+        """Compaction stops at the slowest consumer and keeps table heads."""
+        start = last_seq()
+        for day in range(3):
+            TrafficDaily.objects.create(
+                date=1709251200000 + day * DAY_MS, visits=1, sessions=1
+            )
+        acknowledge("rollups", start + 2)
+        acknowledge("rollups", start + 1)  # positions never move back
+        self.assertEqual(position("rollups"), start + 2)
+        heads = change_heads()
+        compact_changes()
+        # Only each table's newest change is left at or before start + 2.
+        self.assertEqual({c.seq for c in changes_since(0)}, set(heads.values()))
+        self.assertEqual(change_heads(), heads)
+        self.assertEqual(last_seq(), start + 3)
+
+
+@skipUnless(
+    connections["analytics"].vendor == "sqlite", "retention is SQLite only"
+)
+class RetentionTest(TransactionTestCase):
+    """Tests for archiving old daily facts."""
+
+    databases = ["analytics"]
+    now_ms = START_MS + 199 * DAY_MS  # the last of 200 days: Jul 22, 2024
+    specs = (
+        {"metrics": ["visits", "sessions"], "granularity": "month"},
+        {"metrics": ["visits"], "granularity": "month", "aggregate": "avg"},
+        {"metrics": ["revenue_cents"], "granularity": "quarter", "aggregate": "max"},
+        {"metrics": ["visits"], "start": "2024-03-10", "end": "2024-05-20"},
+        {"metrics": ["visits"], "granularity": "week", "aggregate": "p90"},
+        {"metrics": ["device_share_pct"], "granularity": "month", "group_by": "device"},
+    )
+
+    def setUp(self):
+        connection = connections["analytics"]
+        load_test_data(connection, Dataset(days=200, snapshots=70))
+        # TransactionTestCase does not restore unmanaged tables.
+        self.addCleanup(load_test_data, connection)
+        self.addCleanup(detach, connection)
+        data_version.invalidate()
+        archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        self.archive = Path(archive_dir.name) / "archive.db"
+        settings_override = override_settings(ANALYTICS_ARCHIVE_DB=self.archive)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.calendar = get_calendar("UTC")
+
+    def answers(self):
+        results = [
+            run_query(parse_spec(spec), self.calendar) for spec in self.specs
+        ]
+        results.append(
+            compare("visits", "month", "previous", date(2024, 5, 10), self.calendar)
+        )
+        return results
+
+    def test_archived_rows_still_answer_queries(self):
+        """Queries across the cutoff union live rows and the archive."""
+        before = self.answers()
+        report = apply_retention(30, now_ms=self.now_ms, calendar=self.calendar)
+        traffic = report["tables"]["TrafficDaily"]
+        # Jun 1 (30 days back) moves to May 1 so 60 days stay live.
+        self.assertEqual(traffic["cutoff"], 1714521600000)
+        self.assertEqual((traffic["moved"], traffic["months"]), (117, 4))
+        self.assertEqual(report["tables"]["DeviceShare"]["moved"], 12)
+        self.assertEqual(TrafficDaily.objects.count(), 83)
+        vacuum = report["vacuum"]
+        self.assertEqual(vacuum["mode"], "full")
+        self.assertEqual(
+            vacuum["reclaimed"], vacuum["bytes_before"] - vacuum["bytes_after"]
+        )
+        with closing(sqlite3.connect(self.archive)) as archive:
+            self.assertEqual(
+                archive.execute('SELECT SUM("visitsSum") FROM "TrafficMonthly"')
+                .fetchone()[0],
+                sum(1000 + i * 10 for i in range(117)),
+            )
+        self.assertEqual(self.answers(), before)
+
+    def test_moves_logged_as_archived(self):
+        """Rows moved to the archive are logged as "A", not as deletes."""
+        seq = last_seq()
+        apply_retention(30, now_ms=self.now_ms, calendar=self.calendar)
+        changes = changes_since(seq, tables=["TrafficDaily"])
+        self.assertEqual(len(changes), 117)
+        self.assertEqual({change.op for change in changes}, {"A"})
+
+    def test_rerun_is_incremental(self):
+        """A second run moves nothing and vacuums incrementally."""
+        apply_retention(30, now_ms=self.now_ms, calendar=self.calendar)
+        report = apply_retention(30, now_ms=self.now_ms, calendar=self.calendar)
+        self.assertEqual(report["tables"]["TrafficDaily"]["moved"], 0)
+        self.assertEqual(report["vacuum"]["mode"], "incremental")
+        self.assertEqual(
+            run_query(parse_spec(self.specs[0]), self.calendar)[0]["period"],
+            "2024-01",
+        )
+
+    def test_dry_run_moves_nothing(self):
+        """A dry run reports the plan without touching either file."""
+        report = apply_retention(
+            30, now_ms=self.now_ms, calendar=self.calendar, dry_run=True
+        )
+        self.assertEqual(report["tables"]["RevenueDaily"]["moved"], 117)
+        self.assertEqual(RevenueDaily.objects.count(), 200)
+        self.assertFalse(self.archive.exists())
@@ -3,10 +3,20 @@
 from django.urls import path
 
 from .views import (
+    AdmissionView,
+    AnomaliesView,
+    CompareView,
+    DeviceShareTrendView,
     DeviceShareView,
     KpisView,
+    QueryView,
     RevenueView,
+    SignupGrowthView,
+    SignupMixView,
+    SignupRollingView,
     SignupsView,
+    SignupTrendView,
+    StreamView,
     TrafficView,
 )
 
@@ -14,6 +24,20 @@ urlpatterns = [
     path("kpis/", KpisView.as_view(), name="kpis"),
     path("traffic/", TrafficView.as_view(), name="traffic"),
     path("signups/", SignupsView.as_view(), name="signups"),
+    path("signups/trend/", SignupTrendView.as_view(), name="signups-trend"),
+    path("signups/growth/", SignupGrowthView.as_view(), name="signups-growth"),
+    path("signups/mix/", SignupMixView.as_view(), name="signups-mix"),
+    path("signups/rolling/", SignupRollingView.as_view(), name="signups-rolling"),
     path("revenue/", RevenueView.as_view(), name="revenue"),
     path("device-share/", DeviceShareView.as_view(), name="device-share"),
+    path(
+        "device-share/trend/",
+        DeviceShareTrendView.as_view(),
+        name="device-share-trend",
+    ),
+    path("admission/", AdmissionView.as_view(), name="admission"),
+    path("anomalies/", AnomaliesView.as_view(), name="anomalies"),
+    path("compare/", CompareView.as_view(), name="compare"),
+    path("query/", QueryView.as_view(), name="query"),
+    path("stream/", StreamView.as_view(), name="stream"),
 ]
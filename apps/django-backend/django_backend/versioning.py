@@ -0,0 +1,132 @@
+"""Cheap change detection for the analytics tables.
+
+The Prisma tables are written by an external process, so Django cannot rely
+on its own signals alone to know when data changed. A table's version is its
+``(row count, max id)`` pair, read for all tables in a single query and cached
+for a short TTL. Saves and deletes made through Django invalidate the cache
+immediately.
+
+Prisma seeds with upserts, which change neither count nor max id, so for a
+file-backed SQLite database every version also carries the modification stamp
+of the database file and its WAL. Any external commit therefore bumps the
+version of every table. On PostgreSQL the stamp is the tables' cumulative
+insert/update/delete counters from ``pg_stat_user_tables`` instead, which
+the server publishes within about a second of a commit.
+
+A SQLite database with the change log (see :mod:`.changes`) needs neither
+stamp: its triggers record every write, upserts included, so a table's
+version carries the sequence number of its newest change instead, and a
+commit bumps only the tables it wrote to.
+"""
+
+import os
+import threading
+import time
+
+from django.db import connections
+
+ANALYTICS_TABLES = (
+    "KpiSnapshot",
+    "TrafficDaily",
+    "SignupByChannel",
+    "RevenueDaily",
+    "DeviceShare",
+)
+
+
+def table_fingerprints(using="analytics"):
+    """Return ``{table: (count, max_id)}`` for every analytics table."""
+    columns = ", ".join(
+        f'(SELECT COUNT(*) FROM "{table}"), (SELECT MAX(id) FROM "{table}")'
+        for table in ANALYTICS_TABLES
+    )
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"SELECT {columns}")
+        row = cursor.fetchone()
+    return {
+        table: (row[2 * i], row[2 * i + 1])
+        for i, table in enumerate(ANALYTICS_TABLES)
+    }
+
+
+def database_file_stamp(using="analytics"):
+    """Return ``(mtime_ns, size)`` of the SQLite file and WAL, or None."""
+    connection = connections[using]
+    if connection.vendor != "sqlite" or connection.is_in_memory_db():
+        return None
+    name = str(connection.settings_dict["NAME"])
+    stamps = []
+    for path in (name, f"{name}-wal"):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            stamps.append(None)
+        else:
+            stamps.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(stamps)
+
+
+def postgres_write_stamp(using="analytics"):
+    """Return the analytics tables' write counters on PostgreSQL, or None."""
+    connection = connections[using]
+    if connection.vendor != "postgresql":
+        return None
+    placeholders = ", ".join(["%s"] * len(ANALYTICS_TABLES))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT relname, n_tup_ins + n_tup_upd + n_tup_del "
+            f"FROM pg_stat_user_tables WHERE relname IN ({placeholders}) "
+            f"ORDER BY relname",
+            list(ANALYTICS_TABLES),
+        )
+        return tuple(cursor.fetchall())
+
+
+class DataVersion:
+    """Per-process cache of analytics table fingerprints."""
+
+    def __init__(self, ttl=1.0, using="analytics"):
+        self.ttl = ttl
+        self.using = using
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._expires = 0.0
+
+    def get(self, tables=ANALYTICS_TABLES):
+        """Return a hashable version covering ``tables``."""
+        stamp, heads, fingerprints = self._current()
+        if heads is not None:
+            stamp = tuple(heads[table] for table in tables)
+        return (stamp, *(fingerprints[table] for table in tables))
+
+    def invalidate(self):
+        """Force the next lookup to re-read the fingerprints."""
+        with self._lock:
+            self._snapshot = None
+
+    def _current(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._snapshot is not None and now < self._expires:
+                return self._snapshot
+        from .changes import change_heads
+
+        heads = change_heads(self.using)
+        stamp = None
+        if heads is None:
+            stamp = database_file_stamp(self.using) or postgres_write_stamp(
+                self.using
+            )
+        snapshot = (stamp, heads, table_fingerprints(self.using))
+        with self._lock:
+            self._snapshot = snapshot
+            self._expires = now + self.ttl
+        return snapshot
+
+
+data_version = DataVersion()
+
+
+def invalidate_on_write(sender, **kwargs):
+    """Signal handler dropping cached fingerprints after an ORM write."""
+    data_version.invalidate()
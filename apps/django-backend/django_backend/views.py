@@ -4,9 +4,28 @@ These views handle incoming requests, validate parameters, query data
 using model managers, and return serialized responses.
 """
 
+from datetime import date, datetime
+from functools import partial
+from zoneinfo import ZoneInfoNotFoundError
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from django.views import View
+from rest_framework.permissions import BasePermission
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
+from .admission import Overloaded, admission, retry_after
+from .anomalies import detectors
+from .caching import CachedPayload, PrecompressedResponse, response_cache
+from .coalescing import inflight, request_key
+from .cohorts import ROLLING_WINDOWS, matrices
+from .comparison import AGAINST, COMPARE_METRICS, PERIODS, compare
+from .dates import get_calendar
 from .models import (
     DeviceShare,
     KpiSnapshot,
@@ -14,85 +33,723 @@ from .models import (
     SignupByChannel,
     TrafficDaily,
 )
+from .profiling import has_profile_token, profile_reason, profile_request
+from .query import (
+    DATE_RANGE,
+    DIMENSIONS,
+    METRICS,
+    SOURCES,
+    SPEC_FIELDS,
+    InvalidQuery,
+    check_cost,
+    parse_spec,
+    run_query,
+)
+from .renderers import COLUMNAR_FORMATS, COLUMNAR_RENDERERS
+from .sampling import samples
 from .serializers import (
+    AnomalyResponseSerializer,
+    ComparisonResponseSerializer,
     DeviceShareResponseSerializer,
+    DeviceShareTrendResponseSerializer,
     ErrorResponseSerializer,
     KpiResponseSerializer,
+    QueryResponseSerializer,
+    RevenueColumnsSerializer,
     RevenueResponseSerializer,
+    SignupMatrixResponseSerializer,
     SignupResponseSerializer,
+    SignupTrendResponseSerializer,
+    TrafficColumnsSerializer,
     TrafficResponseSerializer,
 )
+from .series import series
+from .snapshots import snapshots
+from .streaming import Subscriber, TableWatcher, Widget
+from .versioning import data_version
 
+# JSON plus whichever binary columnar encodings are installed.
+TIME_SERIES_RENDERERS = [
+    *api_settings.DEFAULT_RENDERER_CLASSES,
+    *COLUMNAR_RENDERERS,
+]
 
-class KpisView(APIView):
-    """GET /analytics/kpis - Latest KPI snapshot."""
 
-    def get(self, request):
-        snapshot = KpiSnapshot.objects.get_latest()
-        serializer = KpiResponseSerializer(snapshot)
-        return Response(serializer.data)
+class InvalidParameter(Exception):
+    """A query parameter failed validation; rendered as a 400 response."""
 
 
-class TrafficView(APIView):
-    """GET /analytics/traffic?limit=10 - Recent traffic data."""
+class AnalyticsView(APIView):
+    """Base view for endpoints reading from the analytics database."""
 
-    def get(self, request):
-        # Validate limit parameter
-        limit = request.query_params.get("limit", "10")
+    # Tables the response is derived from; part of the cache key.
+    tables = ()
+
+    @classmethod
+    def snapshot_variants(cls, calendar):
+        """``(params, compute)`` for each response ``publish_snapshots`` renders.
+
+        ``params`` are exactly what ``get`` passes to :meth:`cached`. Views
+        whose params are open-ended publish nothing.
+        """
+        return ()
+
+    def bounded_int(self, request, name, default, low=1, high=60):
+        """Read an integer query parameter constrained to [low, high]."""
+        value = request.query_params.get(name, str(default))
         try:
-            limit = int(limit)
-            if not 1 <= limit <= 60:
+            value = int(value)
+            if not low <= value <= high:
                 raise ValueError
         except ValueError:
-            error_serializer = ErrorResponseSerializer(
-                {"error": "limit must be between 1 and 60"}
-            )
+            raise InvalidParameter(
+                f"{name} must be between {low} and {high}"
+            ) from None
+        return value
+
+    def flag(self, request, name):
+        """Read a boolean query parameter (absent means false)."""
+        value = request.query_params.get(name, "false").lower()
+        if value not in ("1", "true", "0", "false"):
+            raise InvalidParameter(f"{name} must be true or false")
+        return value in ("1", "true")
+
+    def choice(self, request, name, allowed, default=None):
+        """Read a query parameter that must be one of ``allowed``."""
+        value = request.query_params.get(name) or default
+        if value not in allowed:
+            raise InvalidParameter(f"{name} must be one of: {', '.join(allowed)}")
+        return value
+
+    def calendar(self, request):
+        """Calendar for the ``tz`` query parameter (default TIME_ZONE)."""
+        tz_name = request.query_params.get("tz")
+        try:
+            return get_calendar(tz_name)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise InvalidParameter(f"unknown timezone: {tz_name}") from None
+
+    def wants_columns(self, request):
+        """Whether the negotiated renderer takes columnar data."""
+        return request.accepted_renderer.format in COLUMNAR_FORMATS
+
+    def dispatch(self, request, *args, **kwargs):
+        reason = profile_reason(request)
+        if reason is None:
+            return super().dispatch(request, *args, **kwargs)
+        return profile_request(
+            type(self).__name__,
+            request,
+            reason,
+            partial(super().dispatch, request, *args, **kwargs),
+        )
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # The socket address: X-Forwarded-For is set by the client unless a
+        # trusted proxy overwrites it, so it cannot key the per-client limit.
+        admission.admit(request.META.get("REMOTE_ADDR", ""))
+
+    def stale_key(self, request):
+        """Key of the last response for this URL and format, or None.
+
+        POST bodies (``/analytics/query``) are not part of the URL, so their
+        responses are not kept for shed requests.
+        """
+        if request.method not in ("GET", "HEAD"):
+            return None
+        return (
+            type(self).__name__,
+            request.get_full_path(),
+            request.accepted_renderer.format,
+        )
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        vary = ["Accept-Encoding"]
+        if len(self.renderer_classes) > 1:
+            vary.append("Accept")
+        patch_vary_headers(response, vary)
+        return response
+
+    def handle_exception(self, exc):
+        if isinstance(exc, InvalidParameter):
+            error_serializer = ErrorResponseSerializer({"error": str(exc)})
             return Response(error_serializer.data, status=400)
+        if isinstance(exc, Overloaded):
+            return self.shed(exc)
+        return super().handle_exception(exc)
+
+    def shed(self, exc):
+        """Last response for the URL if there is one, else 429/503."""
+        request = self.request
+        entry = admission.shed_response(self.stale_key(request), exc.reason)
+        if entry is not None:
+            response = PrecompressedResponse(
+                entry, request.META.get("HTTP_ACCEPT_ENCODING")
+            )
+            response["X-Analytics-Stale"] = exc.reason
+            return response
+        error_serializer = ErrorResponseSerializer({"error": "overloaded, retry later"})
+        response = Response(error_serializer.data, status=exc.status)
+        response["Retry-After"] = retry_after(exc.retry_after)
+        return response
+
+    def cached(self, request, params, compute):
+        """Serve ``compute()`` rendered, compressed and cached per data version.
+
+        The key covers the view, its normalized params, the negotiated format
+        and the version of ``tables``. Concurrent misses for the same key are
+        coalesced into a single computation. Rendering and compressing it
+        takes a query slot (see :mod:`django_backend.admission`).
+
+        JSON responses published by ``publish_snapshots`` for the current
+        data version are served from the snapshot files instead.
+        """
+        version = data_version.get(self.tables)
+        if request.accepted_renderer.format == "json":
+            published = snapshots.lookup(
+                type(self).__name__, params, self.tables, version
+            )
+            if published is not None:
+                return self.published(request, published)
+        key = request_key(
+            type(self).__name__,
+            {**params, "format": request.accepted_renderer.format},
+            version,
+        )
+        entry = response_cache.get(key)
+        if entry is None:
+            entry = inflight.do(
+                key,
+                lambda: admission.run_query(
+                    lambda: self._render_entry(key, request, compute)
+                ),
+            )
+        stale_key = self.stale_key(request)
+        if stale_key is not None:
+            admission.remember(stale_key, entry)
+        return PrecompressedResponse(entry, request.META.get("HTTP_ACCEPT_ENCODING"))
+
+    def published(self, request, payload):
+        """A snapshot's body with its ETag, or 304 if the client has it."""
+        tags = parse_etags(request.META.get("HTTP_IF_NONE_MATCH", ""))
+        if "*" in tags or payload.etag.removeprefix("W/") in {
+            tag.removeprefix("W/") for tag in tags
+        }:
+            response = Response(status=304)
+        else:
+            response = PrecompressedResponse(
+                payload, request.META.get("HTTP_ACCEPT_ENCODING")
+            )
+        response["ETag"] = payload.etag
+        return response
+
+    def _render_entry(self, key, request, compute):
+        data = compute()
+        renderer = request.accepted_renderer
+        body = renderer.render(
+            data, request.accepted_media_type, self.get_renderer_context()
+        )
+        if isinstance(body, str):
+            body = body.encode(renderer.charset)
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f"{content_type}; charset={renderer.charset}"
+        ttl = getattr(settings, "ANALYTICS_CACHE_TTL", 60)
+        entry = CachedPayload(data, body, content_type, ttl)
+        response_cache.set(key, entry)
+        return entry
+
+
+class KpisView(AnalyticsView):
+    """GET /analytics/kpis - Latest KPI snapshot."""
+
+    tables = ("KpiSnapshot",)
+
+    def get(self, request):
+        return self.cached(request, {}, self.compute)
+
+    @classmethod
+    def snapshot_variants(cls, calendar):
+        yield {}, cls.compute
+
+    @staticmethod
+    def compute():
+        snapshot = KpiSnapshot.objects.get_latest()
+        return KpiResponseSerializer(snapshot).data
+
+
+class TrafficView(AnalyticsView):
+    """GET /analytics/traffic?limit=10&tz=UTC&anomalies=false - Recent traffic.
+
+    ``anomalies=true`` adds each point's anomaly scores (JSON only). Also
+    served as columnar MessagePack or Arrow when requested via Accept.
+    """
+
+    tables = ("TrafficDaily",)
+    renderer_classes = TIME_SERIES_RENDERERS
+
+    def get(self, request):
+        limit = self.bounded_int(request, "limit", default=10)
+        calendar = self.calendar(request)
 
         # Query and serialize data
-        traffic_data = list(TrafficDaily.objects.get_recent(limit))
-        serializer = TrafficResponseSerializer({"data": traffic_data})
-        return Response(serializer.data)
+        if self.wants_columns(request):
+            return self.cached(
+                request,
+                {"limit": limit, "tz": calendar.tz_name},
+                lambda: self.compute_columns(limit, calendar),
+            )
+        anomalies = self.flag(request, "anomalies")
+        return self.cached(
+            request,
+            {"limit": limit, "tz": calendar.tz_name, "anomalies": anomalies},
+            lambda: self.compute(limit, calendar, anomalies),
+        )
 
+    @classmethod
+    def snapshot_variants(cls, calendar):
+        for limit in range(1, 61):
+            params = {"limit": limit, "tz": calendar.tz_name, "anomalies": False}
+            yield params, partial(cls.compute, limit, calendar)
 
-class SignupsView(APIView):
+    @staticmethod
+    def compute(limit, calendar, anomalies=False):
+        traffic_data = series.recent_rows(TrafficDaily, limit)
+        if traffic_data is None:
+            traffic_data = list(TrafficDaily.objects.get_recent(limit))
+        context = {"calendar": calendar}
+        if anomalies:
+            context["anomalies"] = detectors.get().scores(("visits", "sessions"))
+        return TrafficResponseSerializer({"data": traffic_data}, context=context).data
+
+    @staticmethod
+    def compute_columns(limit, calendar):
+        columns = series.recent_columns(TrafficDaily, limit)
+        if columns is None:
+            columns = TrafficDaily.objects.get_recent_columns(limit)
+        return TrafficColumnsSerializer(columns, context={"calendar": calendar}).data
+
+
+class SignupsView(AnalyticsView):
     """GET /analytics/signups - Latest month's signup breakdown."""
 
+    tables = ("SignupByChannel",)
+
     def get(self, request):
+        return self.cached(request, {}, self.compute)
+
+    @classmethod
+    def snapshot_variants(cls, calendar):
+        yield {}, cls.compute
+
+    @staticmethod
+    def compute():
         signups = SignupByChannel.objects.get_latest_month()
-        serializer = SignupResponseSerializer({"data": signups})
-        return Response(serializer.data)
+        return SignupResponseSerializer({"data": signups}).data
+
 
+class SignupTrendView(AnalyticsView):
+    """GET /analytics/signups/trend?months=12 - Signups per channel by month."""
 
-class RevenueView(APIView):
-    """GET /analytics/revenue?limit=10 - Recent revenue data."""
+    tables = ("SignupByChannel",)
 
     def get(self, request):
-        # Validate limit parameter
-        limit = request.query_params.get("limit", "10")
-        try:
-            limit = int(limit)
-            if not 1 <= limit <= 60:
-                raise ValueError
-        except ValueError:
-            error_serializer = ErrorResponseSerializer(
-                {"error": "limit must be between 1 and 60"}
+        months = self.bounded_int(request, "months", default=12)
+        return self.cached(
+            request, {"months": months}, lambda: self.compute(months)
+        )
+
+    @classmethod
+    def snapshot_variants(cls, calendar):
+        for months in range(1, 61):
+            yield {"months": months}, partial(cls.compute, months)
+
+    @staticmethod
+    def compute(months):
+        rows = SignupByChannel.objects.get_trend(months)
+        return SignupTrendResponseSerializer(rows).data
+
+
+class SignupMatrixView(AnalyticsView):
+    """Base for month x channel signup metrics over all history.
+
+    Served from the per-process matrix in :mod:`django_backend.cohorts`.
+    ``total`` holds the all-channel figure for each period.
+    """
+
+    tables = ("SignupByChannel",)
+    metric = None  # SignupMatrix method computing (values, totals)
+    # Ranges publish_snapshots renders: the dashboard default. The other
+    # 1..240 values render live from the matrix.
+    published_months = (12,)
+
+    def get(self, request):
+        months = self.bounded_int(request, "months", default=12, high=240)
+        return self.cached(request, {"months": months}, lambda: self.compute(months))
+
+    @classmethod
+    def snapshot_variants(cls, calendar):
+        for months in cls.published_months:
+            yield {"months": months}, partial(cls().compute, months)
+
+    def compute(self, months, *args):
+        matrix = matrices.get()
+        values, totals = getattr(matrix, self.metric)(*args, months)
+        return SignupMatrixResponseSerializer((matrix, months, values, totals)).data
+
+
+class SignupGrowthView(SignupMatrixView):
+    """GET /analytics/signups/growth?months=12 - Month-over-month change, %."""
+
+    metric = "growth"
+
+
+class SignupMixView(SignupMatrixView):
+    """GET /analytics/signups/mix?months=12 - Channel share of each month, %."""
+
+    metric = "mix"
+
+
+class SignupRollingView(SignupMatrixView):
+    """GET /analytics/signups/rolling?window=3&months=12 - Trailing sums."""
+
+    metric = "rolling"
+
+    def get(self, request):
+        months = self.bounded_int(request, "months", default=12, high=240)
+        window = request.query_params.get("window", "3")
+        if window not in {str(size) for size in ROLLING_WINDOWS}:
+            raise InvalidParameter(
+                f"window must be one of {', '.join(map(str, ROLLING_WINDOWS))}"
             )
-            return Response(error_serializer.data, status=400)
+        return self.cached(
+            request,
+            {"months": months, "window": int(window)},
+            lambda: self.compute(months, int(window)),
+        )
+
+    @classmethod
+    def snapshot_variants(cls, calendar):
+        view = cls()
+        for window in ROLLING_WINDOWS:
+            for months in cls.published_months:
+                params = {"months": months, "window": window}
+                yield params, partial(view.compute, months, window)
+
+
+class RevenueView(AnalyticsView):
+    """GET /analytics/revenue?limit=10&tz=UTC&anomalies=false - Recent revenue.
+
+    ``anomalies=true`` adds each point's anomaly scores (JSON only). Also
+    served as columnar MessagePack or Arrow when requested via Accept.
+    """
+
+    tables = ("RevenueDaily",)
+    renderer_classes = TIME_SERIES_RENDERERS
+
+    def get(self, request):
+        limit = self.bounded_int(request, "limit", default=10)
+        calendar = self.calendar(request)
 
         # Query and serialize data
-        revenue_data = list(RevenueDaily.objects.get_recent(limit))
-        serializer = RevenueResponseSerializer({"data": revenue_data})
-        return Response(serializer.data)
+        if self.wants_columns(request):
+            return self.cached(
+                request,
+                {"limit": limit, "tz": calendar.tz_name},
+                lambda: self.compute_columns(limit, calendar),
+            )
+        anomalies = self.flag(request, "anomalies")
+        return self.cached(
+            request,
+            {"limit": limit, "tz": calendar.tz_name, "anomalies": anomalies},
+            lambda: self.compute(limit, calendar, anomalies),
+        )
+
+    @classmethod
+    def snapshot_variants(cls, calendar):
+        for limit in range(1, 61):
+            params = {"limit": limit, "tz": calendar.tz_name, "anomalies": False}
+            yield params, partial(cls.compute, limit, calendar)
+
+    @staticmethod
+    def compute(limit, calendar, anomalies=False):
+        revenue_data = series.recent_rows(RevenueDaily, limit)
+        if revenue_data is None:
+            revenue_data = list(RevenueDaily.objects.get_recent(limit))
+        context = {"calendar": calendar}
+        if anomalies:
+            context["anomalies"] = detectors.get().scores(("revenue_cents",))
+        return RevenueResponseSerializer({"data": revenue_data}, context=context).data
 
+    @staticmethod
+    def compute_columns(limit, calendar):
+        columns = series.recent_columns(RevenueDaily, limit)
+        if columns is None:
+            columns = RevenueDaily.objects.get_recent_columns(limit)
+        return RevenueColumnsSerializer(columns, context={"calendar": calendar}).data
 
-class DeviceShareView(APIView):
+
+class DeviceShareView(AnalyticsView):
     """GET /analytics/device-share - Latest device distribution."""
 
+    tables = ("DeviceShare",)
+
     def get(self, request):
+        return self.cached(request, {}, self.compute)
+
+    @classmethod
+    def snapshot_variants(cls, calendar):
+        yield {}, cls.compute
+
+    @staticmethod
+    def compute():
         devices = DeviceShare.objects.get_latest_snapshot()
-        serializer = DeviceShareResponseSerializer({"data": devices})
-        return Response(serializer.data)
+        return DeviceShareResponseSerializer({"data": devices}).data
+
+
+class DeviceShareTrendView(AnalyticsView):
+    """GET /analytics/device-share/trend?snapshots=10&tz=UTC - Share history."""
+
+    tables = ("DeviceShare",)
+
+    def get(self, request):
+        snapshots = self.bounded_int(request, "snapshots", default=10)
+        calendar = self.calendar(request)
+        return self.cached(
+            request,
+            {"snapshots": snapshots, "tz": calendar.tz_name},
+            lambda: self.compute(snapshots, calendar),
+        )
+
+    @classmethod
+    def snapshot_variants(cls, calendar):
+        for count in range(1, 61):
+            params = {"snapshots": count, "tz": calendar.tz_name}
+            yield params, partial(cls.compute, count, calendar)
+
+    @staticmethod
+    def compute(snapshots, calendar):
+        rows = DeviceShare.objects.get_trend(snapshots)
+        context = {"calendar": calendar}
+        return DeviceShareTrendResponseSerializer(rows, context=context).data
+
+
+class AnomaliesView(AnalyticsView):
+    """GET /analytics/anomalies?days=30&tz=UTC - Recently flagged days.
+
+    Days whose visits, sessions or revenue deviate sharply from the recent
+    baseline for the same weekday (see :mod:`django_backend.anomalies`).
+    """
+
+    tables = ("TrafficDaily", "RevenueDaily")
+
+    def get(self, request):
+        days = self.bounded_int(request, "days", default=30, high=366)
+        calendar = self.calendar(request)
+        return self.cached(
+            request,
+            {"days": days, "tz": calendar.tz_name},
+            lambda: self.compute(days, calendar),
+        )
+
+    @staticmethod
+    def compute(days, calendar):
+        flags = detectors.get().recent(days)
+        return AnomalyResponseSerializer(flags, context={"calendar": calendar}).data
+
+
+class CompareView(AnalyticsView):
+    """GET /analytics/compare?metric=visits&period=week&against=previous
+
+    Period-to-date total of ``metric`` (visits, sessions or revenue) against
+    the same span of the previous period or of the previous year, with the
+    absolute and percentage change. ``period`` is day, week, month, quarter
+    or year; the current period is the one containing ``date`` (default
+    today in ``tz``).
+    """
+
+    def get(self, request):
+        params = request.query_params
+        metric = self.choice(request, "metric", tuple(COMPARE_METRICS))
+        period = self.choice(request, "period", PERIODS, default="week")
+        against = self.choice(request, "against", AGAINST, default="previous")
+        calendar = self.calendar(request)
+        anchor = params.get("date")
+        if anchor:
+            try:
+                anchor = date.fromisoformat(anchor)
+            except ValueError:
+                raise InvalidParameter("date must be a YYYY-MM-DD date") from None
+            low, high = DATE_RANGE
+            if not low <= anchor <= high:
+                raise InvalidParameter(f"date must be between {low} and {high}")
+        else:
+            anchor = datetime.now(calendar.tz).date()
+        self.tables = (SOURCES[METRICS[COMPARE_METRICS[metric]].source].table,)
+        return self.cached(
+            request,
+            {
+                "metric": metric,
+                "period": period,
+                "against": against,
+                "date": anchor.isoformat(),
+                "tz": calendar.tz_name,
+            },
+            lambda: self.compute(metric, period, against, anchor, calendar),
+        )
+
+    @staticmethod
+    def compute(metric, period, against, anchor, calendar):
+        comparison = compare(metric, period, against, anchor, calendar)
+        return ComparisonResponseSerializer(comparison).data
+
+
+class QueryView(AnalyticsView):
+    """GET|POST /analytics/query - Declarative metrics query.
+
+    POST takes the spec as a JSON object (see :mod:`django_backend.query`).
+    GET takes the same fields as query parameters, with lists comma-separated
+    and filters named by dimension:
+    ``?metrics=signups&granularity=quarter&group_by=channel&channel=paid``.
+    Results are cached per normalized spec and data version.
+    """
+
+    def get(self, request):
+        params = request.query_params
+        data = {field: params[field] for field in SPEC_FIELDS if field in params}
+        data["filters"] = {dim: params[dim] for dim in DIMENSIONS if dim in params}
+        return self.query(request, data)
+
+    def post(self, request):
+        return self.query(request, request.data)
+
+    def query(self, request, data):
+        calendar = self.calendar(request)
+        try:
+            spec = parse_spec(data)
+            if spec.accuracy == "approx" and not samples.ready(spec.source_name):
+                # No sample until refresh_samples has run: answer exactly.
+                spec = spec._replace(accuracy="exact")
+            self.tables = (spec.source.table,)
+            check_cost(spec)
+        except InvalidQuery as exc:
+            raise InvalidParameter(str(exc)) from None
+        return self.cached(
+            request,
+            {**spec._asdict(), "tz": calendar.tz_name},
+            lambda: self.compute(spec, calendar),
+        )
+
+    @staticmethod
+    def compute(spec, calendar):
+        rows = run_query(spec, calendar)
+        return QueryResponseSerializer((spec, rows)).data
+
+
+def _without_calendar(compute):
+    return lambda calendar: compute()
+
+
+# Dashboard widgets pushed by /analytics/stream, with their default params.
+STREAM_WIDGETS = {
+    "kpis": Widget(KpisView.tables, _without_calendar(KpisView.compute)),
+    "traffic": Widget(TrafficView.tables, partial(TrafficView.compute, 10)),
+    "signups": Widget(SignupsView.tables, _without_calendar(SignupsView.compute)),
+    "revenue": Widget(RevenueView.tables, partial(RevenueView.compute, 10)),
+    "device-share": Widget(
+        DeviceShareView.tables, _without_calendar(DeviceShareView.compute)
+    ),
+}
+
+# Endpoints pre-rendered by `manage.py publish_snapshots`, by URL name.
+# Anomalies, compare and query take open-ended or date-relative params.
+SNAPSHOT_VIEWS = {
+    "kpis": KpisView,
+    "traffic": TrafficView,
+    "signups": SignupsView,
+    "signups-trend": SignupTrendView,
+    "signups-growth": SignupGrowthView,
+    "signups-mix": SignupMixView,
+    "signups-rolling": SignupRollingView,
+    "revenue": RevenueView,
+    "device-share": DeviceShareView,
+    "device-share-trend": DeviceShareTrendView,
+}
+
+stream_watcher = TableWatcher(
+    STREAM_WIDGETS, interval=getattr(settings, "ANALYTICS_STREAM_INTERVAL", 1.0)
+)
+
+
+class StreamView(View):
+    """GET /analytics/stream?widgets=kpis,traffic&tz=UTC - Live widget updates.
+
+    Server-Sent Events: one ``event: <widget>`` with the widget's payload on
+    connect, then again whenever it changes. Requires an ASGI server, e.g.
+    ``uvicorn django_overthinglytics.asgi:application`` (the ``asgi`` extra,
+    ``nx run django-backend:serve-asgi``); under WSGI (``runserver``) the
+    endless stream would hold a worker, so it answers 501.
+    """
+
+    async def get(self, request):
+        if not isinstance(request, ASGIRequest):
+            return self.error("streaming requires an ASGI server", status=501)
+        names = request.GET.get("widgets") or ",".join(STREAM_WIDGETS)
+        widgets = [name for name in names.split(",") if name]
+        unknown = [name for name in widgets if name not in STREAM_WIDGETS]
+        if unknown:
+            return self.error(
+                f"unknown widget: {unknown[0]}; "
+                f"allowed: {', '.join(STREAM_WIDGETS)}"
+            )
+        tz_name = request.GET.get("tz")
+        try:
+            calendar = get_calendar(tz_name)
+        except (ZoneInfoNotFoundError, ValueError):
+            return self.error(f"unknown timezone: {tz_name}")
+
+        subscriber = Subscriber(widgets, calendar.tz_name)
+        heartbeat = getattr(settings, "ANALYTICS_STREAM_HEARTBEAT", 15.0)
+        response = StreamingHttpResponse(
+            stream_watcher.stream(subscriber, heartbeat),
+            content_type="text/event-stream",
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    @staticmethod
+    def error(message, status=400):
+        error_serializer = ErrorResponseSerializer({"error": message})
+        return JsonResponse(error_serializer.data, status=status)
+
+
+class IsStaffOrProfileToken(BasePermission):
+    """Staff users, or requests with the profiling header token.
+
+    The API profile installs no auth apps, so there only the token works.
+    """
+
+    def has_permission(self, request, view):
+        user = request.user
+        if user is not None and user.is_staff:
+            return True
+        return has_profile_token(request)
+
+
+class AdmissionView(APIView):
+    """GET /analytics/admission - Rate limits and shed-request counters.
+
+    Operators only: staff, or ``X-Analytics-Profile: <ANALYTICS_PROFILE_TOKEN>``.
+    Not itself rate limited, so it stays readable under overload.
+    """
+
+    permission_classes = [IsStaffOrProfileToken]
+
+    def get(self, request):
+        return Response(admission.stats())
 
 
 class HealthView(APIView):
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -90,12 +91,35 @@ DATABASES = {
         'OPTIONS': {
             'init_command': 'PRAGMA foreign_keys=OFF;',
         },
+        # Tests get their own in-memory database, filled from a template of
+        # the Prisma schema (see django_backend.testing).
         'TEST': {
-            'MIRROR': 'default',
+            'DEPENDENCIES': [],
         },
     }
 }
 
+# Optional PostgreSQL analytics database instead of the Prisma SQLite file.
+# Set ANALYTICS_POSTGRES_DB; host, port, user and password come from the
+# standard PGHOST/PGPORT/PGUSER/PGPASSWORD variables read by libpq. Create the
+# tables with `manage.py create_analytics_schema`. Connections are pooled
+# per process (psycopg[pool]), and queryset .iterator() reads use
+# server-side cursors. Tests then run against test_<name> on that server.
+if os.environ.get('ANALYTICS_POSTGRES_DB'):
+    DATABASES['analytics'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ['ANALYTICS_POSTGRES_DB'],
+        'OPTIONS': {
+            'pool': {
+                'min_size': 1,
+                'max_size': int(os.environ.get('ANALYTICS_POSTGRES_POOL_SIZE', 10)),
+            },
+        },
+        'TEST': {
+            'DEPENDENCIES': [],
+        },
+    }
+
 # Use analytics database for our models
 DATABASE_ROUTERS = ['django_backend.routers.AnalyticsRouter']
 
@@ -152,3 +176,84 @@ REST_FRAMEWORK = {
 # CORS settings - allow frontend to access API
 # Allow all origins to prevent CORS issues during development across apps/backends
 CORS_ALLOW_ALL_ORIGINS = True
+
+# Local state written by analytics jobs (KPI engine state, etc.)
+ANALYTICS_STATE_DIR = BASE_DIR / 'var'
+
+# Analytics response cache: rendered payloads are kept per data version and
+# precompressed once (gzip, plus brotli/zstd when installed).
+ANALYTICS_CACHE_MAX_ENTRIES = 512
+ANALYTICS_CACHE_TTL = 60  # seconds
+ANALYTICS_COMPRESSION_MIN_BYTES = 512
+# Levels used on the request path; snapshot publishing always uses the maximum.
+ANALYTICS_COMPRESSION_LEVELS = {'br': 5, 'zstd': 3, 'gzip': 6}
+
+# /analytics/query cost guard: specs without a start/end range scan the whole
+# table and are rejected above this many rows; bounded ranges are capped.
+ANALYTICS_QUERY_ROW_BUDGET = 50_000
+ANALYTICS_QUERY_MAX_DAYS = 3660
+
+# /analytics/stream (SSE, ASGI only): one shared poll of the table versions
+# per process, and a comment line to keep idle connections open.
+ANALYTICS_STREAM_INTERVAL = 1.0  # seconds
+ANALYTICS_STREAM_HEARTBEAT = 15.0  # seconds
+
+# Rows kept per reservoir sample for accuracy=approx queries.
+ANALYTICS_SAMPLE_SIZE = 10_000
+
+# Anomaly flags on daily traffic/revenue: weight of the newest week in each
+# weekday's EWMA baseline, and the |z| above which a day is flagged.
+ANALYTICS_ANOMALY_ALPHA = 0.2
+ANALYTICS_ANOMALY_THRESHOLD = 3.0
+
+# Admission control for the analytics endpoints (None disables each limit):
+# token buckets of (requests per second, burst) per client (429 when empty)
+# and per process (503), and a cap on concurrent cache-miss queries; misses
+# waiting longer than the queue timeout are shed with a 503. Shed GET requests
+# get the last response for the same URL when there is one. Clients are keyed
+# by REMOTE_ADDR, not X-Forwarded-For; behind a reverse proxy every client
+# shares the proxy's bucket, so size the per-client limit for it (or None).
+ANALYTICS_RATE_LIMIT_PER_CLIENT = (20, 40)
+ANALYTICS_RATE_LIMIT_GLOBAL = (200, 400)
+ANALYTICS_MAX_CONCURRENT_QUERIES = 4
+ANALYTICS_QUERY_QUEUE_TIMEOUT = 0.5  # seconds
+
+# Slow-query log for the analytics alias: statements at or above the
+# threshold are logged with their caller and query plan to
+# ANALYTICS_STATE_DIR/slow-queries.log (None disables). See
+# `manage.py slow_queries`.
+ANALYTICS_SLOW_QUERY_MS = 100
+ANALYTICS_SLOW_QUERY_LOG_BYTES = 5_000_000
+ANALYTICS_SLOW_QUERY_LOG_BACKUPS = 3
+
+# Static snapshots written by `manage.py publish_snapshots` to
+# ANALYTICS_STATE_DIR/snapshots. When serving is on, JSON requests for a
+# published variant whose tables are unchanged are answered from the files,
+# with ETags.
+ANALYTICS_SERVE_SNAPSHOTS = False
+
+# On-demand request profiling: a request with the header
+# X-Analytics-Profile: <token>, or a random fraction of requests, runs under
+# the profiler ("sampler" stack samples every INTERVAL_MS, or "cprofile").
+# Profiles with their SQL timings are kept in ANALYTICS_STATE_DIR/profiles
+# (newest KEEP) and listed at /admin/profiles/. No token and a zero rate
+# turn profiling off.
+ANALYTICS_PROFILE_TOKEN = os.environ.get('ANALYTICS_PROFILE_TOKEN')
+ANALYTICS_PROFILE_SAMPLE_RATE = 0.0
+ANALYTICS_PROFILER = 'sampler'
+ANALYTICS_PROFILE_INTERVAL_MS = 1
+ANALYTICS_PROFILE_KEEP = 100
+
+# Retention (`manage.py apply_retention`): daily facts older than the start
+# of the month RETENTION_DAYS ago move to the archive SQLite file (default
+# <db>.archive.db next to the database), which queries over older ranges
+# attach on demand.
+ANALYTICS_RETENTION_DAYS = 400
+ANALYTICS_ARCHIVE_DB = None
+
+# Columnar time-series files written by `manage.py export_series` to
+# SERIES_DIR (default ANALYTICS_STATE_DIR/series) and memory-mapped by every
+# worker. When serving is on, traffic and revenue reads are answered from a
+# file whose data version matches the table's.
+ANALYTICS_SERVE_SERIES = False
+ANALYTICS_SERIES_DIR = None
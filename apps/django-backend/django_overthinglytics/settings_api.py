@@ -0,0 +1,34 @@
+"""
+API-only deployment profile for the analytics endpoints.
+
+Select it with DJANGO_SETTINGS_MODULE=django_overthinglytics.settings_api.
+Workers load only what /analytics/* and /health/ need: no admin, auth,
+sessions, messages or staticfiles, and a URLconf without the admin site.
+This keeps cold start (imports and app registry population) short for
+autoscaled pods; see benchmarks/startup.py.
+"""
+
+from .settings import *  # noqa: F403
+
+INSTALLED_APPS = [
+    'rest_framework',
+    'corsheaders',
+    'django_backend',
+]
+
+MIDDLEWARE = [
+    'corsheaders.middleware.CorsMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
+
+ROOT_URLCONF = 'django_overthinglytics.urls_api'
+
+TEMPLATES = []
+
+# No auth apps are installed, so DRF must not resolve request.user.
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,  # noqa: F405
+    'DEFAULT_AUTHENTICATION_CLASSES': [],
+    'DEFAULT_PERMISSION_CLASSES': [],
+    'UNAUTHENTICATED_USER': None,
+}
@@ -17,9 +17,20 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import include, path
 
+from django_backend.admin import profile_download, profile_list
 from django_backend.views import HealthView
 
 urlpatterns = [
+    path(
+        "admin/profiles/",
+        admin.site.admin_view(profile_list),
+        name="analytics-profiles",
+    ),
+    path(
+        "admin/profiles/<str:name>",
+        admin.site.admin_view(profile_download),
+        name="analytics-profile-file",
+    ),
     path("admin/", admin.site.urls),
     path("health/", HealthView.as_view(), name="health"),
     path("analytics/", include("django_backend.urls")),
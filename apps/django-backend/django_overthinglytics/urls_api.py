@@ -0,0 +1,9 @@
+"""URL configuration for the API-only deployment profile (no admin site)."""
+from django.urls import include, path
+
+from django_backend.views import HealthView
+
+urlpatterns = [
+    path("health/", HealthView.as_view(), name="health"),
+    path("analytics/", include("django_backend.urls")),
+]
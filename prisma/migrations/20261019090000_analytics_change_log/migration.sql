@@ -0,0 +1,126 @@
+-- Change log of the analytics tables: one row per inserted, updated or
+-- deleted row, in commit order. See django_backend/changes.py.
+
+-- CreateTable
+CREATE TABLE "AnalyticsChange" (
+    "seq" INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+    "tableName" TEXT NOT NULL,
+    "op" TEXT NOT NULL,
+    "rowId" INTEGER NOT NULL,
+    "changedAt" DATETIME NOT NULL
+);
+
+-- CreateTable
+CREATE TABLE "AnalyticsChangeConsumer" (
+    "name" TEXT NOT NULL PRIMARY KEY,
+    "seq" INTEGER NOT NULL,
+    "updatedAt" DATETIME NOT NULL
+);
+
+-- CreateIndex
+CREATE INDEX "AnalyticsChange_tableName_seq_idx" ON "AnalyticsChange"("tableName", "seq");
+
+-- CreateTrigger
+CREATE TRIGGER "KpiSnapshot_insert_change" AFTER INSERT ON "KpiSnapshot"
+BEGIN
+    INSERT INTO "AnalyticsChange" ("tableName", "op", "rowId", "changedAt")
+    VALUES ('KpiSnapshot', 'I', NEW."id", CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER));
+END;
+
+-- CreateTrigger
+CREATE TRIGGER "KpiSnapshot_update_change" AFTER UPDATE ON "KpiSnapshot"
+BEGIN
+    INSERT INTO "AnalyticsChange" ("tableName", "op", "rowId", "changedAt")
+    VALUES ('KpiSnapshot', 'U', NEW."id", CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER));
+END;
+
+-- CreateTrigger
+CREATE TRIGGER "KpiSnapshot_delete_change" AFTER DELETE ON "KpiSnapshot"
+BEGIN
+    INSERT INTO "AnalyticsChange" ("tableName", "op", "rowId", "changedAt")
+    VALUES ('KpiSnapshot', 'D', OLD."id", CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER));
+END;
+
+-- CreateTrigger
+CREATE TRIGGER "TrafficDaily_insert_change" AFTER INSERT ON "TrafficDaily"
+BEGIN
+    INSERT INTO "AnalyticsChange" ("tableName", "op", "rowId", "changedAt")
+    VALUES ('TrafficDaily', 'I', NEW."id", CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER));
+END;
+
+-- CreateTrigger
+CREATE TRIGGER "TrafficDaily_update_change" AFTER UPDATE ON "TrafficDaily"
+BEGIN
+    INSERT INTO "AnalyticsChange" ("tableName", "op", "rowId", "changedAt")
+    VALUES ('TrafficDaily', 'U', NEW."id", CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER));
+END;
+
+-- CreateTrigger
+CREATE TRIGGER "TrafficDaily_delete_change" AFTER DELETE ON "TrafficDaily"
+BEGIN
+    INSERT INTO "AnalyticsChange" ("tableName", "op", "rowId", "changedAt")
+    VALUES ('TrafficDaily', 'D', OLD."id", CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER));
+END;
+
+-- CreateTrigger
+CREATE TRIGGER "SignupByChannel_insert_change" AFTER INSERT ON "SignupByChannel"
+BEGIN
+    INSERT INTO "AnalyticsChange" ("tableName", "op", "rowId", "changedAt")
+    VALUES ('SignupByChannel', 'I', NEW."id", CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER));
+END;
+
+-- CreateTrigger
+CREATE TRIGGER "SignupByChannel_update_change" AFTER UPDATE ON "SignupByChannel"
+BEGIN
+    INSERT INTO "AnalyticsChange" ("tableName", "op", "rowId", "changedAt")
+    VALUES ('SignupByChannel', 'U', NEW."id", CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER));
+END;
+
+-- CreateTrigger
+CREATE TRIGGER "SignupByChannel_delete_change" AFTER DELETE ON "SignupByChannel"
+BEGIN
+    INSERT INTO "AnalyticsChange" ("tableName", "op", "rowId", "changedAt")
+    VALUES ('SignupByChannel', 'D', OLD."id", CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER));
+END;
+
+-- CreateTrigger
+CREATE TRIGGER "RevenueDaily_insert_change" AFTER INSERT ON "RevenueDaily"
+BEGIN
+    INSERT INTO "AnalyticsChange" ("tableName", "op", "rowId", "changedAt")
+    VALUES ('RevenueDaily', 'I', NEW."id", CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER));
+END;
+
+-- CreateTrigger
+CREATE TRIGGER "RevenueDaily_update_change" AFTER UPDATE ON "RevenueDaily"
+BEGIN
+    INSERT INTO "AnalyticsChange" ("tableName", "op", "rowId", "changedAt")
+    VALUES ('RevenueDaily', 'U', NEW."id", CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER));
+END;
+
+-- CreateTrigger
+CREATE TRIGGER "RevenueDaily_delete_change" AFTER DELETE ON "RevenueDaily"
+BEGIN
+    INSERT INTO "AnalyticsChange" ("tableName", "op", "rowId", "changedAt")
+    VALUES ('RevenueDaily', 'D', OLD."id", CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER));
+END;
+
+-- CreateTrigger
+CREATE TRIGGER "DeviceShare_insert_change" AFTER INSERT ON "DeviceShare"
+BEGIN
+    INSERT INTO "AnalyticsChange" ("tableName", "op", "rowId", "changedAt")
+    VALUES ('DeviceShare', 'I', NEW."id", CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER));
+END;
+
+-- CreateTrigger
+CREATE TRIGGER "DeviceShare_update_change" AFTER UPDATE ON "DeviceShare"
+BEGIN
+    INSERT INTO "AnalyticsChange" ("tableName", "op", "rowId", "changedAt")
+    VALUES ('DeviceShare', 'U', NEW."id", CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER));
+END;
+
+-- CreateTrigger
+CREATE TRIGGER "DeviceShare_delete_change" AFTER DELETE ON "DeviceShare"
+BEGIN
+    INSERT INTO "AnalyticsChange" ("tableName", "op", "rowId", "changedAt")
+    VALUES ('DeviceShare', 'D', OLD."id", CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER));
+END;